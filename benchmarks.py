@@ -0,0 +1,408 @@
+import io
+import os
+import gc
+import sys
+import gzip
+import ctypes
+import ctypes.util
+import time
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+from contextlib import redirect_stdout
+import numpy as np
+from checksums import load_json, write_json_atomic
+
+# Бенчмарки горячих путей конвейера на синтетических данных: без nhmmer, MAFFT,
+# bedtools и сети. Данные детерминированы (seed), результаты пишутся в JSON,
+# --compare сравнивает с прошлым запуском.
+
+SEED = 0
+# Размеры данных по умолчанию: весь набор проходит примерно за минуту
+GENOME_SIZE = 64_000_000
+CHROMOSOMES = 4
+LINE_WIDTH = 60
+GC_FRACTION = 0.41
+HITS = 200_000
+REGIONS = 5_000
+TAXA = 1_000
+ALIGNMENT_LENGTH = 1_000
+REPEAT = 3
+# Уровень gzip синтетического генома: генерация быстрее, распаковка не медленнее
+GZIP_LEVEL = 1
+# Строк FASTA, генерируемых за раз (память генератора не зависит от размера генома)
+CHUNK_LINES = 65536
+# Участки мягкой маскировки (строчные буквы) и N-блоки генерируются блоками такой длины
+MASK_BLOCK = 1000
+RESULTS_FILE = "benchmark_results.json"
+
+
+def random_bases(rng, n, gc_fraction=GC_FRACTION):
+    """n нуклеотидов ACGT с заданной долей GC, строчными участками и редкими N-блоками."""
+    cumulative = np.cumsum([(1 - gc_fraction) / 2, gc_fraction / 2, gc_fraction / 2])
+    seq = np.frombuffer(b"ACGT", dtype=np.uint8)[np.searchsorted(cumulative, rng.random(n))]
+    blocks = -(-n // MASK_BLOCK)
+    masked = np.repeat(rng.random(blocks) < 0.3, MASK_BLOCK)[:n]
+    seq[masked] |= 0x20
+    seq[np.repeat(rng.random(blocks) < 0.005, MASK_BLOCK)[:n]] = ord("N")
+    return seq
+
+
+def wrap_lines(seq, width=LINE_WIDTH):
+    """Байты последовательности с переводом строки после каждых width символов."""
+    full = len(seq) // width
+    body = np.empty((full, width + 1), dtype=np.uint8)
+    body[:, :width] = seq[:full * width].reshape(full, width)
+    body[:, width] = ord("\n")
+    tail = seq[full * width:].tobytes()
+    return body.tobytes() + (tail + b"\n" if tail else b"")
+
+
+def make_genome(paths, size=GENOME_SIZE, seed=SEED, chromosomes=CHROMOSOMES):
+    """
+    Пишет один и тот же синтетический геном во все paths (.gz — сжатый gzip, иначе
+    обычный FASTA). Возвращает {хромосома: длина}.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = {f"chr{i + 1}": size // chromosomes + (i < size % chromosomes)
+               for i in range(chromosomes)}
+    outputs = [gzip.open(path, "wb", compresslevel=GZIP_LEVEL) if str(path).endswith(".gz")
+               else open(path, "wb") for path in paths]
+    try:
+        for name, length in lengths.items():
+            for out in outputs:
+                out.write(f">{name} synthetic chromosome\n".encode())
+            for start in range(0, length, CHUNK_LINES * LINE_WIDTH):
+                chunk = wrap_lines(random_bases(rng, min(CHUNK_LINES * LINE_WIDTH, length - start)))
+                for out in outputs:
+                    out.write(chunk)
+    finally:
+        for out in outputs:
+            out.close()
+    return lengths
+
+
+def random_intervals(rng, n, lengths, min_len=50, max_len=2000):
+    """n участков (хромосома, начало, конец, цепь) внутри хромосом, 0-based полуоткрытые."""
+    names = np.array(list(lengths))
+    chrom = rng.integers(0, len(names), n)
+    size = rng.integers(min_len, max_len, n)
+    limit = np.array([lengths[name] for name in names])[chrom] - size
+    start = (rng.random(n) * limit).astype(np.int64)
+    strand = np.where(rng.random(n) < 0.5, "+", "-")
+    return names[chrom], start, start + size, strand
+
+
+def make_tblout(path, n_hits=HITS, lengths=None, seed=SEED, queries=3):
+    """tblout nhmmer с n_hits строками; E-value от 1e-40 до 10 (логарифмически равномерно)."""
+    rng = np.random.default_rng(seed + 1)
+    lengths = lengths or {"chr1": GENOME_SIZE}
+    chrom, start, end, strand = random_intervals(rng, n_hits, lengths)
+    evalue = 10.0 ** rng.uniform(-40, 1, n_hits)
+    score = -np.log10(evalue) * 2.5 + 20
+    query = rng.integers(0, queries, n_hits)
+    hmm_len = rng.integers(100, 3000, n_hits)
+    lines = [
+        "#                                                 --- full sequence ---\n",
+        "# target name  accession  query name  accession  hmmfrom  hmm to  alifrom  ali to  envfrom  "
+        "env to  sq len strand   E-value  score  bias  description of target\n",
+        "#------------- --------- ---------- --------- ------- ------- ------- ------- ------- "
+        "------- ------- ------ --------- ------ ----- ---------------------\n",
+    ]
+    for i in range(n_hits):
+        # На цепи '-' nhmmer пишет ali_from > ali_to
+        a, b = (start[i] + 1, end[i]) if strand[i] == "+" else (end[i], start[i] + 1)
+        lines.append(f"{chrom[i]}  -  ENSG{query[i]:011d}__q{query[i]}  -  1  {hmm_len[i]}  {a}  {b}  "
+                     f"{a}  {b}  {lengths[chrom[i]]}  {strand[i]}  {evalue[i]:.2g}  {score[i]:.1f}  "
+                     f"{rng.random() * 5:.1f}  synthetic hit {i}\n")
+    lines.append("#\n# Program:         nhmmer\n# [ok]\n")
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+
+def make_bed(path, n_regions=REGIONS, lengths=None, seed=SEED):
+    """BED6 с n_regions участками; у каждого десятого start и end переставлены, как бывает у nhmmer."""
+    rng = np.random.default_rng(seed + 2)
+    lengths = lengths or {"chr1": GENOME_SIZE}
+    chrom, start, end, strand = random_intervals(rng, n_regions, lengths)
+    with open(path, "w") as f:
+        for i in range(n_regions):
+            a, b = (end[i], start[i]) if i % 10 == 9 else (start[i], end[i])
+            f.write(f"{chrom[i]}\t{a}\t{b}\thit{i}\t0\t{strand[i]}\n")
+
+
+def make_query(path, length=1500, seed=SEED):
+    rng = np.random.default_rng(seed + 3)
+    with open(path, "wb") as f:
+        f.write(b">ENSG_synthetic query sequence\n" + wrap_lines(random_bases(rng, length)))
+
+
+def make_alignment(n=TAXA, length=ALIGNMENT_LENGTH, seed=SEED):
+    """Выравнивание n x length как [(имя, последовательность)] (см. distances.random_alignment)."""
+    from distances import random_alignment
+
+    return random_alignment(n, length, seed)
+
+
+def generate(data_dir, params):
+    """
+    Создаёт синтетические входы в data_dir. Если там уже лежат данные с теми же
+    параметрами (params.json), они используются повторно.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    stamp = data_dir / "params.json"
+    files = {
+        "genome_gz": data_dir / "genome.fa.gz",
+        "genome": data_dir / "genome.fa",
+        "tblout": data_dir / "hits.tsv",
+        "bed": data_dir / "hits.bed",
+        "query": data_dir / "query.fasta",
+    }
+    data_params = {key: params[key] for key in ("seed", "genome_size", "hits", "regions")}
+    if load_json(stamp) == data_params and all(path.exists() for path in files.values()):
+        print(f"♻️  Синтетические данные из {data_dir}")
+        return files
+
+    print(f"🧪 Генерация синтетических данных в {data_dir}")
+    t = time.perf_counter()
+    lengths = make_genome([files["genome_gz"], files["genome"]], params["genome_size"], params["seed"])
+    make_tblout(files["tblout"], params["hits"], lengths, params["seed"])
+    make_bed(files["bed"], params["regions"], lengths, params["seed"])
+    make_query(files["query"], seed=params["seed"])
+    write_json_atomic(stamp, data_params)
+    print(f"✅ Данные готовы за {time.perf_counter() - t:.1f} с")
+    return files
+
+
+def bench_gc_content(files, params):
+    from gc_analysis import calculate_gc_content
+
+    return (lambda: calculate_gc_content(files["genome_gz"])), params["genome_size"]
+
+
+def bench_parse_tblout(files, params):
+    from run_nhmmer import parse_and_filter_tsv
+
+    return (lambda: parse_and_filter_tsv(files["tblout"])), os.path.getsize(files["tblout"])
+
+
+def bench_read_tblout(files, params):
+    """Только разбор tblout в столбцы, без фильтра и списка кортежей parse_and_filter_tsv."""
+    from nhmmer_hits import read_tblout
+
+    return (lambda: read_tblout(files["tblout"])), params["hits"]
+
+
+def bench_assemble_fasta(files, params):
+    """Извлечение участков по BED, объединение и очистка заголовков, как в process_gene."""
+    from fasta_index import load_fai
+    from mafft_mrbayes2 import read_bed_fixed, region_lines, file_lines, assemble_fasta
+
+    # .fai строится один раз, как и при обычном запуске по уже проиндексированному геному
+    load_fai(files["genome"])
+    out_dir = files["genome"].parent
+
+    def run():
+        sources = [region_lines(files["genome"], read_bed_fixed(files["bed"])), file_lines(files["query"])]
+        return assemble_fasta(sources, out_dir / "hits.fa", out_dir / "hits_cleaned.fa")
+
+    return run, params["regions"]
+
+
+def bench_distances(files, params):
+    """Шаг расстояний build_jvp_tree: encode выравнивания и distance_array."""
+    from distances import encode, distance_array
+
+    records = make_alignment(params["taxa"], params["length"], params["seed"])
+    return (lambda: distance_array(encode(records)[1], "identity")), params["taxa"] ** 2
+
+
+def bench_tree_to_jvp(files, params):
+    from distances import encode, distance_array
+    from neighbor_joining import nj_array
+    from tree import tree_to_jvp
+
+    names, matrix = encode(make_alignment(params["taxa"], params["length"], params["seed"]))
+    tree = nj_array(names, distance_array(matrix, "identity"), overwrite=True)
+    out = files["genome"].parent / "tree.jvp"
+    return (lambda: tree_to_jvp(tree, out)), 2 * params["taxa"] - 1
+
+
+# Имя -> (подготовка, единица объёма для пропускной способности)
+BENCHMARKS = {
+    "gc_content": (bench_gc_content, "нуклеотидов"),
+    "parse_tblout": (bench_parse_tblout, "байт tblout"),
+    "read_tblout": (bench_read_tblout, "совпадений"),
+    "assemble_fasta": (bench_assemble_fasta, "участков"),
+    "distances": (bench_distances, "пар"),
+    "tree_to_jvp": (bench_tree_to_jvp, "узлов"),
+}
+
+# Нижняя граница пропускной способности (единиц в секунду по лучшему запуску): ниже —
+# бенчмарк не прошёл. read_tblout: сотни тысяч совпадений заметно быстрее секунды
+TARGETS = {
+    "read_tblout": 300_000,
+}
+
+
+def release_free_memory():
+    """Возвращает системе свободную память кучи glibc, чтобы прирост RSS не прятался в ней."""
+    name = ctypes.util.find_library("c")
+    if name:
+        try:
+            ctypes.CDLL(name).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def current_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_memory(func):
+    """
+    Прирост пикового RSS за один запуск func в дочернем процессе (fork). Учитывает
+    и память C-библиотек (zlib, mmap) и, в отличие от tracemalloc, не замедляет код
+    с множеством мелких объектов в десятки раз. Без fork и /proc — пик tracemalloc.
+    """
+    if not hasattr(os, "fork") or not os.path.exists("/proc/self/statm"):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            gc.collect()
+            release_free_memory()
+            base = current_rss()
+            func()
+            # ru_maxrss в Linux — в килобайтах; после fork счётчик начинается с текущего RSS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            os.write(write_fd, str(max(peak - base, 0)).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    if not data:
+        raise RuntimeError("замер памяти: дочерний процесс завершился с ошибкой")
+    return int(data)
+
+
+def measure(func, repeat=REPEAT):
+    """
+    Запуск для пика памяти (см. peak_memory), затем время (wall и CPU) repeat
+    запусков; замер памяти идёт первым, пока куча не разогрета прошлыми запусками.
+    """
+    wall, cpu = [], []
+    with redirect_stdout(io.StringIO()):
+        peak = peak_memory(func)
+        for _ in range(repeat):
+            gc.collect()
+            t, c = time.perf_counter(), time.process_time()
+            func()
+            wall.append(time.perf_counter() - t)
+            cpu.append(time.process_time() - c)
+    return {"wall": wall, "cpu": cpu, "best": min(wall), "median": float(np.median(wall)),
+            "peak_bytes": peak}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(data_dir, params, names=None, repeat=REPEAT):
+    files = generate(data_dir, params)
+    results = {}
+    for name in names or BENCHMARKS:
+        setup, unit = BENCHMARKS[name]
+        func, amount = setup(files, params)
+        result = measure(func, repeat)
+        result.update(amount=amount, unit=unit, throughput=amount / result["best"])
+        results[name] = result
+        print(f"⏱  {name:<15} {result['best']:8.3f} с (медиана {result['median']:.3f}), "
+              f"пик {result['peak_bytes'] / 1e6:8.1f} МБ, {result['throughput']:,.0f} {unit}/с")
+        if name in TARGETS:
+            result.update(target=TARGETS[name], passed=result["throughput"] >= TARGETS[name])
+            if not result["passed"]:
+                print(f"❌ {name}: {result['throughput']:,.0f} {unit}/с, цель — не меньше {TARGETS[name]:,}")
+    return {
+        "meta": {"commit": git_commit(), "python": sys.version.split()[0], "numpy": np.__version__,
+                 "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": repeat},
+        "params": params,
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    """Печатает отношение лучшего времени и пика памяти к прошлому запуску."""
+    if baseline.get("params") != report["params"]:
+        print("⚠️  Параметры данных отличаются от прошлого запуска, сравнение условно")
+    print(f"\n📊 Сравнение с {baseline['meta'].get('commit')} от {baseline['meta'].get('date')}:")
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"   {name:<15} нет в прошлом запуске")
+            continue
+        speed = old["best"] / result["best"]
+        memory = result["peak_bytes"] / max(old["peak_bytes"], 1)
+        mark = "🟢" if speed >= 1.05 else "🔴" if speed <= 0.95 else "⚪"
+        print(f"   {mark} {name:<15} {old['best']:8.3f} -> {result['best']:8.3f} с (x{speed:.2f}), "
+              f"память x{memory:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих путей на синтетических данных (офлайн)")
+    parser.add_argument("names", nargs="*", metavar="бенчмарк",
+                        help=f"по умолчанию все: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--data", type=Path,
+                        help="каталог синтетических данных (сохраняется между запусками); по умолчанию временный")
+    parser.add_argument("--output", type=Path, default=Path(RESULTS_FILE))
+    parser.add_argument("--compare", type=Path, metavar="JSON", help="прошлый результат для сравнения")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--genome-size", type=int, default=GENOME_SIZE, help="нуклеотидов в геноме")
+    parser.add_argument("--hits", type=int, default=HITS, help="строк в tblout")
+    parser.add_argument("--regions", type=int, default=REGIONS, help="участков в BED")
+    parser.add_argument("--taxa", type=int, default=TAXA, help="последовательностей в выравнивании")
+    parser.add_argument("--length", type=int, default=ALIGNMENT_LENGTH, help="длина выравнивания")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"неизвестные бенчмарки: {', '.join(unknown)}")
+
+    params = {"seed": args.seed, "genome_size": args.genome_size, "hits": args.hits,
+              "regions": args.regions, "taxa": args.taxa, "length": args.length}
+    baseline = load_json(args.compare) if args.compare else None
+    if args.data:
+        report = run_benchmarks(args.data, params, args.names, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory(prefix="bio_inf_bench_") as data_dir:
+            report = run_benchmarks(data_dir, params, args.names, args.repeat)
+    write_json_atomic(args.output, report)
+    print(f"💾 Результаты: {args.output}")
+    if baseline:
+        compare(report, baseline)
+    return 1 if any(result.get("passed") is False for result in report["results"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import os
+import zlib
+import argparse
+import struct
+import bisect
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Несжатых байт в одном блоке, как в htslib (BGZF_BLOCK_SIZE)
+BLOCK_DATA_SIZE = 0xFF00
+COMPRESS_LEVEL = 6
+# Сколько блоков сжимается одной пачкой в пуле потоков (zlib отпускает GIL)
+BATCH_BLOCKS = 64
+# Распакованных блоков в кэше чтения
+CACHE_BLOCKS = 32
+
+# gzip-заголовок с дополнительным полем BC (размер блока - 1), 18 байт
+HEADER = struct.Struct("<4BI2BH2BHH")
+FOOTER = struct.Struct("<II")
+# Пустой блок, которым htslib отмечает конец файла
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def is_bgzf(path):
+    """BGZF — gzip, у первого члена которого есть поле BC."""
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+    return len(head) == HEADER.size and head[:4] == b"\x1f\x8b\x08\x04" and head[12:14] == b"BC"
+
+
+def compress_block(data, level=COMPRESS_LEVEL):
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = comp.compress(data) + comp.flush()
+    bsize = HEADER.size + len(deflated) + FOOTER.size
+    header = HEADER.pack(0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, ord("B"), ord("C"), 2, bsize - 1)
+    return header + deflated + FOOTER.pack(zlib.crc32(data), len(data))
+
+
+class BgzfWriter:
+    """
+    Пишет BGZF: несжатые данные режутся на блоки по BLOCK_DATA_SIZE, блоки сжимаются
+    пачками параллельно и пишутся по порядку. Попутно копится индекс .gzi
+    (смещение блока в сжатом файле и в несжатых данных).
+    """
+
+    def __init__(self, path, level=COMPRESS_LEVEL, threads=None):
+        self.file = open(path, "wb")
+        self.level = level
+        self.pool = ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1)
+        self.buffer = bytearray()
+        self.pending = []
+        self.offsets = []          # [(сжатое смещение, несжатое смещение)] начала блоков
+        self.raw_pos = 0
+        self.data_pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_DATA_SIZE:
+            self.pending.append(bytes(self.buffer[:BLOCK_DATA_SIZE]))
+            del self.buffer[:BLOCK_DATA_SIZE]
+            if len(self.pending) >= BATCH_BLOCKS:
+                self._flush_pending()
+
+    def _flush_pending(self):
+        levels = [self.level] * len(self.pending)
+        for data, block in zip(self.pending, self.pool.map(compress_block, self.pending, levels)):
+            self.offsets.append((self.raw_pos, self.data_pos))
+            self.file.write(block)
+            self.raw_pos += len(block)
+            self.data_pos += len(data)
+        self.pending = []
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.buffer:
+            self.pending.append(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._flush_pending()
+        self.file.write(EOF_BLOCK)
+        self.file.close()
+        self.pool.shutdown()
+
+    def write_gzi(self, gzi_path):
+        write_gzi(gzi_path, self.offsets)
+        return gzi_path
+
+
+def write_gzi(gzi_path, offsets):
+    """Формат .gzi htslib: число записей и пары uint64; первый блок (0, 0) не пишется."""
+    entries = [pair for pair in offsets if pair != (0, 0)]
+    with open(gzi_path, "wb") as f:
+        f.write(struct.pack("<Q", len(entries)))
+        for pair in entries:
+            f.write(struct.pack("<QQ", *pair))
+
+
+def iter_raw_blocks(f):
+    """Сжатые блоки BGZF по порядку: (смещение, заголовок+данные+хвост)."""
+    pos = 0
+    while True:
+        header = f.read(HEADER.size)
+        if not header:
+            return
+        if len(header) < HEADER.size or header[12:14] != b"BC":
+            raise ValueError(f"не BGZF-блок по смещению {pos}")
+        bsize = HEADER.unpack(header)[-1] + 1
+        block = header + f.read(bsize - HEADER.size)
+        yield pos, block
+        pos += bsize
+
+
+def inflate_block(block):
+    return zlib.decompress(block[HEADER.size:-FOOTER.size], -15)
+
+
+def build_gzi(path):
+    """Строит path.gzi по заголовкам и хвостам блоков, ничего не распаковывая."""
+    offsets = []
+    data_pos = 0
+    with open(path, "rb") as f:
+        for pos, block in iter_raw_blocks(f):
+            size = FOOTER.unpack(block[-FOOTER.size:])[1]
+            # Пустые блоки (в том числе маркер конца) в индекс не попадают
+            if size:
+                offsets.append((pos, data_pos))
+                data_pos += size
+    gzi_path = os.fspath(path) + ".gzi"
+    write_gzi(gzi_path, offsets)
+    return gzi_path
+
+
+def load_gzi(path):
+    """Читает path.gzi (строит, если его нет или он старше файла); (0, 0) добавляется в начало."""
+    gzi_path = os.fspath(path) + ".gzi"
+    if not os.path.exists(gzi_path) or os.path.getmtime(gzi_path) < os.path.getmtime(path):
+        build_gzi(path)
+    with open(gzi_path, "rb") as f:
+        n, = struct.unpack("<Q", f.read(8))
+        pairs = struct.unpack(f"<{2 * n}Q", f.read(16 * n))
+    return [(0, 0)] + list(zip(pairs[::2], pairs[1::2]))
+
+
+def iter_blocks(path):
+    """Распакованные блоки BGZF-файла подряд — для последовательного чтения."""
+    with open(path, "rb") as f:
+        for _, block in iter_raw_blocks(f):
+            data = inflate_block(block)
+            if data:
+                yield data
+
+
+class BgzfReader:
+    """
+    Произвольный доступ к несжатым данным BGZF по .gzi: reader[a:b] распаковывает
+    только нужные блоки; недавние блоки держатся в небольшом кэше.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        offsets = load_gzi(path)
+        self.raw_offsets = [raw for raw, _ in offsets]
+        self.data_offsets = [data for _, data in offsets]
+        self.cache = OrderedDict()
+
+    def close(self):
+        self.file.close()
+
+    def _block(self, i):
+        data = self.cache.get(i)
+        if data is not None:
+            self.cache.move_to_end(i)
+            return data
+        self.file.seek(self.raw_offsets[i])
+        header = self.file.read(HEADER.size)
+        bsize = HEADER.unpack(header)[-1] + 1
+        data = inflate_block(header + self.file.read(bsize - HEADER.size))
+        self.cache[i] = data
+        if len(self.cache) > CACHE_BLOCKS:
+            self.cache.popitem(last=False)
+        return data
+
+    def read(self, start, end):
+        """Несжатые байты [start, end)."""
+        parts = []
+        i = bisect.bisect_right(self.data_offsets, start) - 1
+        pos = start
+        while pos < end and i < len(self.data_offsets):
+            data = self._block(i)
+            block_start = self.data_offsets[i]
+            parts.append(data[pos - block_start:end - block_start])
+            pos = block_start + len(data)
+            i += 1
+        return b"".join(parts)
+
+    def __getitem__(self, key):
+        return self.read(key.start, key.stop)
+
+
+def convert(src, dst, threads=None):
+    """
+    Перепаковывает FASTA (обычный или .gz) в BGZF и строит рядом .gzi и .fai.
+    Возвращает путь к dst.
+    """
+    # fasta_index импортирует bgzf, поэтому оба импорта — здесь, а не в начале модуля
+    from fasta_index import FaiBuilder
+    from gc_analysis import inflate
+
+    with open(src, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    fai = FaiBuilder()
+    tmp = f"{dst}.part"
+    with open(src, "rb") as f, BgzfWriter(tmp, threads=threads) as out:
+        chunks = iter(lambda: f.read(1024 * 1024), b"")
+        for block in inflate(chunks) if gzipped else chunks:
+            out.write(block)
+            fai.feed(block)
+    os.replace(tmp, dst)
+    out.write_gzi(f"{dst}.gzi")
+    fai.finish()
+    fai.write(f"{dst}.fai")
+    return dst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перепаковка FASTA в BGZF с индексами .fai и .gzi")
+    parser.add_argument("src", help="FASTA или FASTA.gz")
+    parser.add_argument("dst", help="выходной BGZF (.fa.gz)")
+    parser.add_argument("--threads", type=int, help="потоков сжатия")
+    args = parser.parse_args()
+
+    print(f"🗜  {args.src} -> {args.dst}")
+    convert(args.src, args.dst, args.threads)
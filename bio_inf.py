@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+
+import tracing
+from config import CONFIG_ENV
+
+# Подкоманда -> (модуль, функция разбора аргументов, описание).
+# Модуль импортируется только при запуске своей подкоманды
+COMMANDS = {
+    "download": ("download_genomes", "main", "загрузка геномов Ensembl"),
+    "sequences": ("get_sequence", "main", "последовательности генов из Ensembl REST"),
+    "gc": ("gc_analysis", "cli", "GC-состав геномов"),
+    "search": ("run_nhmmer", "cli", "nhmmer по геномам для всех генов"),
+    "align": ("mafft_mrbayes2", "cli", "извлечение совпадений, MAFFT и MrBayes"),
+    "tree": ("tree", "cli", "NJ-дерево в .jvp и Newick, bootstrap"),
+    "remote": ("connect_servers", "cli", "команды на сервере через цепочку SSH"),
+    "jobs": ("remote_jobs", "main", "выгрузка входов и задачи на вычислительном узле"),
+    "bench": ("benchmarks", "main", "бенчмарки горячих путей на синтетических данных"),
+}
+# Предел времени запуска для --help и справки подкоманд, секунды
+STARTUP_LIMIT = 0.5
+# Сколько раз запускать каждую проверку; берётся лучшее время (меньше шума от диска и кэша)
+STARTUP_REPEAT = 3
+
+
+def run_command(name, argv):
+    module_name, function, _ = COMMANDS[name]
+    module = importlib.import_module(module_name)
+    # argparse подкоманды берёт имя программы из sys.argv[0]: в справке будет "bio_inf.py tree"
+    sys.argv[0] = f"bio_inf.py {name}"
+    with tracing.span(name, argv=argv):
+        result = getattr(module, function)(argv)
+    return result if isinstance(result, int) else 0
+
+
+def startup_times(repeat=STARTUP_REPEAT):
+    """Время запуска `bio_inf.py --help` и `bio_inf.py <команда> --help` отдельными процессами."""
+    checks = [["--help"]] + [[name, "--help"] for name in COMMANDS]
+    times = {}
+    for argv in checks:
+        best = None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            subprocess.run([sys.executable, os.path.abspath(__file__), *argv],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - t
+            best = elapsed if best is None else min(best, elapsed)
+        times[" ".join(argv)] = best
+    return times
+
+
+def check_startup(limit=STARTUP_LIMIT, repeat=STARTUP_REPEAT):
+    """Печатает время запуска и возвращает 1, если что-то дольше limit секунд."""
+    slow = []
+    for argv, elapsed in startup_times(repeat).items():
+        mark = "✅" if elapsed <= limit else "❌"
+        print(f"{mark} {elapsed * 1000:7.1f} мс  bio_inf.py {argv}")
+        if elapsed > limit:
+            slow.append(argv)
+    if slow:
+        print(f"⚠️  Дольше {limit} с: {', '.join(slow)} (подробности: python -X importtime bio_inf.py ...)")
+        return 1
+    print(f"🏁 Всё укладывается в {limit} с")
+    return 0
+
+
+def main(argv=None):
+    commands = "\n".join(f"  {name:<10} {description}" for name, (_, _, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="Конвейер поиска ортологов: загрузка, GC, nhmmer, выравнивания, деревья",
+        epilog=f"команды:\n{commands}\n  {'startup':<10} проверить время запуска\n\n"
+               "справка по команде: bio_inf.py <команда> --help",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help=f"файл настроек TOML (по умолчанию ${CONFIG_ENV} или bio_inf.toml)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help=f"отчёт JSON о времени, CPU, памяти и вводе-выводе этапов и программ (или ${tracing.TRACE_ENV})")
+    parser.add_argument("--profile", metavar="DIR", help="cProfile этапов в DIR/*.prof (вместе с --trace)")
+    parser.add_argument("command", choices=[*COMMANDS, "startup"], metavar="команда")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.config:
+        # Через окружение настройки видят и процессы пулов, и load_config() в модулях
+        os.environ[CONFIG_ENV] = os.path.abspath(args.config)
+    if args.trace:
+        tracing.enable(args.trace, args.profile)
+    elif args.profile:
+        parser.error("--profile работает только вместе с --trace")
+
+    if args.command == "startup":
+        startup = argparse.ArgumentParser(prog="bio_inf.py startup",
+                                          description="Время запуска --help и справки подкоманд")
+        startup.add_argument("--limit", type=float, default=STARTUP_LIMIT, help="предел, секунды")
+        startup.add_argument("--repeat", type=int, default=STARTUP_REPEAT)
+        options = startup.parse_args(args.args)
+        return check_startup(options.limit, options.repeat)
+    return run_command(args.command, args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from distances import MODELS, encode, distance_array
+from neighbor_joining import nj_array
+from tree_io import walk, EXIT
+
+REPLICATES = 100
+SEED = 1
+WORKERS = os.cpu_count() or 1
+# Доля реплик, которую должно превысить расщепление, чтобы попасть в консенсус.
+# При 0.5 и выше отобранные расщепления всегда совместимы между собой
+MAJORITY = 0.5
+# Реплик на одну задачу пула
+CHUNK = 4
+
+# Выравнивание в процессе пула: передаётся один раз через initializer
+_shared = {}
+
+
+def resample_columns(length, seed, replicate):
+    """Индексы столбцов реплики: свой генератор на (seed, номер реплики), результат не зависит от пула."""
+    rng = np.random.default_rng([seed, replicate])
+    return rng.integers(0, length, length)
+
+
+def tree_splits(tree, index):
+    """
+    Расщепления дерева как битовые маски по номерам листьев в index: {маска: длина ветви}.
+    Маска приводится к стороне без листа 0, тривиальные (лист или всё, кроме листа)
+    не попадают; длины ветвей листьев — отдельно, {номер листа: длина}.
+    """
+    n = len(index)
+    full = (1 << n) - 1
+    masks = {}
+    splits = {}
+    tips = {}
+    for event, clade in walk(tree.root):
+        if event != EXIT:
+            continue
+        if clade.clades:
+            mask = 0
+            for child in clade.clades:
+                mask |= masks.pop(id(child))
+        else:
+            mask = 1 << index[clade.name]
+            tips[index[clade.name]] = clade.branch_length or 0.0
+        masks[id(clade)] = mask
+        if mask & 1:
+            mask ^= full
+        if 1 < bin(mask).count("1") < n - 1:
+            splits[mask] = splits.get(mask, 0.0) + (clade.branch_length or 0.0)
+    return splits, tips
+
+
+def _init_worker(names, matrix, model, seed):
+    _shared.update(names=names, matrix=matrix, model=model, seed=seed,
+                   index={name: i for i, name in enumerate(names)})
+
+
+def _replicate(replicate):
+    names, matrix = _shared["names"], _shared["matrix"]
+    columns = resample_columns(matrix.shape[1], _shared["seed"], replicate)
+    # Процессов уже столько, сколько ядер: внутри реплики считаем в один поток
+    dist = distance_array(matrix[:, columns], _shared["model"], workers=1)
+    # Совпадение с Biopython при равных Q репликам не нужно: точный хвост NJ не считаем
+    tree = nj_array(names, dist, exact_limit=0, overwrite=True)
+    return tree_splits(tree, _shared["index"])
+
+
+def run_replicates(names, matrix, replicates=REPLICATES, model="identity", seed=SEED, workers=WORKERS):
+    """
+    Строит replicates NJ-деревьев по выравниваниям с пересэмплированными столбцами.
+    Возвращает ({маска: [число реплик, сумма длин]}, суммы длин листьев, число реплик).
+    """
+    counts = {}
+    tip_lengths = np.zeros(len(names))
+    args = (names, matrix, model, seed)
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=args)
+        results = pool.map(_replicate, range(replicates), chunksize=CHUNK)
+    else:
+        pool = None
+        _init_worker(*args)
+        results = map(_replicate, range(replicates))
+    try:
+        for done, (splits, tips) in enumerate(results, 1):
+            for mask, length in splits.items():
+                entry = counts.setdefault(mask, [0, 0.0])
+                entry[0] += 1
+                entry[1] += length
+            for i, length in tips.items():
+                tip_lengths[i] += length
+            if done % 100 == 0:
+                print(f"  🔁 реплик: {done}/{replicates}")
+    finally:
+        if pool:
+            pool.shutdown()
+    return counts, tip_lengths, replicates
+
+
+def majority_consensus(names, counts, tip_lengths, replicates, majority=MAJORITY):
+    """
+    Консенсус по правилу большинства: расщепления, встреченные более чем в majority
+    доле реплик. confidence — поддержка в процентах, как у Bio.Phylo.Consensus;
+    длина ветви — средняя по репликам, где расщепление встретилось.
+    Корень — узел, к которому примыкает первый лист.
+    """
+    from Bio.Phylo.BaseTree import Clade, Tree
+
+    n = len(names)
+    tips = [Clade(tip_lengths[i] / replicates, name) for i, name in enumerate(names)]
+    root = Clade()
+    chosen = [(mask, count, total) for mask, (count, total) in counts.items()
+              if count > majority * replicates]
+    # От крупных к мелким: ближайший уже добавленный надузел листа — родитель расщепления
+    chosen.sort(key=lambda item: (-bin(item[0]).count("1"), -item[1]))
+    owner = [root] * n
+    for mask, count, total in chosen:
+        clade = Clade(total / count)
+        clade.confidence = 100.0 * count / replicates
+        members = [i for i in range(n) if mask >> i & 1]
+        owner[members[0]].clades.append(clade)
+        for i in members:
+            owner[i] = clade
+    for i, tip in enumerate(tips):
+        owner[i].clades.append(tip)
+    return Tree(root, rooted=False)
+
+
+def bootstrap_consensus(alignment, replicates=REPLICATES, model="identity", seed=SEED,
+                        workers=WORKERS, majority=MAJORITY):
+    """Выравнивание (MultipleSeqAlignment или [(имя, последовательность)]) -> консенсусное дерево с поддержками."""
+    names, matrix = encode(alignment)
+    if len(set(names)) != len(names):
+        raise ValueError("имена последовательностей в выравнивании повторяются")
+    t = time.perf_counter()
+    counts, tip_lengths, replicates = run_replicates(names, matrix, replicates, model, seed, workers)
+    print(f"✅ Bootstrap: {replicates} реплик, {len(names)} таксонов за {time.perf_counter() - t:.1f} с")
+    return majority_consensus(names, counts, tip_lengths, replicates, majority)
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from Bio import AlignIO
+    from tree_io import write_jvp, write_newick
+
+    parser = argparse.ArgumentParser(description="Bootstrap-поддержка NJ-деревьев по выравниванию")
+    parser.add_argument("alignment", type=Path, help="выравнивание FASTA")
+    parser.add_argument("--replicates", type=int, default=REPLICATES)
+    parser.add_argument("--model", choices=MODELS, default="identity")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--majority", type=float, default=MAJORITY,
+                        help="доля реплик для включения расщепления в консенсус")
+    parser.add_argument("--compact", action="store_true", help=".jvp одной строкой без отступов")
+    args = parser.parse_args()
+
+    tree = bootstrap_consensus(AlignIO.read(args.alignment, "fasta"), args.replicates, args.model,
+                               args.seed, args.workers, args.majority)
+    stem = args.alignment.with_suffix("")
+    write_jvp(tree, f"{stem}.consensus.jvp", args.compact)
+    write_newick(tree, f"{stem}.consensus.nwk")
+    print(f"📁 Консенсус: {stem}.consensus.jvp, {stem}.consensus.nwk")
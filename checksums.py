@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+
+HASH_BLOCK = 4 * 1024 * 1024
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stamp(path):
+    """Размер и время изменения файла — быстрая проверка без чтения содержимого."""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def is_unchanged(entry, path):
+    """
+    Проверяет, что файл совпадает с записью кэша {size, mtime_ns, sha256}.
+    Если совпали размер и mtime, файл не читается. Если изменился только mtime,
+    сравнивается хэш, и при совпадении запись обновляется. Запись без sha256
+    (только file_stamp) при другом mtime считается устаревшей.
+    """
+    if not entry or not os.path.exists(path):
+        return False
+    stamp = file_stamp(path)
+    if stamp["size"] != entry.get("size"):
+        return False
+    if stamp["mtime_ns"] == entry.get("mtime_ns"):
+        return True
+    if "sha256" not in entry or file_sha256(path) != entry["sha256"]:
+        return False
+    entry.update(stamp)
+    return True
+
+def fingerprint(path):
+    return dict(file_stamp(path), sha256=file_sha256(path))
+
+def load_json(path, default=None):
+    if not os.path.exists(path):
+        return {} if default is None else default
+    with open(path) as f:
+        return json.load(f)
+
+def write_json_atomic(path, data):
+    """Пишет JSON во временный файл и переименовывает, чтобы не оставить полузаписанный файл."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+@contextmanager
+def atomic_output(path):
+    """
+    Отдаёт временный путь рядом с path и по успешному выходу переименовывает его в path.
+    При ошибке временный файл удаляется, так что path либо старый, либо целиком новый.
+    """
+    tmp = type(path)(f"{path}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
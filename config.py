@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+
+# Путь к файлу настроек можно задать переменной окружения (bio_inf.py --config ставит её сам)
+CONFIG_ENV = "BIO_INF_CONFIG"
+CONFIG_NAME = "bio_inf.toml"
+# Локальные настройки рядом с bio_inf.toml, не в git: project_dir, пароли SSH и т.п.
+LOCAL_NAME = "bio_inf.local.toml"
+
+# Значения, если ключа нет в файле. Относительные пути считаются от project_dir
+DEFAULTS = {
+    "project_dir": ".",
+    "query_dir": "query_sequences",
+    "genomes_dir": "genomes/processed1",
+    "align_dir": "final_outputs_flexible",
+    # ген -> каталог результатов nhmmer
+    "genes": {},
+    # гены для выравниваний (пусто — все из genes)
+    "align_genes": [],
+    # виды, по геномам которых собираются выравнивания
+    "genomes": [],
+    # виды для загрузки из Ensembl
+    "species": [],
+    "remote": {"hops": [], "commands": []},
+}
+PATH_KEYS = ("query_dir", "genomes_dir", "align_dir")
+
+
+def find_config(path=None):
+    """Явный путь, затем $BIO_INF_CONFIG, затем bio_inf.toml в текущем каталоге и рядом со скриптами."""
+    candidates = [path, os.environ.get(CONFIG_ENV), CONFIG_NAME, Path(__file__).with_name(CONFIG_NAME)]
+    for candidate in candidates:
+        if candidate and Path(candidate).is_file():
+            return Path(candidate)
+    if path or os.environ.get(CONFIG_ENV):
+        raise FileNotFoundError(f"файл настроек не найден: {path or os.environ[CONFIG_ENV]}")
+    return None
+
+
+def merge(base, override):
+    """Вложенные таблицы сливаются по ключам, остальное (и списки) заменяется целиком."""
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_config(path=None):
+    """
+    Настройки проекта: DEFAULTS, поверх них — значения из TOML, затем из
+    bio_inf.local.toml рядом с ним. project_dir и пути из PATH_KEYS возвращаются
+    как Path, каталоги генов — как {ген: Path}.
+    """
+    config = {key: value.copy() if isinstance(value, (dict, list)) else value
+              for key, value in DEFAULTS.items()}
+    config_path = find_config(path)
+    if config_path is not None:
+        import tomllib
+
+        for toml_path in (config_path, config_path.with_name(LOCAL_NAME)):
+            if toml_path.is_file():
+                with open(toml_path, "rb") as f:
+                    merge(config, tomllib.load(f))
+
+    project_dir = Path(config["project_dir"]).expanduser()
+    config["project_dir"] = project_dir
+    for key in PATH_KEYS:
+        config[key] = project_dir / Path(config[key]).expanduser()
+    config["genes"] = {gene: project_dir / folder for gene, folder in config["genes"].items()}
+    return config
@@ -1,85 +1,429 @@
-import paramiko
-from paramiko import SSHClient, AutoAddPolicy
+import os
 import time
+import atexit
+import select
+import asyncio
+import inspect
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from config import load_config
+
+# Интервал keepalive-пакетов на каждом переходе, секунды (обрыв замечается без команд)
+KEEPALIVE = 30
+# Одновременных каналов на последнем хосте; OpenSSH по умолчанию разрешает MaxSessions=10
+CHANNELS = 8
+# Сколько раз переподключать цепочку, если канал для команды не открылся
+RECONNECT_ATTEMPTS = 2
+# Таймаут TCP-подключения, баннера и аутентификации на одном переходе, секунды
+CONNECT_TIMEOUT = 15
+# Размер одного чтения из канала
+READ_SIZE = 32768
+# Сколько кусков по READ_SIZE на поток держит очередь, пока приёмник не успевает. Дальше
+# чтение из канала останавливается, окно SSH заполняется и сервер перестаёт слать вывод
+QUEUE_CHUNKS = 16
+# Как часто перепроверять канал, пока от сервера нет ни данных, ни EOF, секунды
+EXIT_POLL = 1
+
+# Открытые цепочки процесса: (хост, порт, пользователь) всех переходов и сжатие -> SSHTunnel
+_pool = {}
+_pool_lock = threading.Lock()
 
 
 class SSHTunnel:
-    def __init__(self):
+    def __init__(self, keepalive=KEEPALIVE):
         self.clients = []
+        # Параметры подключений: по ним восстанавливается оборванная часть цепочки
+        self.hops = []
+        self.keepalive = keepalive
+        # Номер переподключения: потоки узнают, что цепочку уже восстановили без них
+        self.generation = 0
+        self._lock = threading.RLock()
+
+    def connect(self, host, port, username, password, compress=False):
+        with self._lock:
+            client = self._open(host, port, username, password, compress)
+            self.hops.append((host, port, username, password, compress))
+            return client
+
+    def _open(self, host, port, username, password, compress=False):
+        # paramiko грузится только при подключении, а не при импорте модуля
+        from paramiko import SSHClient, AutoAddPolicy
 
-    def connect(self, host, port, username, password):
         client = SSHClient()
         client.set_missing_host_key_policy(AutoAddPolicy())
 
+        sock = None
         if self.clients:
             # Используем последнее соединение как транспорт
             transport = self.clients[-1].get_transport()
             dest_addr = (host, port)
             local_addr = ('localhost', 22)
-            channel = transport.open_channel("direct-tcpip", dest_addr, local_addr)
-            client.connect(hostname=host, port=port, username=username,
-                           password=password, sock=channel)
-        else:
-            # Первое соединение
-            client.connect(host, port=port, username=username, password=password)
+            sock = transport.open_channel("direct-tcpip", dest_addr, local_addr,
+                                          timeout=CONNECT_TIMEOUT)
+        # Без sock — первое соединение
+        client.connect(host, port=port, username=username, password=password, sock=sock,
+                       timeout=CONNECT_TIMEOUT, banner_timeout=CONNECT_TIMEOUT,
+                       auth_timeout=CONNECT_TIMEOUT, compress=compress)
+        client.get_transport().set_keepalive(self.keepalive)
 
         self.clients.append(client)
         print(f"✓ Подключено к {username}@{host}:{port}")
-        time.sleep(1)  # Пауза между подключениями
         return client
 
-    def execute(self, commands):
-        if not self.clients:
+    def broken_hop(self):
+        """Номер первого перехода с оборванным транспортом или None, если цепочка цела."""
+        for i, client in enumerate(self.clients):
+            transport = client.get_transport()
+            if transport is None or not transport.is_active():
+                return i
+        return len(self.clients) if len(self.clients) < len(self.hops) else None
+
+    def reconnect(self, since=None):
+        """
+        Переподключает цепочку начиная с первого оборванного перехода: всё, что за ним,
+        шло через его транспорт. Целые переходы до него не трогаются.
+
+        since — поколение цепочки, на котором канал не открылся. Если транспорты при
+        этом числятся живыми (полуоткрытое соединение), переподключение начинается с
+        последнего перехода и при неудаче отступает к предыдущим. Если другой поток
+        уже переподключил цепочку после since, повторно ничего не делается.
+        """
+        from paramiko import SSHException
+
+        with self._lock:
+            if since is not None and since != self.generation:
+                return True
+            start = self.broken_hop()
+            if start is None:
+                if since is None:
+                    return False
+                start = len(self.hops) - 1
+            while True:
+                host, port, username = self.hops[start][:3]
+                print(f"🔄 Обрыв на {username}@{host}:{port}, переподключение")
+                for client in reversed(self.clients[start:]):
+                    client.close()
+                del self.clients[start:]
+                try:
+                    for hop in self.hops[start:]:
+                        self._open(*hop)
+                except (SSHException, EOFError, OSError):
+                    if start == 0:
+                        raise
+                    start -= 1
+                    continue
+                self.generation += 1
+                return True
+
+    def _session(self):
+        with self._lock:
+            if not self.hops:
+                raise Exception("Нет активных подключений")
+            if self.broken_hop() is not None:
+                self.reconnect()
+            transport = self.clients[-1].get_transport()
+        return transport.open_session(timeout=CONNECT_TIMEOUT)
+
+    def _channel(self):
+        """
+        Новый канал на последнем хосте. Если он не открылся из-за обрыва, цепочка
+        переподключается и попытка повторяется.
+        """
+        from paramiko import SSHException
+
+        for attempt in range(RECONNECT_ATTEMPTS + 1):
+            generation = self.generation
+            try:
+                return self._session()
+            except (SSHException, EOFError, OSError):
+                if attempt == RECONNECT_ATTEMPTS:
+                    raise
+                self.reconnect(since=generation)
+
+    def run(self, cmd):
+        """
+        Выполняет одну команду в отдельном канале поверх транспорта последнего хоста.
+        Уже запущенная команда при обрыве не перезапускается.
+        """
+        channel = self._channel()
+        try:
+            channel.exec_command(cmd)
+            output, error = read_channel(channel)
+            status = channel.recv_exit_status()
+        finally:
+            channel.close()
+        return {
+            'command': cmd,
+            'output': output.decode(errors="replace").strip(),
+            'error': error.decode(errors="replace").strip(),
+            'status': status
+        }
+
+    def open_sftp(self):
+        """SFTP-сессия на последнем хосте отдельным каналом того же транспорта."""
+        from paramiko import SFTPClient
+
+        channel = self._channel()
+        channel.invoke_subsystem("sftp")
+        return SFTPClient(channel)
+
+    def execute(self, commands, channels=CHANNELS):
+        """Выполняет команды одновременно, до channels каналов; результаты — в порядке commands."""
+        if not self.hops:
             raise Exception("Нет активных подключений")
 
-        results = []
-        for cmd in commands:
-            stdin, stdout, stderr = self.clients[-1].exec_command(cmd)
-            output = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-
-            results.append({
-                'command': cmd,
-                'output': output,
-                'error': error
-            })
-            print(f"\nCommand: {cmd}")
-            print(f"Output:\n{output}")
-            if error:
-                print(f"Errors:\n{error}")
+        commands = list(commands)
+        with ThreadPoolExecutor(max_workers=max(1, min(channels, len(commands)))) as pool:
+            results = list(pool.map(self.run, commands))
+
+        for res in results:
+            print(f"\nCommand: {res['command']}")
+            print(f"Output:\n{res['output']}")
+            if res['error']:
+                print(f"Errors:\n{res['error']}")
 
         return results
 
     def close(self):
-        for client in reversed(self.clients):
-            client.close()
+        with self._lock:
+            for client in reversed(self.clients):
+                client.close()
+            self.clients.clear()
         print("Все соединения закрыты")
 
 
-# Конфигурация
-JUMP_CHAIN = [
-    ("37.252.1.93", 2003, "makashov", "UuhiWCd.fo-1sB{&+R]YA%)TwX^8~3"),
-    ("127.0.0.1", 2217, "science2", "DL]M]0_HloCAJayh)oMpI$KQaXtl}w"),
-    ("192.168.1.4", 22, "student1", "Jeb3vLu$^L8to=Dr{9YOxlIl'nw,XD")
-]
+def read_channel(channel):
+    """
+    Читает stdout и stderr канала по мере поступления до EOF: последовательный
+    stdout.read() + stderr.read() зависает, если команда заполнит окно канала
+    выводом в stderr. Код возврата может прийти раньше последних данных, поэтому
+    конец вывода — только EOF (или закрытие) канала.
+    """
+    output, error = bytearray(), bytearray()
+    while True:
+        # fileno() канала срабатывает при данных в любом из потоков и при закрытии
+        select.select([channel], [], [], EXIT_POLL)
+        # EOF приходит после всех данных: если он уже был, дальше вычитываются только буферы
+        eof = channel.eof_received or channel.closed
+        while channel.recv_ready():
+            output += channel.recv(READ_SIZE)
+        while channel.recv_stderr_ready():
+            error += channel.recv_stderr(READ_SIZE)
+        if eof and not channel.recv_ready() and not channel.recv_stderr_ready():
+            return bytes(output), bytes(error)
+
+
+class LineSink:
+    """Приёмник для AsyncExecutor: callback(строка) на каждую полную строку (bytes без \\n)."""
 
-COMMANDS = [
-    "echo 'Тестовое подключение выполнено успешно'",
-    "uname -a",
-    "cat /etc/os-release",
-    "df -h | head -n 5"
-]
+    def __init__(self, callback):
+        self.callback = callback
+        self.tail = b""
+
+    def __call__(self, chunk):
+        lines = (self.tail + chunk).split(b"\n")
+        self.tail = lines.pop()
+        for line in lines:
+            self.callback(line)
+
+    def close(self):
+        if self.tail:
+            self.callback(self.tail)
+            self.tail = b""
 
 
-def main():
-    tunnel = SSHTunnel()
+def open_sink(target):
+    """
+    (write, close) для приёмника вывода: None — отбросить, путь — файл (wb),
+    объект с write — писать в него (закрывает владелец), callable — вызывать на
+    каждый кусок; write может вернуть awaitable, его дождутся.
+    """
+    if target is None:
+        return (lambda chunk: None), (lambda: None)
+    if isinstance(target, (str, os.PathLike)):
+        f = open(target, "wb")
+        return f.write, f.close
+    if hasattr(target, "write"):
+        return target.write, (lambda: None)
+    return target, getattr(target, "close", lambda: None)
+
+
+async def wait_readable(channel, timeout):
+    """Ждёт данных в канале (или его закрытия) не дольше timeout секунд."""
+    loop = asyncio.get_running_loop()
+    fd = channel.fileno()
+    ready = loop.create_future()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
     try:
-        # Последовательное подключение через все хосты
-        for host, port, user, pwd in JUMP_CHAIN:
-            tunnel.connect(host, port, user, pwd)
+        await asyncio.wait([ready], timeout=timeout)
+    finally:
+        loop.remove_reader(fd)
+
+
+async def pump_channel(channel, out_queue, err_queue):
+    """
+    Перекладывает stdout и stderr канала в очереди по мере поступления, поочерёдно,
+    чтобы ни один поток не забил окно канала. Полная очередь останавливает чтение.
+    Читает до EOF канала: код возврата может прийти раньше последних данных.
+    В конце кладёт None в обе очереди.
+    """
+    while True:
+        # EOF приходит после всех данных: если он уже был, дальше вычитываются только буферы
+        eof = channel.eof_received or channel.closed
+        got = False
+        if channel.recv_ready():
+            await out_queue.put(channel.recv(READ_SIZE))
+            got = True
+        if channel.recv_stderr_ready():
+            await err_queue.put(channel.recv_stderr(READ_SIZE))
+            got = True
+        if got:
+            continue
+        if eof:
+            break
+        await wait_readable(channel, EXIT_POLL)
+    await out_queue.put(None)
+    await err_queue.put(None)
+
+
+async def drain_queue(queue, target):
+    """Отдаёт куски из очереди приёмнику (см. open_sink); возвращает число байт."""
+    write, close = open_sink(target)
+    size = 0
+    try:
+        while (chunk := await queue.get()) is not None:
+            size += len(chunk)
+            result = write(chunk)
+            if inspect.isawaitable(result):
+                await result
+    finally:
+        close()
+    return size
+
+
+class AsyncExecutor:
+    """
+    Команды на последнем хосте цепочки под asyncio: stdout и stderr читаются
+    одновременно и уходят в приёмники (файл, объект с write, callable, LineSink)
+    через очереди по QUEUE_CHUNKS кусков, так что память не растёт с объёмом вывода.
+    Не больше channels команд одновременно.
+    """
+
+    def __init__(self, tunnel, channels=CHANNELS):
+        self.tunnel = tunnel
+        self._slots = asyncio.Semaphore(channels)
+
+    async def run(self, cmd, stdout=None, stderr=None, timeout=None):
+        """
+        Выполняет cmd, пока не завершится, не выйдет timeout секунд (TimeoutError)
+        или задачу не отменят (CancelledError); в обоих случаях канал закрывается.
+        Возвращает код возврата (-1, если сервер его не прислал) и объём вывода.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            start = time.perf_counter()
+            # Открытие канала и exec — сетевые round trip'ы paramiko, они блокирующие
+            channel = await loop.run_in_executor(None, self.tunnel._channel)
+            try:
+                async with asyncio.timeout(timeout):
+                    await loop.run_in_executor(None, channel.exec_command, cmd)
+                    out_queue, err_queue = asyncio.Queue(QUEUE_CHUNKS), asyncio.Queue(QUEUE_CHUNKS)
+                    async with asyncio.TaskGroup() as tasks:
+                        tasks.create_task(pump_channel(channel, out_queue, err_queue))
+                        out_size = tasks.create_task(drain_queue(out_queue, stdout))
+                        err_size = tasks.create_task(drain_queue(err_queue, stderr))
+                    status = channel.recv_exit_status()
+            finally:
+                # Без pty сервер не шлёт команде сигнал: она получит SIGPIPE при следующей записи
+                channel.close()
+        return {
+            'command': cmd,
+            'status': status,
+            'stdout_bytes': out_size.result(),
+            'stderr_bytes': err_size.result(),
+            'elapsed': time.perf_counter() - start
+        }
+
+    async def run_all(self, commands, output_dir, timeout=None):
+        """
+        Выполняет команды одновременно, вывод i-й — в <output_dir>/<i>.out и <i>.err.
+        Команда, не уложившаяся в timeout, получает status None; остальные не страдают.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        async def one(i, cmd):
+            try:
+                res = await self.run(cmd, output_dir / f"{i}.out", output_dir / f"{i}.err", timeout)
+            except TimeoutError:
+                res = {'command': cmd, 'status': None, 'error': f"нет ответа за {timeout} с"}
+            mark = "✅" if res['status'] == 0 else "❌"
+            print(f"{mark} [{i}] {cmd}: код {res['status']}{'' if 'error' not in res else ', ' + res['error']}")
+            return res
+
+        return await asyncio.gather(*(one(i, cmd) for i, cmd in enumerate(commands, start=1)))
+
+
+def hop_password(hop):
+    """Пароль перехода: password, иначе переменная окружения из password_env; None — ключи и ssh-agent."""
+    if hop.get("password") is not None:
+        return hop["password"]
+    return os.environ.get(hop["password_env"]) if hop.get("password_env") else None
+
+
+def get_tunnel(hops, keepalive=KEEPALIVE, compress=False):
+    """
+    Цепочка из пула процесса: повторные вызовы с теми же переходами получают уже
+    открытые соединения (оборванные переходы переподключаются).
+    compress включает zlib на последнем переходе: промежуточные несут уже
+    зашифрованный поток, сжимать его там бесполезно.
+    """
+    key = tuple((hop["host"], hop.get("port", 22), hop["user"]) for hop in hops) + (compress,)
+    with _pool_lock:
+        tunnel = _pool.get(key)
+        if tunnel is not None:
+            tunnel.reconnect()
+            return tunnel
+        tunnel = SSHTunnel(keepalive)
+        try:
+            # Последовательное подключение через все хосты
+            for i, hop in enumerate(hops):
+                tunnel.connect(hop["host"], hop.get("port", 22), hop["user"], hop_password(hop),
+                               compress and i == len(hops) - 1)
+        except Exception:
+            tunnel.close()
+            raise
+        _pool[key] = tunnel
+        return tunnel
+
+
+def close_pool():
+    with _pool_lock:
+        for tunnel in _pool.values():
+            tunnel.close()
+        _pool.clear()
+
+
+atexit.register(close_pool)
+
+
+def main(commands=None, config=None, channels=CHANNELS, output_dir=None, timeout=None):
+    """
+    Выполняет команды на последнем хосте цепочки [remote] hops из bio_inf.toml.
+    С output_dir вывод потоково пишется в файлы команд (см. AsyncExecutor.run_all).
+    """
+    remote = (config or load_config())["remote"]
+    try:
+        tunnel = get_tunnel(remote["hops"])
+
+        if output_dir is not None:
+            executor = AsyncExecutor(tunnel, channels)
+            return asyncio.run(executor.run_all(commands or remote["commands"], output_dir, timeout))
 
         # Выполнение команд на конечном сервере
-        results = tunnel.execute(COMMANDS)
+        results = tunnel.execute(commands or remote["commands"], channels)
 
         # Дополнительные действия с результатами
         with open('remote_results.txt', 'w') as f:
@@ -88,12 +432,23 @@ def main():
                 f.write(res['output'] + "\n\n")
 
         print("\nРезультаты сохранены в remote_results.txt")
+        return results
 
     except Exception as e:
         print(f"Ошибка: {str(e)}")
-    finally:
-        tunnel.close()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Команды на сервере через цепочку SSH-переходов из bio_inf.toml")
+    parser.add_argument("commands", nargs="*", help="команды (по умолчанию [remote] commands)")
+    parser.add_argument("--channels", type=int, default=CHANNELS,
+                        help=f"одновременных команд (каналов SSH), по умолчанию {CHANNELS}")
+    parser.add_argument("--output-dir", type=Path,
+                        help="писать вывод команд потоково в <каталог>/<N>.out и .err, а не в память")
+    parser.add_argument("--timeout", type=float, help="предел на каждую команду, секунды (с --output-dir)")
+    args = parser.parse_args(argv)
+    main(args.commands, channels=args.channels, output_dir=args.output_dir, timeout=args.timeout)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
@@ -0,0 +1,218 @@
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+MODELS = ("identity", "p", "jc69", "k2p")
+# Строк матрицы расстояний на один блок вычислений
+BLOCK_ROWS = 256
+WORKERS = os.cpu_count() or 1
+# Расстояние для насыщенных пар, где JC69/K2P не определены (логарифм от <= 0)
+SATURATED = 10.0
+
+# Коды нуклеотидов для моделей замен; всё прочее (гэпы, N, IUPAC) — 4
+NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.uint8)
+for code, letters in enumerate((b"Aa", b"Cc", b"Gg", b"TtUu")):
+    NUCLEOTIDE_CODES[list(letters)] = code
+# Транзиции: A<->G, C<->T
+TRANSITION_PARTNER = [2, 3, 0, 1]
+
+
+def encode(alignment):
+    """
+    Выравнивание (MultipleSeqAlignment или [(имя, последовательность)]) в имена
+    и матрицу uint8 n x L с исходными байтами символов.
+    """
+    if hasattr(alignment, "get_alignment_length"):
+        records = [(record.id, str(record.seq)) for record in alignment]
+    else:
+        records = [(name, str(seq)) for name, seq in alignment]
+    names = [name for name, _ in records]
+    lengths = {len(seq) for _, seq in records}
+    if len(lengths) > 1:
+        raise ValueError("последовательности разной длины, это не выравнивание")
+    length = lengths.pop() if lengths else 0
+    data = "".join(seq for _, seq in records).encode("ascii")
+    return names, np.frombuffer(data, dtype=np.uint8).reshape(len(records), length)
+
+
+def _one_hot(matrix, symbols):
+    """Стопка индикаторов float32 по символам: n x (L * len(symbols))."""
+    return np.concatenate([(matrix == s).astype(np.float32) for s in symbols], axis=1)
+
+
+def _blocks(n, block_rows):
+    return [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+
+
+def _run_blocks(n, block_rows, workers, compute, count=1):
+    """
+    Считает верхний треугольник count матриц n x n блоками строк в пуле потоков
+    (BLAS отпускает GIL) и отражает его в нижний.
+    compute(start, stop) возвращает count блоков [start:stop, start:].
+    """
+    outputs = [np.zeros((n, n), dtype=np.float64) for _ in range(count)]
+
+    def fill(bounds):
+        start, stop = bounds
+        for out, block in zip(outputs, compute(start, stop)):
+            out[start:stop, start:] = block
+            out[start:, start:stop] = block.T
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fill, _blocks(n, block_rows)))
+    return outputs
+
+
+def identity_distance(matrix, block_rows=BLOCK_ROWS, workers=WORKERS):
+    """
+    Как DistanceCalculator("identity") Biopython: 1 - совпавших позиций / L,
+    где совпадением считается и пара одинаковых гэпов; регистр различается.
+    """
+    n, length = matrix.shape
+    if length == 0:
+        return np.ones((n, n)) - np.eye(n)
+    onehot = _one_hot(matrix, np.unique(matrix))
+
+    def compute(start, stop):
+        matches = onehot[start:stop] @ onehot[start:].T
+        return [1.0 - matches / np.float64(length)]
+
+    dist, = _run_blocks(n, block_rows, workers, compute)
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+
+def substitution_counts(matrix, block_rows=BLOCK_ROWS, workers=WORKERS):
+    """
+    Для каждой пары: сравнимые позиции (обе буквы из ACGT — парное удаление гэпов
+    и неоднозначных), различия и транзиции. Три матрицы n x n.
+    """
+    n = matrix.shape[0]
+    codes = NUCLEOTIDE_CODES[matrix]
+    onehot = _one_hot(codes, range(4))
+    valid = (codes < 4).astype(np.float32)
+    # Индикаторы, переставленные на партнёра по транзиции: X @ P.T считает транзиции
+    partner = _one_hot(codes, TRANSITION_PARTNER)
+
+    def compute(start, stop):
+        rows = onehot[start:stop]
+        return [valid[start:stop] @ valid[start:].T,
+                rows @ onehot[start:].T,
+                rows @ partner[start:].T]
+
+    compared, matches, transitions = _run_blocks(n, block_rows, workers, compute, count=3)
+    return compared, compared - matches, transitions
+
+
+def distance_array(matrix, model="identity", block_rows=BLOCK_ROWS, workers=WORKERS):
+    """Матрица расстояний n x n (float64) по закодированному выравниванию."""
+    if model not in MODELS:
+        raise ValueError(f"неизвестная модель {model!r}, доступны: {', '.join(MODELS)}")
+    if model == "identity":
+        return identity_distance(matrix, block_rows, workers)
+
+    compared, differences, transitions = substitution_counts(matrix, block_rows, workers)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = differences / compared
+        if model == "p":
+            dist = p
+        elif model == "jc69":
+            dist = -0.75 * np.log(1 - 4.0 / 3.0 * p)
+        else:
+            P = transitions / compared
+            Q = (differences - transitions) / compared
+            dist = -0.5 * np.log(1 - 2 * P - Q) - 0.25 * np.log(1 - 2 * Q)
+    # Нет сравнимых позиций — как у Biopython при нулевом счёте, максимальное расстояние
+    dist[compared == 0] = 1.0 if model == "p" else SATURATED
+    dist[~np.isfinite(dist)] = SATURATED
+    np.minimum(dist, SATURATED, out=dist)
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+
+def to_distance_matrix(names, dist):
+    """Матрица в Bio.Phylo DistanceMatrix (нижний треугольник с диагональю)."""
+    from Bio.Phylo.TreeConstruction import DistanceMatrix
+
+    return DistanceMatrix(list(names), [dist[i, :i + 1].tolist() for i in range(len(names))])
+
+
+def get_distance(alignment, model="identity", block_rows=BLOCK_ROWS, workers=WORKERS):
+    """Замена DistanceCalculator(model).get_distance(alignment) для моделей из MODELS."""
+    names, matrix = encode(alignment)
+    return to_distance_matrix(names, distance_array(matrix, model, block_rows, workers))
+
+
+def random_alignment(n, length, seed=0, gap_rate=0.05):
+    """Синтетическое выравнивание: случайный предок и n потомков с заменами и гэпами."""
+    rng = np.random.default_rng(seed)
+    letters = np.frombuffer(b"ACGT", dtype=np.uint8)
+    ancestor = rng.integers(0, 4, length)
+    rates = rng.uniform(0.01, 0.3, (n, 1))
+    mutated = rng.random((n, length)) < rates
+    codes = np.where(mutated, rng.integers(0, 4, (n, length)), ancestor)
+    matrix = letters[codes]
+    matrix[rng.random((n, length)) < gap_rate] = ord("-")
+    return [(f"seq{i}", row.tobytes().decode()) for i, row in enumerate(matrix)]
+
+
+def benchmark(sizes=(1000, 2000, 5000, 10000), length=1000, model="identity", bio_pairs=2000):
+    """
+    Время distance_array против DistanceCalculator Biopython. Biopython на тысячах
+    последовательностей считает часами, поэтому его время оценивается по bio_pairs
+    случайным парам и умножается на n(n-1)/2.
+    """
+    from Bio.Phylo.TreeConstruction import DistanceCalculator
+    from Bio.Align import MultipleSeqAlignment
+    from Bio.SeqRecord import SeqRecord
+    from Bio.Seq import Seq
+
+    for n in sizes:
+        records = random_alignment(n, length)
+        names, matrix = encode(records)
+        t = time.perf_counter()
+        dist = distance_array(matrix, model)
+        ours = time.perf_counter() - t
+
+        line = f"n={n:>6} L={length}: numpy {ours:8.2f} с"
+        # Из наших моделей в Biopython есть только identity
+        if model == "identity":
+            calculator = DistanceCalculator(model)
+            msa = MultipleSeqAlignment([SeqRecord(Seq(seq), id=name) for name, seq in records])
+            rng = np.random.default_rng(1)
+            pairs = rng.integers(0, n, (bio_pairs, 2))
+            error = 0.0
+            t = time.perf_counter()
+            for i, j in pairs:
+                if i != j:
+                    error = max(error, abs(calculator._pairwise(msa[int(i)], msa[int(j)]) - dist[i, j]))
+            per_pair = (time.perf_counter() - t) / bio_pairs
+            bio = per_pair * n * (n - 1) / 2
+            line += (f", Biopython ~{bio:10.1f} с (оценка), ускорение ~{bio / ours:,.0f}x, "
+                     f"макс. расхождение {error:.1e}")
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Попарные расстояния по выравниванию на NumPy")
+    parser.add_argument("alignment", nargs="?", help="выравнивание FASTA")
+    parser.add_argument("--model", choices=MODELS, default="identity")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="сравнить с Biopython на синтетических выравниваниях n = 1k..10k")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    parser.add_argument("--length", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.sizes, args.length, args.model)
+    elif args.alignment:
+        from Bio import AlignIO
+        names, matrix = encode(AlignIO.read(args.alignment, "fasta"))
+        dist = distance_array(matrix, args.model, workers=args.workers)
+        for name, row in zip(names, dist):
+            print(name, *(f"{x:.6f}" for x in row), sep="\t")
+    else:
+        parser.error("укажите выравнивание или --benchmark")
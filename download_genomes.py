@@ -1,57 +1,358 @@
 import os
-import requests
-from bs4 import BeautifulSoup
+import queue
+import shutil
+import hashlib
+import argparse
+import threading
+import tracing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fasta_index import FaiBuilder
+from bgzf import BgzfWriter
+from config import load_config
+from checksums import is_unchanged, file_stamp, load_json, write_json_atomic
 
 # Параметры
 ENSEMBL_RELEASE = '113'
+ENSEMBL_FTP = 'https://ftp.ensembl.org/pub'
 GENOME_DIR = './genomes'
-SPECIES_LIST = [
-    "homo_sapiens",
-    "pan_troglodytes",
-    "mus_musculus",
-    "rattus_norvegicus",
-    "canis_lupus_familiaris",
-    "bos_taurus",
-    "gallus_gallus",
-    "danio_rerio",
-    "drosophila_melanogaster",
-    "caenorhabditis_elegans"
-    "saccharomyces_cerevisiae"
-]
-
-def download_genome(species, filename_contains="dna.toplevel.fa.gz"):
-    base_url = f"https://ftp.ensembl.org/pub/release-{ENSEMBL_RELEASE}/fasta/{species}/dna/"
+PROCESSED_DIR = os.path.join(GENOME_DIR, 'processed1')
+MAX_WORKERS = 4
+CHUNK_SIZE = 1024 * 1024
+RETRIES = 5
+TIMEOUT = 60
+# Сколько сжатых кусков может ждать распаковки в потоковом режиме
+QUEUE_SIZE = 16
+# Кэш gc_analysis общий для всех потоков загрузки
+CACHE_LOCK = threading.Lock()
+# Проверенные по CHECKSUMS файлы {путь: размер, mtime, сумма}: повторно sum не считается
+VERIFIED_NAME = "verified.json"
+VERIFIED_LOCK = threading.Lock()
+# Список видов — species в bio_inf.toml (config.py)
+
+def make_session(pool_size=MAX_WORKERS):
+    """Одна сессия на все потоки: соединения с сервером переиспользуются."""
+    # requests и bs4 грузятся только при загрузке, а не при импорте модуля
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def species_url(species, base_url=ENSEMBL_FTP):
+    return f"{base_url}/release-{ENSEMBL_RELEASE}/fasta/{species}/dna/"
+
+def bsd_sum(path):
+    """
+    Контрольная сумма в формате CHECKSUMS Ensembl (BSD sum): (сумма, число блоков по 1 КБ).
+    Считается утилитой sum (coreutils, в macOS — своя): каждый шаг суммы зависит от
+    предыдущего, векторизовать её нельзя, а побайтовый цикл на Python идёт минуты на ГБ.
+    """
+    if not shutil.which("sum"):
+        raise RuntimeError("для проверки по CHECKSUMS нужна утилита sum (coreutils)")
+    result = tracing.run(["sum", path], capture_output=True, text=True, check=True)
+    checksum, blocks = result.stdout.split()[:2]
+    return int(checksum), int(blocks)
+
+def remember_verified(path, expected_sum):
+    """Запоминает размер и mtime файла, совпавшего с CHECKSUMS."""
+    verified_path = os.path.join(GENOME_DIR, VERIFIED_NAME)
+    with VERIFIED_LOCK:
+        verified = load_json(verified_path)
+        verified[path] = dict(file_stamp(path), sum=list(expected_sum))
+        write_json_atomic(verified_path, verified)
+
+def is_verified(path, expected_sum):
+    """
+    Совпадает ли файл с суммой из CHECKSUMS. Если файл с тех пор не менялся
+    (размер и mtime как при прошлой проверке), sum не запускается.
+    """
+    with VERIFIED_LOCK:
+        entry = load_json(os.path.join(GENOME_DIR, VERIFIED_NAME)).get(path)
+    if entry and entry.get("sum") == list(expected_sum) and is_unchanged(entry, path):
+        return True
+    if bsd_sum(path) != expected_sum:
+        return False
+    remember_verified(path, expected_sum)
+    return True
+
+def fetch_checksums(session, base_url):
+    """Читает файл CHECKSUMS каталога: {имя файла: (сумма, блоки)}."""
+    r = session.get(base_url + "CHECKSUMS", timeout=TIMEOUT)
+    if r.status_code == 404:
+        return {}
+    r.raise_for_status()
+    checksums = {}
+    for line in r.text.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            checksums[fields[2]] = (int(fields[0]), int(fields[1]))
+    return checksums
+
+def find_genome_file(session, base_url, filename_contains):
+    r = session.get(base_url, timeout=TIMEOUT)
+    r.raise_for_status()
+
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(r.text, "html.parser")
+    for link in soup.find_all("a"):
+        href = link.get("href")
+        if href and filename_contains in href:
+            return href
+    return None
+
+class GenomeStreamSink:
+    """
+    Обрабатывает геном прямо во время загрузки. Сжатые куски передаются в фоновый
+    поток, который за один проход распаковывает их в FASTA для nhmmer, строит
+    его .fai и считает GC, так что скачанный файл больше не перечитывается.
+    С bgzf=True FASTA пишется в BGZF с индексом .gzi (произвольный доступ без
+    распакованной копии), иначе — обычным текстом.
+    """
+
+    def __init__(self, fasta_path, bgzf=True):
+        self.fasta_path = fasta_path
+        self.bgzf = bgzf
+        self.writer = None
+        self.thread = None
+        self.reset()
+
+    def reset(self):
+        """Начинает обработку заново (например, если сервер не поддержал Range)."""
+        self._stop()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.sha256 = hashlib.sha256()
+        self.fai = FaiBuilder()
+        self.counts = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        # gc_analysis нужен только в потоковом режиме
+        from gc_analysis import inflate, count_gc_blocks
+
+        chunks = iter(self.queue.get, None)
+        try:
+            part_path = self.fasta_path + ".part"
+            self.writer = BgzfWriter(part_path) if self.bgzf else open(part_path, "wb")
+            with self.writer as fasta:
+                def blocks():
+                    for block in inflate(chunks):
+                        fasta.write(block)
+                        self.fai.feed(block)
+                        yield block
+                self.counts = count_gc_blocks(blocks())
+        except Exception as e:
+            self.error = e
+            # Дочитываем очередь, чтобы загрузка не заблокировалась на put
+            for _ in chunks:
+                pass
+
+    def write(self, chunk):
+        self.sha256.update(chunk)
+        self.queue.put(chunk)
+
+    def _stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def finish(self):
+        """Дожидается обработки и возвращает (G, C, длина); FASTA и .fai появляются только здесь."""
+        self._stop()
+        if self.error is not None:
+            raise self.error
+        os.replace(self.fasta_path + ".part", self.fasta_path)
+        if self.bgzf:
+            self.writer.write_gzi(self.fasta_path + ".gzi")
+        self.fai.finish()
+        self.fai.write(self.fasta_path + ".fai")
+        return self.counts
+
+    def close(self):
+        self._stop()
+        if os.path.exists(self.fasta_path + ".part"):
+            os.remove(self.fasta_path + ".part")
+
+def _catch_up(sink, part_path, fed):
+    """Передаёт в sink уже лежащие в .part байты, которые он ещё не видел."""
+    with open(part_path, "rb") as f:
+        f.seek(fed)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sink.write(chunk)
+            fed += len(chunk)
+    return fed
+
+def download_file(session, url, local_path, expected_sum=None, sink=None):
+    """
+    Скачивает url в local_path через local_path.part.
+    Недокачанный .part продолжается запросом Range; после загрузки файл
+    сверяется с expected_sum и только тогда переименовывается.
+    Если передан sink, каждый байт файла по порядку отдаётся sink.write().
+    """
+    import requests
+    from requests.exceptions import ChunkedEncodingError
+
+    part_path = local_path + ".part"
+    fed = 0
+    for attempt in range(1, RETRIES + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=TIMEOUT) as r:
+                # 416 на Range означает, что .part уже докачан целиком
+                complete = offset and r.status_code == 416
+                if not complete:
+                    r.raise_for_status()
+                # 200 вместо 206: сервер не умеет Range, качаем заново
+                resume = offset and r.status_code == 206
+                if sink is not None:
+                    if complete or resume:
+                        fed = _catch_up(sink, part_path, fed)
+                    else:
+                        sink.reset()
+                        fed = 0
+                if not complete:
+                    if resume:
+                        print(f"↪️  Продолжение с {offset} байт: {os.path.basename(local_path)}")
+                    with open(part_path, "ab" if resume else "wb") as f:
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            if sink is not None:
+                                sink.write(chunk)
+                                fed += len(chunk)
+        except (requests.ConnectionError, requests.Timeout, ChunkedEncodingError) as e:
+            print(f"⚠️  Обрыв соединения ({attempt}/{RETRIES}): {e}")
+            continue
+
+        if expected_sum is not None and bsd_sum(part_path) != expected_sum:
+            os.remove(part_path)
+            print(f"⚠️  Контрольная сумма не совпала ({attempt}/{RETRIES}), скачиваю заново")
+            continue
+
+        os.replace(part_path, local_path)
+        return local_path
+
+    raise RuntimeError(f"не удалось скачать {url} за {RETRIES} попыток")
+
+def processed_path(href, bgzf=True):
+    """Куда потоковый режим пишет FASTA: тот же .fa.gz (BGZF) или распакованный .fa."""
+    return os.path.join(PROCESSED_DIR, href if bgzf else href[:-len(".gz")])
+
+def finish_stream(sink, local_path):
+    """Сохраняет .fai и результат GC потоковой обработки в кэш gc_analysis."""
+    from gc_analysis import record_result
+
+    counts = sink.finish()
+    entry = dict(file_stamp(local_path), sha256=sink.sha256.hexdigest())
+    with CACHE_LOCK:
+        record_result(local_path, counts, entry)
+    print(f"🧬 Распакован и проиндексирован: {sink.fasta_path}")
+    return counts
+
+def download_genome(species, filename_contains="dna.toplevel.fa.gz", session=None,
+                    base_url=ENSEMBL_FTP, stream=False, bgzf=True):
+    """
+    Скачивает геном вида. С stream=True во время загрузки также пишет
+    FASTA с .fai в PROCESSED_DIR (BGZF с .gzi или, при bgzf=False, несжатый)
+    и считает GC.
+    """
+    session = session or make_session()
+    url = species_url(species, base_url)
     output_dir = os.path.join(GENOME_DIR, species)
     os.makedirs(output_dir, exist_ok=True)
 
     try:
         print(f"\n🔍 Обработка: {species}")
-        r = requests.get(base_url)
-        r.raise_for_status()
-
-        soup = BeautifulSoup(r.text, "html.parser")
-        for link in soup.find_all("a"):
-            href = link.get("href")
-            if href and filename_contains in href:
-                full_url = base_url + href
-                print(f"⬇️  Скачивание: {full_url}")
-                file_response = requests.get(full_url, stream=True)
-                file_response.raise_for_status()
-
-                local_path = os.path.join(output_dir, href)
-                with open(local_path, 'wb') as f:
-                    for chunk in file_response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"✅ Сохранено в: {local_path}")
-                return
-        print(f"⚠️  Файл '{filename_contains}' не найден для {species}")
+        href = find_genome_file(session, url, filename_contains)
+        if href is None:
+            print(f"⚠️  Файл '{filename_contains}' не найден для {species}")
+            return None
+
+        expected_sum = fetch_checksums(session, url).get(href)
+        if expected_sum is None:
+            print(f"⚠️  Нет контрольной суммы для {href}, проверка пропущена")
+
+        local_path = os.path.join(output_dir, href)
+        sink = None
+        if stream:
+            os.makedirs(PROCESSED_DIR, exist_ok=True)
+            fasta_path = processed_path(href, bgzf)
+
+        if os.path.exists(local_path):
+            if expected_sum is None or is_verified(local_path, expected_sum):
+                if stream and not os.path.exists(fasta_path + ".fai"):
+                    # Скачан раньше без обработки: один проход по локальному файлу
+                    sink = GenomeStreamSink(fasta_path, bgzf)
+                    try:
+                        _catch_up(sink, local_path, 0)
+                        finish_stream(sink, local_path)
+                    finally:
+                        sink.close()
+                print(f"⏩ Уже скачан и проверен: {local_path}")
+                return local_path
+            print(f"⚠️  Повреждён, скачиваю заново: {local_path}")
+            os.remove(local_path)
+
+        print(f"⬇️  Скачивание: {url + href}")
+        if stream:
+            sink = GenomeStreamSink(fasta_path, bgzf)
+        try:
+            with tracing.span("download", species=species, stream=stream):
+                download_file(session, url + href, local_path, expected_sum, sink)
+            if expected_sum is not None:
+                remember_verified(local_path, expected_sum)
+            if sink is not None:
+                finish_stream(sink, local_path)
+        finally:
+            if sink is not None:
+                sink.close()
+        print(f"✅ Сохранено в: {local_path}")
+        return local_path
     except Exception as e:
         print(f"❌ Ошибка при загрузке {species}: {e}")
+        return None
+
+def download_all(species_list=None, workers=MAX_WORKERS, base_url=ENSEMBL_FTP, stream=False,
+                 bgzf=True):
+    """
+    Качает геномы параллельно, не больше workers загрузок одновременно.
+    По умолчанию — виды из species в bio_inf.toml.
+    """
+    species_list = species_list or load_config()["species"]
+    session = make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(download_genome, species, session=session,
+                               base_url=base_url, stream=stream, bgzf=bgzf): species
+                   for species in species_list}
+        results = {}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка геномов Ensembl")
+    parser.add_argument("species", nargs="*", help="виды (по умолчанию species из bio_inf.toml)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="число одновременных загрузок")
+    parser.add_argument("--base-url", default=ENSEMBL_FTP,
+                        help="корень FTP Ensembl (можно указать локальный сервер)")
+    parser.add_argument("--stream", action="store_true",
+                        help="во время загрузки перепаковать в processed1 (BGZF с .fai/.gzi) и посчитать GC")
+    parser.add_argument("--plain", action="store_true",
+                        help="с --stream писать в processed1 несжатый FASTA вместо BGZF")
+    args = parser.parse_args(argv)
 
-def main():
     print("🚀 Начало загрузки геномов Ensembl Release", ENSEMBL_RELEASE)
-    for species in SPECIES_LIST:
-        download_genome(species)
+    results = download_all(args.species, workers=args.workers, base_url=args.base_url, stream=args.stream,
+                           bgzf=not args.plain)
+    failed = [species for species, path in results.items() if path is None]
+    if failed:
+        print(f"⚠️  Не загружены: {', '.join(failed)}")
     print("🏁 Загрузка завершена.")
 
 if __name__ == "__main__":
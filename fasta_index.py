@@ -0,0 +1,230 @@
+import os
+import mmap
+from bgzf import is_bgzf, iter_blocks, BgzfReader
+
+
+class FaiBuilder:
+    """
+    Строит индекс .fai (формат samtools faidx) по потоку блоков несжатого FASTA.
+    Блоки подаются по порядку через feed(); файл целиком в памяти не держится.
+    Строка индекса: имя, длина, смещение первой буквы, букв в строке, байт в строке.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.pos = 0               # смещение начала текущего блока в файле
+        self.in_header = False
+        self.line_start = True
+        self.header = []
+        self.record = None         # [имя, длина, смещение, букв в строке, байт в строке]
+        self.first_line = 0        # байт первой строки записи, прочитанных до конца блока
+        self.first_line_cr = False  # первая строка пока заканчивается на '\r'
+
+    def feed(self, block):
+        pos = 0
+        size = len(block)
+        while pos < size:
+            if self.in_header:
+                nl = block.find(b"\n", pos)
+                if nl == -1:
+                    self.header.append(block[pos:])
+                    break
+                self.header.append(block[pos:nl])
+                header = b"".join(self.header).strip().decode()
+                name = header.split(None, 1)[0] if header else ""
+                self.record = [name, 0, self.pos + nl + 1, 0, 0]
+                self.first_line = 0
+                self.first_line_cr = False
+                self.header = []
+                self.in_header = False
+                self.line_start = True
+                pos = nl + 1
+            elif self.line_start and block[pos] == 0x3E:  # '>'
+                self._end_record()
+                self.in_header = True
+                pos += 1
+            else:
+                end = block.find(b"\n>", pos)
+                end = size if end == -1 else end + 1
+                self._add_sequence(block, pos, end)
+                self.line_start = block[end - 1] == 0x0A
+                pos = end
+        self.pos += size
+
+    def _add_sequence(self, block, start, end):
+        if self.record is None:
+            return
+        newlines = block.count(b"\n", start, end)
+        self.record[1] += end - start - newlines - block.count(b"\r", start, end)
+
+        if self.record[4] == 0:
+            nl = block.find(b"\n", start, end)
+            if nl == -1:
+                self.first_line += end - start
+                self.first_line_cr = block[end - 1] == 0x0D
+                return
+            width = self.first_line + nl - start + 1
+            cr = block[nl - 1] == 0x0D if nl > start else self.first_line_cr
+            self.record[3] = width - 2 if cr else width - 1
+            self.record[4] = width
+
+    def _end_record(self):
+        if self.record is None:
+            return
+        if self.record[4] == 0 and self.first_line:
+            # Последняя запись в одну строку без перевода строки в конце файла
+            self.record[3] = self.first_line
+            self.record[4] = self.first_line + 1
+        # Пустые записи samtools faidx в индекс не включает
+        if self.record[1]:
+            self.entries.append(tuple(self.record))
+        self.record = None
+
+    def finish(self):
+        if self.in_header:
+            self.header = []
+            self.in_header = False
+        self._end_record()
+        return self.entries
+
+    def write(self, fai_path):
+        with open(fai_path, "w") as out:
+            for name, length, offset, line_bases, line_width in self.entries:
+                out.write(f"{name}\t{length}\t{offset}\t{line_bases}\t{line_width}\n")
+        return fai_path
+
+
+def fasta_stem(fasta_path):
+    """Имя генома без .fa/.fa.gz: Homo_sapiens.GRCh38.dna.toplevel."""
+    name = os.path.basename(fasta_path)
+    name = name[:-len(".gz")] if name.endswith(".gz") else name
+    return os.path.splitext(name)[0]
+
+
+def read_fasta_blocks(fasta_path, block_size=8 * 1024 * 1024):
+    """Несжатое содержимое FASTA (обычного или BGZF) блоками по порядку."""
+    if is_bgzf(fasta_path):
+        yield from iter_blocks(fasta_path)
+        return
+    with open(fasta_path, "rb") as f:
+        yield from iter(lambda: f.read(block_size), b"")
+
+
+def build_fai(fasta_path):
+    """Строит fasta_path.fai за один проход по файлу (обычному или BGZF)."""
+    builder = FaiBuilder()
+    for block in read_fasta_blocks(fasta_path):
+        builder.feed(block)
+    builder.finish()
+    return builder.write(os.fspath(fasta_path) + ".fai")
+
+
+def load_fai(fasta_path):
+    """
+    Читает fasta_path.fai ({имя: (длина, смещение, букв в строке, байт в строке)}).
+    Индекс строится заново, если его нет или FASTA новее индекса.
+    """
+    fai_path = os.fspath(fasta_path) + ".fai"
+    if not os.path.exists(fai_path) or os.path.getmtime(fai_path) < os.path.getmtime(fasta_path):
+        build_fai(fasta_path)
+    index = {}
+    with open(fai_path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            index[fields[0]] = tuple(int(x) for x in fields[1:5])
+    return index
+
+
+# Комплемент с сохранением регистра; прочие символы не меняются, как в bedtools
+COMPLEMENT = bytes.maketrans(b"ACGTacgt", b"TGCAtgca")
+
+
+def reverse_complement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+class IndexedFasta:
+    """
+    Произвольный доступ к FASTA по .fai: несжатый файл читается через mmap,
+    BGZF — по индексу .gzi с распаковкой только нужных блоков.
+    """
+
+    def __init__(self, fasta_path):
+        self.fasta_path = fasta_path
+        self.index = load_fai(fasta_path)
+        if is_bgzf(fasta_path):
+            self.file = None
+            self.data = BgzfReader(fasta_path)
+        else:
+            self.file = open(fasta_path, "rb")
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        if self.file is not None:
+            self.file.close()
+
+    def _offset(self, name, pos):
+        length, offset, line_bases, line_width = self.index[name]
+        return offset + pos // line_bases * line_width + pos % line_bases
+
+    def fetch(self, name, start, end):
+        """Последовательность name[start:end) в 0-based координатах, как в BED."""
+        if start >= end:
+            return b""
+        raw = self.data[self._offset(name, start):self._offset(name, end - 1) + 1]
+        return raw.translate(None, b"\r\n")
+
+
+def read_bed(bed_path):
+    """Читает BED: список (хромосома, начало, конец, имя, цепь)."""
+    regions = []
+    with open(bed_path) as f:
+        for line in f:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            name = fields[3] if len(fields) > 3 else ""
+            strand = fields[5] if len(fields) > 5 else "."
+            regions.append((fields[0], int(fields[1]), int(fields[2]), name, strand))
+    return regions
+
+
+def extract_regions(fasta_path, regions, stranded=True):
+    """
+    Извлекает все участки генома за одно открытие файла.
+    Выдаёт (заголовок, последовательность) в формате bedtools getfasta -s -name;
+    участки за пределами хромосомы пропускаются с предупреждением, как в bedtools.
+    """
+    with IndexedFasta(fasta_path) as fasta:
+        for chrom, start, end, name, strand in regions:
+            if chrom not in fasta.index:
+                print(f"⚠️  Хромосома {chrom} не найдена в {os.path.basename(fasta_path)}, пропуск")
+                continue
+            length = fasta.index[chrom][0]
+            if start < 0 or end > length or start > end:
+                print(f"⚠️  Участок {chrom}:{start}-{end} вне хромосомы длиной {length}, пропуск")
+                continue
+            seq = fasta.fetch(chrom, start, end)
+            header = f"{name}::{chrom}:{start}-{end}"
+            if stranded:
+                if strand == "-":
+                    seq = reverse_complement(seq)
+                header += f"({strand})"
+            yield header, seq
+
+
+def getfasta(fasta_path, bed_path, fasta_out, stranded=True):
+    """Замена bedtools getfasta -s -name: пишет участки из BED в fasta_out."""
+    count = 0
+    with open(fasta_out, "wb") as out:
+        for header, seq in extract_regions(fasta_path, read_bed(bed_path), stranded):
+            out.write(b">" + header.encode() + b"\n" + seq + b"\n")
+            count += 1
+    return count
@@ -1,12 +1,154 @@
 import os
+import argparse
 import gzip
-import matplotlib.pyplot as plt
+import zlib
+import time
+import hashlib
+import tracing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from checksums import is_unchanged, file_stamp, fingerprint, load_json, write_json_atomic
+
+try:
+    import numpy as np
+except ImportError:  # без numpy считаем через bytes.count
+    np = None
 
 INPUT_DIR = "genomes"
 OUTPUT_DIR = "genomes/processed"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# Размер блока, которым читается распакованный геном
+BLOCK_SIZE = 8 * 1024 * 1024
+# Размер порции сжатых данных, читаемой с диска
+READ_SIZE = 1024 * 1024
+# Сжатые геномы крупнее этого порога в параллельном режиме считаются по частям
+SPLIT_THRESHOLD = 256 * 1024 * 1024
+# Кэш результатов и сводная таблица в OUTPUT_DIR
+CACHE_NAME = "gc_cache.json"
+SUMMARY_NAME = "gc_summary"
+SUMMARY_COLUMNS = ["Species", "File", "GC_Content", "G", "C", "Length", "GC_Skew", "Size", "SHA256"]
+# Символы, которые не входят в длину последовательности (то же, что убирает strip)
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+def inflate(chunks, block_size=BLOCK_SIZE):
+    """
+    Распаковывает поток сжатых gzip-кусков и выдаёт блоки не больше block_size.
+    Поддерживаются файлы из нескольких gzip-членов (в том числе BGZF).
+    """
+    decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for data in chunks:
+        while data:
+            block = decomp.decompress(data, block_size)
+            if block:
+                yield block
+            if decomp.eof:
+                data = decomp.unused_data
+                decomp = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                data = decomp.unconsumed_tail
+    tail = decomp.flush()
+    if tail:
+        yield tail
+
+def hashed(chunks, digest):
+    """Пропускает куски насквозь, добавляя каждый в digest."""
+    for data in chunks:
+        digest.update(data)
+        yield data
+
+def read_blocks(file_path, block_size=BLOCK_SIZE, digest=None):
+    """
+    Читает .fa.gz большими блоками; zlib напрямую быстрее gzip.GzipFile.
+    digest (hashlib) получает сжатые байты тем же чтением.
+    """
+    with open(file_path, "rb") as f:
+        chunks = iter(lambda: f.read(READ_SIZE), b"")
+        yield from inflate(chunks if digest is None else hashed(chunks, digest), block_size)
+
+def iter_fasta_chunks(blocks):
+    """
+    Разбирает поток блоков FASTA, не разбивая его на строки.
+    Для каждой записи выдаёт (header, None), где header — строка заголовка
+    без '>' (bytes), затем (None, chunk) с кусками последовательности.
+    Куски могут содержать переводы строк.
+    """
+    in_header = False
+    line_start = True
+    header = []
+
+    for block in blocks:
+        pos = 0
+        size = len(block)
+        while pos < size:
+            if in_header:
+                nl = block.find(b"\n", pos)
+                if nl == -1:
+                    header.append(block[pos:])
+                    break
+                header.append(block[pos:nl])
+                yield b"".join(header).strip(), None
+                header = []
+                in_header = False
+                line_start = True
+                pos = nl + 1
+            elif line_start and block[pos] == 0x3E:  # '>'
+                in_header = True
+                pos += 1
+            else:
+                nl = block.find(b"\n>", pos)
+                if nl == -1:
+                    yield None, block[pos:] if pos else block
+                    line_start = block[-1] == 0x0A
+                    break
+                yield None, block[pos:nl + 1]
+                line_start = True
+                pos = nl + 1
+
+    if in_header:
+        yield b"".join(header).strip(), None
+
+def _count_chunk_python(chunk):
+    g = chunk.count(b"G") + chunk.count(b"g")
+    c = chunk.count(b"C") + chunk.count(b"c")
+    return g, c, len(chunk.translate(None, WHITESPACE))
+
+def _count_chunk_numpy(chunk):
+    arr = np.frombuffer(chunk, dtype=np.uint8)
+    # | 0x20 приводит буквы к нижнему регистру, и 'G'/'g' считаются одним сравнением
+    lower = arr | 0x20
+    g = int(np.count_nonzero(lower == 0x67))
+    c = int(np.count_nonzero(lower == 0x63))
+    # Управляющие символы кроме пробельных в FASTA не встречаются
+    spaces = int(np.count_nonzero(arr <= 0x20))
+    return g, c, len(chunk) - spaces
+
+count_chunk = _count_chunk_numpy if np is not None else _count_chunk_python
+
+def count_gc_blocks(blocks):
+    """Возвращает (G, C, длина) по потоку блоков FASTA, пропуская заголовки."""
+    g_total = c_total = total_len = 0
+    for header, chunk in iter_fasta_chunks(blocks):
+        if chunk is None:
+            continue
+        g, c, length = count_chunk(chunk)
+        g_total += g
+        c_total += c
+        total_len += length
+    return g_total, c_total, total_len
+
+def count_gc(file_path, block_size=BLOCK_SIZE, digest=None):
+    return count_gc_blocks(read_blocks(file_path, block_size, digest))
+
+def gc_percent(gc_count, total_len):
+    if total_len == 0:
+        return 0
+    return (gc_count / total_len) * 100
 
 def calculate_gc_content(file_path):
+    g, c, total_len = count_gc(file_path)
+    return gc_percent(g + c, total_len)
+
+def calculate_gc_content_lines(file_path):
+    """Построчный подсчёт (прежняя реализация), оставлен для сравнения в бенчмарке."""
     total_len = 0
     gc_count = 0
 
@@ -18,41 +160,416 @@ def calculate_gc_content(file_path):
             gc_count += line.count("G") + line.count("C")
             total_len += len(line)
 
-    if total_len == 0:
+    return gc_percent(gc_count, total_len)
+
+def benchmark(file_path):
+    size = os.path.getsize(file_path)
+    print(f"⏱  Бенчмарк: {file_path} ({size / 1e6:.1f} МБ)")
+    timings = {}
+    for name, func in (("lines", calculate_gc_content_lines),
+                       ("blocks", calculate_gc_content)):
+        start = time.perf_counter()
+        gc = func(file_path)
+        timings[name] = time.perf_counter() - start
+        print(f"   {name:<6} GC: {gc:.6f}%  {timings[name]:.2f} с  "
+              f"({size / 1e6 / timings[name]:.1f} МБ/с сжатых)")
+    print(f"🚀 Ускорение: x{timings['lines'] / timings['blocks']:.1f}")
+
+def _align_to_line(f, pos):
+    """Сдвигает позицию вперёд к началу следующей строки."""
+    if pos == 0:
         return 0
-    return (gc_count / total_len) * 100
+    f.seek(pos - 1)
+    while True:
+        data = f.read(READ_SIZE)
+        if not data:
+            return f.tell()
+        nl = data.find(b"\n")
+        if nl != -1:
+            return f.tell() - len(data) + nl + 1
 
-def process_all_genomes():
-    gc_values = {}
-    found = False
+def split_ranges(fasta_path, parts):
+    """
+    Делит распакованный FASTA на parts байтовых диапазонов.
+    Границы выравниваются по началу строки, чтобы заголовок не попал в два куска.
+    """
+    size = os.path.getsize(fasta_path)
+    bounds = [0]
+    with open(fasta_path, "rb") as f:
+        for i in range(1, parts):
+            bounds.append(max(bounds[-1], _align_to_line(f, size * i // parts)))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
 
-    for file in os.listdir(INPUT_DIR):
-        if file.endswith(".fa.gz"):
-            found = True
-            species_name = file.replace(".dna.toplevel.fa.gz", "").replace(".", "_")
-            input_path = os.path.join(INPUT_DIR, file)
-            gc_content = calculate_gc_content(input_path)
+def read_range(fasta_path, start, end, block_size=BLOCK_SIZE):
+    with open(fasta_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
 
-            output_csv = os.path.join(OUTPUT_DIR, f"{species_name}_gc_content.csv")
-            with open(output_csv, "w") as out:
-                out.write("Species,GC_Content\n")
-                out.write(f"{species_name},{gc_content:.2f}\n")
+def count_gc_range(fasta_path, start, end):
+    return count_gc_blocks(read_range(fasta_path, start, end))
 
-            print(f"✅ Обработан: {species_name} — GC: {gc_content:.2f}%")
-            gc_values[species_name] = gc_content
+def decompress_genome(file_path, output_path):
+    """Распаковывает геном в output_path; возвращает отпечаток сжатого файла (см. count_genome)."""
+    entry = file_stamp(file_path)
+    digest = hashlib.sha256()
+    with open(output_path, "wb") as out:
+        for block in read_blocks(file_path, digest=digest):
+            out.write(block)
+    entry["sha256"] = digest.hexdigest()
+    return entry
 
-    if not found:
-        print("❌ Не найдено ни одного .fa.gz файла.")
+def _window_counts_python(seq, window):
+    counts = []
+    for start in range(0, len(seq), window):
+        g, c, _ = _count_chunk_python(seq[start:start + window])
+        counts.append((g, c))
+    return counts
+
+def _window_counts_numpy(seq, window):
+    lower = np.frombuffer(seq, dtype=np.uint8).reshape(-1, window) | 0x20
+    g = np.count_nonzero(lower == 0x67, axis=1)
+    c = np.count_nonzero(lower == 0x63, axis=1)
+    return zip(g.tolist(), c.tolist())
+
+window_counts = _window_counts_numpy if np is not None else _window_counts_python
+
+def gc_skew(g, c):
+    if g + c == 0:
+        return 0
+    return (g - c) / (g + c)
+
+class GCProfile:
+    """
+    Однопроходный профиль генома: GC по записям, GC и GC-skew в окнах
+    фиксированной длины. Окна пишутся в bedGraph сразу по заполнении,
+    поэтому память не зависит от размера генома.
+    """
+
+    def __init__(self, window, gc_bedgraph, skew_bedgraph, records_csv):
+        self.window = window
+        self.gc_out = open(gc_bedgraph, "w")
+        self.skew_out = open(skew_bedgraph, "w")
+        self.records_out = open(records_csv, "w")
+        self.records_out.write("Record,Length,GC_Content,GC_Skew\n")
+        self.totals = [0, 0, 0]
+        self.record = None
+
+    def start_record(self, header):
+        self.end_record()
+        name = header.split(None, 1)[0].decode() if header else ""
+        # record: имя, G, C, длина; окно: начало, G, C, заполнено
+        self.record = [name, 0, 0, 0]
+        self.win = [0, 0, 0, 0]
+
+    def add(self, chunk):
+        if self.record is None:
+            self.start_record(b"")
+        seq = chunk.translate(None, WHITESPACE)
+        g, c, length = count_chunk(seq)
+        self.record[1] += g
+        self.record[2] += c
+        self.record[3] += length
+
+        pos = 0
+        win = self.win
+        if win[3]:
+            # Дописываем окно, начатое в предыдущем куске
+            piece = seq[:self.window - win[3]]
+            g, c, length = count_chunk(piece)
+            win[1] += g
+            win[2] += c
+            win[3] += length
+            pos = len(piece)
+            if win[3] < self.window:
+                return
+            self._emit_window()
+
+        full = (len(seq) - pos) // self.window * self.window
+        if full:
+            for g, c in window_counts(seq[pos:pos + full], self.window):
+                win[1], win[2], win[3] = g, c, self.window
+                self._emit_window()
+            pos += full
+
+        if pos < len(seq):
+            g, c, length = count_chunk(seq[pos:])
+            win[1], win[2], win[3] = g, c, length
+
+    def _emit_window(self):
+        start, g, c, length = self.win
+        end = start + length
+        chrom = self.record[0]
+        self.gc_out.write(f"{chrom}\t{start}\t{end}\t{gc_percent(g + c, length):.2f}\n")
+        self.skew_out.write(f"{chrom}\t{start}\t{end}\t{gc_skew(g, c):.4f}\n")
+        self.win[:] = [end, 0, 0, 0]
+
+    def end_record(self):
+        if self.record is None:
+            return
+        if self.win[3]:
+            self._emit_window()
+        name, g, c, length = self.record
+        self.records_out.write(f"{name},{length},{gc_percent(g + c, length):.2f},{gc_skew(g, c):.4f}\n")
+        self.totals[0] += g
+        self.totals[1] += c
+        self.totals[2] += length
+        self.record = None
+
+    def close(self):
+        self.end_record()
+        for out in (self.gc_out, self.skew_out, self.records_out):
+            out.close()
+        return tuple(self.totals)
+
+def profile_genome(file_path, window, digest=None):
+    """
+    Считает GC генома и пишет профили за одно чтение файла:
+    {species}_gc_windows.bedGraph, {species}_gc_skew.bedGraph, {species}_gc_records.csv.
+    Возвращает (G, C, длина) как count_gc.
+    """
+    profile = GCProfile(window, *profile_paths(file_path))
+    try:
+        for header, chunk in iter_fasta_chunks(read_blocks(file_path, digest=digest)):
+            if chunk is None:
+                profile.start_record(header)
+            else:
+                profile.add(chunk)
+    finally:
+        totals = profile.close()
+    return totals
+
+def count_genome(file_path, window=None):
+    """
+    (G, C, длина) генома (с window — и профили, см. profile_genome) и его отпечаток
+    {size, mtime_ns, sha256} для кэша: sha256 сжатого файла считается тем же
+    чтением, что и GC, второго прохода по файлу нет.
+    """
+    entry = file_stamp(file_path)
+    digest = hashlib.sha256()
+    if window:
+        counts = profile_genome(file_path, window, digest)
+    else:
+        counts = count_gc(file_path, digest=digest)
+    entry["sha256"] = digest.hexdigest()
+    return counts, entry
+
+def iter_gc_counts(paths, workers, window=None):
+    """
+    Считает геномы в пуле процессов и выдаёт (path, (G, C, длина), отпечаток) по мере готовности.
+    Геном больше SPLIT_THRESHOLD сначала распаковывается во временный файл,
+    а затем считается по байтовым диапазонам на всех процессах.
+    С window каждый геном профилируется целиком в одном процессе: окна идут по порядку.
+    """
+    pending = {}
+    parts = {}
+    stamps = {}
+    temp_files = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path in paths:
+                if not window and os.path.getsize(path) >= SPLIT_THRESHOLD:
+                    tmp = os.path.join(OUTPUT_DIR, os.path.basename(path)[:-3] + ".tmp")
+                    temp_files[path] = tmp
+                    pending[pool.submit(decompress_genome, path, tmp)] = ("decompress", path)
+                else:
+                    pending[pool.submit(count_genome, path, window)] = ("count", path)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path = pending.pop(future)
+                    result = future.result()
+
+                    if kind == "decompress":
+                        stamps[path] = result
+                        ranges = split_ranges(temp_files[path], workers)
+                        parts[path] = [len(ranges), 0, 0, 0]
+                        for start, end in ranges:
+                            task = pool.submit(count_gc_range, temp_files[path], start, end)
+                            pending[task] = ("part", path)
+                        if not ranges:
+                            del parts[path]
+                            yield path, (0, 0, 0), stamps.pop(path)
+                        continue
+
+                    if kind == "part":
+                        acc = parts[path]
+                        acc[0] -= 1
+                        for i, value in enumerate(result, start=1):
+                            acc[i] += value
+                        if acc[0]:
+                            continue
+                        yield path, tuple(parts.pop(path)[1:]), stamps.pop(path)
+                        continue
+
+                    yield path, *result
+    finally:
+        for tmp in temp_files.values():
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+def species_name_for(file):
+    return file.replace(".dna.toplevel.fa.gz", "").replace(".", "_")
+
+def write_species_csv(species_name, gc_content):
+    output_csv = os.path.join(OUTPUT_DIR, f"{species_name}_gc_content.csv")
+    with open(output_csv, "w") as out:
+        out.write("Species,GC_Content\n")
+        out.write(f"{species_name},{gc_content:.2f}\n")
+
+def profile_paths(file_path):
+    prefix = os.path.join(OUTPUT_DIR, species_name_for(os.path.basename(file_path)))
+    return [f"{prefix}_gc_windows.bedGraph", f"{prefix}_gc_skew.bedGraph", f"{prefix}_gc_records.csv"]
+
+def lookup_cache(cache, file_path, window=None):
+    """
+    Возвращает запись кэша, если файл не менялся (размер, mtime, при необходимости sha256).
+    Для профиля нужна запись с тем же окном и уцелевшие выходные файлы.
+    """
+    entry = cache.get(os.path.basename(file_path))
+    if not is_unchanged(entry, file_path):
+        return None
+    if window and (entry.get("window") != window or
+                   not all(os.path.exists(p) for p in profile_paths(file_path))):
+        return None
+    return entry
+
+def write_summary(rows):
+    """
+    Сводная таблица по всем видам: gc_summary.csv и колоночный gc_summary.npz
+    (по массиву на столбец), которые читает plot_gc_content.
+    """
+    csv_path = os.path.join(OUTPUT_DIR, SUMMARY_NAME + ".csv")
+    with open(csv_path, "w") as out:
+        out.write(",".join(SUMMARY_COLUMNS) + "\n")
+        for row in rows:
+            out.write(",".join(str(row[col]) for col in SUMMARY_COLUMNS) + "\n")
+
+    if np is not None:
+        columns = {col: np.array([row[col] for row in rows]) for col in SUMMARY_COLUMNS}
+        np.savez(os.path.join(OUTPUT_DIR, SUMMARY_NAME + ".npz"), **columns)
+    print(f"📋 Сводная таблица: {csv_path}")
+
+def load_gc_summary(path):
+    """Читает gc_summary.csv или gc_summary.npz и возвращает {вид: GC %}."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return dict(zip(data["Species"].tolist(), data["GC_Content"].tolist()))
+    gc_values = {}
+    with open(path) as f:
+        columns = f.readline().strip().split(",")
+        species_idx, gc_idx = columns.index("Species"), columns.index("GC_Content")
+        for line in f:
+            fields = line.rstrip("\n").split(",")
+            gc_values[fields[species_idx]] = float(fields[gc_idx])
     return gc_values
 
+def store_result(cache, file_path, counts, window=None, entry=None):
+    """
+    Записывает (G, C, длина) генома в кэш и в {species}_gc_content.csv.
+    entry — отпечаток файла {size, mtime_ns, sha256}, посчитанный при чтении генома
+    (count_genome, потоковая загрузка); без него файл хэшируется здесь.
+    """
+    g, c, total_len = counts
+    entry = dict(entry) if entry else fingerprint(file_path)
+    entry.update(g=g, c=c, length=total_len, window=window)
+    cache[os.path.basename(file_path)] = entry
+    write_species_csv(species_name_for(os.path.basename(file_path)), gc_percent(g + c, total_len))
+    return entry
+
+def record_result(file_path, counts, entry=None):
+    """Сохраняет результат, посчитанный вне process_all_genomes (например, при загрузке)."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    cache_path = os.path.join(OUTPUT_DIR, CACHE_NAME)
+    cache = load_json(cache_path)
+    store_result(cache, file_path, counts, entry=entry)
+    write_json_atomic(cache_path, cache)
+
+def process_all_genomes(workers=1, window=None, use_cache=True):
+    files = [file for file in os.listdir(INPUT_DIR) if file.endswith(".fa.gz")]
+    if not files:
+        print("❌ Не найдено ни одного .fa.gz файла.")
+        return {}
+
+    paths = [os.path.join(INPUT_DIR, file) for file in files]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    cache_path = os.path.join(OUTPUT_DIR, CACHE_NAME)
+    cache = load_json(cache_path) if use_cache else {}
+
+    todo = []
+    entries = {}
+    for path in paths:
+        entry = lookup_cache(cache, path, window)
+        if entry:
+            entries[path] = entry
+        else:
+            todo.append(path)
+    if entries:
+        print(f"⏩ Из кэша: {len(entries)}, считается заново: {len(todo)}")
+
+    if workers > 1:
+        results = iter_gc_counts(todo, workers, window)
+    else:
+        results = ((path, *count_genome(path, window)) for path in todo)
+
+    # results ленивый: в спан попадает сам подсчёт (с пулом — процессы пула целиком)
+    with tracing.span("gc_count", genomes=len(todo), workers=workers, window=window):
+        for done, (path, counts, stamp) in enumerate(results, start=len(entries) + 1):
+            entries[path] = store_result(cache, path, counts, window, stamp)
+            # Кэш сохраняется после каждого генома, чтобы прерванный запуск не терял работу;
+            # с --no-cache cache начат пустым и перезаписал бы чужие записи
+            if use_cache:
+                write_json_atomic(cache_path, cache)
+            species_name = species_name_for(os.path.basename(path))
+            gc_content = gc_percent(counts[0] + counts[1], counts[2])
+            print(f"✅ [{done}/{len(paths)}] Обработан: {species_name} — GC: {gc_content:.2f}%")
+
+    if use_cache:
+        write_json_atomic(cache_path, cache)
+
+    # Порядок видов как при последовательном проходе, чтобы график не зависел от пула
+    rows = []
+    for path in paths:
+        entry = entries[path]
+        species_name = species_name_for(os.path.basename(path))
+        gc_content = gc_percent(entry["g"] + entry["c"], entry["length"])
+        if not os.path.exists(os.path.join(OUTPUT_DIR, f"{species_name}_gc_content.csv")):
+            write_species_csv(species_name, gc_content)
+        rows.append({
+            "Species": species_name,
+            "File": os.path.basename(path),
+            "GC_Content": gc_content,
+            "G": entry["g"],
+            "C": entry["c"],
+            "Length": entry["length"],
+            "GC_Skew": gc_skew(entry["g"], entry["c"]),
+            "Size": entry["size"],
+            "SHA256": entry.get("sha256", ""),
+        })
+    write_summary(rows)
+    return {row["Species"]: row["GC_Content"] for row in rows}
+
 def plot_gc_content(gc_values):
+    if isinstance(gc_values, str):
+        gc_values = load_gc_summary(gc_values)
     if not gc_values:
         print("⚠️ Нет данных для построения графика.")
         return
 
+    # matplotlib грузится долго, поэтому только когда действительно рисуем
+    import matplotlib.pyplot as plt
+
     species = list(gc_values.keys())
     values = list(gc_values.values())
 
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
     plt.figure(figsize=(12, 6))
     plt.bar(species, values, color="skyblue")
     plt.xticks(rotation=45, ha="right")
@@ -63,7 +580,34 @@ def plot_gc_content(gc_values):
     plt.savefig(plot_path)
     print(f"📊 График сохранён в: {plot_path}")
 
-if __name__ == "__main__":
-    gc_data = process_all_genomes()
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="GC-состав геномов из genomes/*.fa.gz")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="число процессов (по умолчанию последовательно)")
+    parser.add_argument("--window", type=int, metavar="BP",
+                        help="профиль GC: окна этой длины, GC-skew и GC по записям")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="пересчитать все геномы, не глядя в gc_cache.json")
+    parser.add_argument("--plot-only", action="store_true",
+                        help="построить график по готовой сводной таблице")
+    parser.add_argument("--benchmark", metavar="FILE",
+                        help="сравнить построчный и блочный подсчёт на одном файле")
+    args = parser.parse_args(argv)
+    if args.window is not None and args.window <= 0:
+        parser.error("--window должно быть положительным числом пар оснований")
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    if args.plot_only:
+        plot_gc_content(os.path.join(OUTPUT_DIR, SUMMARY_NAME + ".csv"))
+        return
+
+    gc_data = process_all_genomes(workers=args.workers, window=args.window,
+                                  use_cache=not args.no_cache)
     plot_gc_content(gc_data)
     print("\n✅ Все файлы обработаны.")
+
+if __name__ == "__main__":
+    cli()
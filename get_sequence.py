@@ -1,20 +1,211 @@
-import requests
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from checksums import load_json, write_json_atomic
+from config import load_config
 
-genes = ["ENSG00000225940", "ENSG00000226119", "ENSG00000226397"]
+# Гены по умолчанию — [genes] в bio_inf.toml (config.py)
 
-for gene in genes:
-    try:
-        server = "https://rest.ensembl.org"
-        ext = f"/sequence/id/{gene}?type=genomic"
+SERVER = "https://rest.ensembl.org"
+# POST /sequence/id принимает не больше 50 идентификаторов за запрос
+BATCH_SIZE = 50
+MAX_CONCURRENCY = 3
+RETRIES = 5
+TIMEOUT = 120
+CACHE_DIR = ".ensembl_cache"
+LINE_WIDTH = 60
 
-        r = requests.get(server + ext, headers={"Content-Type": "text/x-fasta"})
 
-        if not r.ok:
-            print(f"Ошибка при запросе гена {gene}")
+class RateLimiter:
+    """
+    Общая для всех потоков пауза по заголовкам Ensembl: Retry-After при 429
+    и X-RateLimit-Remaining/X-RateLimit-Reset, когда лимит почти исчерпан.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.not_before = 0.0
+
+    def wait(self):
+        while True:
+            with self.lock:
+                delay = self.not_before - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+
+    def update(self, response):
+        if response.status_code == 429:
+            self.pause(float(response.headers.get("Retry-After", 1)))
+            return
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None and int(remaining) <= 1:
+            self.pause(float(reset))
+
+
+class SequenceCache:
+    """
+    Кэш на диске с адресацией по содержимому: FASTA хранится в objects/ под
+    своим sha256, а index.json связывает (ген, тип) с хэшем.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.index = load_json(self.index_path)
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def get(self, key):
+        digest = self.index.get(key)
+        if digest is None or not os.path.exists(self._object_path(digest)):
+            return None
+        with open(self._object_path(digest)) as f:
+            text = f.read()
+        # Повреждённый объект считаем промахом
+        if hashlib.sha256(text.encode()).hexdigest() != digest:
+            return None
+        return text
+
+    def put(self, key, text):
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+        self.index[key] = digest
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        write_json_atomic(self.index_path, self.index)
+
+
+def make_session(pool_size=MAX_CONCURRENCY):
+    # requests грузится только при запросах, а не при импорте модуля
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+    return session
+
+
+def to_fasta(record):
+    header = record["id"]
+    if record.get("desc"):
+        header += " " + record["desc"]
+    seq = record["seq"]
+    lines = [seq[i:i + LINE_WIDTH] for i in range(0, len(seq), LINE_WIDTH)]
+    return ">" + header + "\n" + "\n".join(lines) + "\n"
+
+
+def fetch_batch(session, limiter, ids, seq_type="genomic", server=SERVER):
+    """Один POST /sequence/id на пачку генов; возвращает {ген: FASTA}."""
+    import requests
+
+    for attempt in range(1, RETRIES + 1):
+        limiter.wait()
+        try:
+            r = session.post(server + "/sequence/id", params={"type": seq_type},
+                             data=json.dumps({"ids": ids}), timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"⚠️  Ошибка соединения ({attempt}/{RETRIES}): {e}")
+            limiter.pause(2 ** attempt)
+            continue
+
+        limiter.update(r)
+        if r.status_code == 429 or r.status_code >= 500:
+            print(f"⚠️  Сервер ответил {r.status_code}, повтор ({attempt}/{RETRIES})")
+            if r.status_code >= 500:
+                limiter.pause(2 ** attempt)
             continue
+        r.raise_for_status()
+        return {record.get("query", record["id"]): to_fasta(record) for record in r.json()}
+
+    raise RuntimeError(f"не удалось получить пачку из {len(ids)} генов за {RETRIES} попыток")
+
+
+def fetch_sequences(gene_ids, seq_type="genomic", server=SERVER, cache_dir=CACHE_DIR,
+                    concurrency=MAX_CONCURRENCY):
+    """
+    Возвращает {ген: FASTA}. Гены из кэша не запрашиваются, остальные идут
+    пачками по BATCH_SIZE не больше чем в concurrency параллельных запросов.
+    """
+    cache = SequenceCache(cache_dir)
+    results = {}
+    missing = []
+    for gene in gene_ids:
+        text = cache.get(f"{seq_type}:{gene}")
+        if text is None:
+            missing.append(gene)
+        else:
+            results[gene] = text
 
+    if missing:
+        print(f"🌐 Запрос {len(missing)} генов (в кэше: {len(results)})")
+        session = make_session(concurrency)
+        limiter = RateLimiter()
+        batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(fetch_batch, session, limiter, batch, seq_type, server)
+                       for batch in batches]
+            for future in as_completed(futures):
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    print(f"Ошибка при запросе пачки генов: {e}")
+                    continue
+                for gene, text in fetched.items():
+                    cache.put(f"{seq_type}:{gene}", text)
+                    results[gene] = text
+        cache.save()
+
+    for gene in gene_ids:
+        if gene not in results:
+            print(f"Ошибка при запросе гена {gene}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка последовательностей генов из Ensembl REST")
+    parser.add_argument("genes", nargs="*", help="идентификаторы генов (по умолчанию [genes] из bio_inf.toml)")
+    parser.add_argument("--genes-file", help="файл с идентификаторами, по одному в строке")
+    parser.add_argument("--server", default=SERVER, help="адрес REST API (можно указать локальный сервер)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    gene_ids = list(args.genes)
+    if args.genes_file:
+        with open(args.genes_file) as f:
+            gene_ids += [line.strip() for line in f if line.strip()]
+    if not gene_ids:
+        gene_ids = list(load_config()["genes"])
+
+    sequences = fetch_sequences(gene_ids, server=args.server, cache_dir=args.cache_dir,
+                                concurrency=args.concurrency)
+    for gene, text in sequences.items():
         with open(f"{gene}.fasta", "w") as f:
-            f.write(r.text)
+            f.write(text)
         print(f"Последовательность гена {gene} сохранена.")
-    except Exception as e:
-        print(f"Ошибка при обработке гена {gene}: {str(e)}")
\ No newline at end of file
+    return 0 if len(sequences) == len(set(gene_ids)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
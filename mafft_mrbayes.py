@@ -1,6 +1,10 @@
 import subprocess
+import tracing
 from pathlib import Path
 import shutil
+from fasta_index import getfasta
+from mrbayes import run_all as run_mrbayes_all
+from config import load_config
 
 def fix_bed_coordinates(bed_file: Path):
     fixed_lines = []
@@ -23,18 +27,13 @@ def fix_bed_coordinates(bed_file: Path):
     print(f"✅ Исправлен: {bed_file.name} (резерв: {backup.name})")
 
 def run_bedtools_getfasta(bed_file: Path, genome_fasta: Path, output_fasta: Path):
-    cmd = [
-        "bedtools", "getfasta",
-        "-fi", str(genome_fasta),
-        "-bed", str(bed_file),
-        "-s", "-name",
-        "-fo", str(output_fasta)
-    ]
-    subprocess.run(cmd, check=True)
+    # То же, что bedtools getfasta -s -name, но без отдельного процесса
+    with tracing.span("getfasta", genome=genome_fasta.name, bed=str(bed_file)):
+        getfasta(genome_fasta, bed_file, output_fasta)
 
 def count_fasta_sequences(fasta_path: Path) -> int:
     try:
-        result = subprocess.run(
+        result = tracing.run(
             ["grep", "-c", "^>", str(fasta_path)],
             capture_output=True, text=True, check=True
         )
@@ -49,33 +48,26 @@ def run_mafft_auto(input_fasta: Path, output_fasta: Path):
     print(f"🔗 MAFFT множественное выравнивание {input_fasta.name}...")
     try:
         with open(output_fasta, "w") as out_f:
-            subprocess.run([
+            tracing.run([
                 "mafft", "--auto", str(input_fasta)
             ], stdout=out_f, check=True)
         print(f"✅ MAFFT завершён: {output_fasta.name}")
     except subprocess.CalledProcessError as e:
         print(f"❌ MAFFT завершился с ошибкой: {e}")
 
-def main():
+def main(config=None):
+    config = config or load_config()
     gene_id = "ENSG00000225940"
-    results_dir = Path("nhmmer_results2")
-    genome_dir = Path("genomes/processed1")
+    # Каталоги и виды — из bio_inf.toml, как у run_nhmmer.py и mafft_mrbayes2.py
+    results_dir = config["genes"].get(gene_id, config["project_dir"] / "nhmmer_results2")
+    genome_dir = config["genomes_dir"]
     final_out_dir = Path("final_outputs")
     final_out_dir.mkdir(exist_ok=True)
 
     input_hits_fa = final_out_dir / f"{gene_id}_hits.fa"
     aligned_fa = final_out_dir / f"{gene_id}_aligned.fa"
 
-    genomes = [
-        "homo_sapiens",
-        "pan_troglodytes",
-        "mus_musculus",
-        "rattus_norvegicus",
-        "canis_lupus_familiaris",
-        "bos_taurus",
-        "gallus_gallus",
-        "danio_rerio"
-    ]
+    genomes = config["genomes"]
 
     print(f"\n\U0001f9ec Обработка гена: {gene_id}")
 
@@ -83,6 +75,9 @@ def main():
         print(f"📥 Обработка {species}...")
         bed_file = results_dir / f"{species.replace('_', ' ').title().replace(' ', '_')}.dna.toplevel.bed"
         genome_fasta = genome_dir / f"{species.replace('_', ' ').title().replace(' ', '_')}.dna.toplevel.fa"
+        if not genome_fasta.exists():
+            # Геном в BGZF читается напрямую, без распакованной копии
+            genome_fasta = genome_fasta.with_name(genome_fasta.name + ".gz")
         extracted_fa = results_dir / f"{species.replace('_', ' ').title().replace(' ', '_')}.dna.toplevel.extracted.fa"
 
         if not bed_file.exists():
@@ -92,12 +87,14 @@ def main():
         try:
             fix_bed_coordinates(bed_file)
             run_bedtools_getfasta(bed_file, genome_fasta, extracted_fa)
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, OSError) as e:
             print(f"❌ Ошибка обработки {species}: {e}")
 
     if input_hits_fa.exists():
         count_fasta_sequences(input_hits_fa)
         run_mafft_auto(input_hits_fa, aligned_fa)
+        if aligned_fa.exists():
+            run_mrbayes_all([aligned_fa], final_out_dir / "mrbayes")
     else:
         print(f"⚠️  Файл {input_hits_fa} не найден")
 
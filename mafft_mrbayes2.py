@@ -1,31 +1,24 @@
 import os
+import shlex
+import argparse
 import subprocess
+import tracing
 from pathlib import Path
 import shutil
+from fasta_index import extract_regions
+from mrbayes import run_all as run_mrbayes_all
+from config import load_config
 
-GENES = {
-    "ENSG00000226119": "nhmmer_results",
-    "ENSG00000226397": "nhmmer_results3"
-}
-
-GENOMES = [
-    "homo_sapiens",
-    "pan_troglodytes",
-    "mus_musculus",
-    "rattus_norvegicus",
-    "canis_lupus_familiaris",
-    "bos_taurus",
-    "gallus_gallus",
-    "danio_rerio"
-]
-
-PROJECT_DIR = Path("/home/lisa/projects/python_projects/genes")
-QUERY_DIR = PROJECT_DIR / "query_sequences"
-OUTPUT_DIR = PROJECT_DIR / "final_outputs_flexible"
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-def fix_bed_coordinates(bed_file: Path):
-    fixed_lines = []
+# Гены, виды и каталоги проекта берутся из bio_inf.toml (config.py)
+
+# В заголовках остаются только буквы, цифры и "_" (плюс ">" и перевод строки)
+HEADER_KEEP = b">\n_" + bytes(range(ord("0"), ord("9") + 1)) + \
+    bytes(range(ord("A"), ord("Z") + 1)) + bytes(range(ord("a"), ord("z") + 1))
+HEADER_DELETE = bytes(b for b in range(256) if b not in HEADER_KEEP)
+
+def read_bed_fixed(bed_file: Path):
+    """Участки BED с исправленным порядком start/end; сам файл не меняется."""
+    regions = []
     with open(bed_file) as f:
         for line in f:
             if line.strip().startswith("#") or not line.strip():
@@ -36,14 +29,10 @@ def fix_bed_coordinates(bed_file: Path):
             chrom, start, end = parts[0], int(parts[1]), int(parts[2])
             if start > end:
                 start, end = end, start
-            parts[1], parts[2] = str(start), str(end)
-            fixed_lines.append("\t".join(parts))
-
-    backup = bed_file.with_suffix(".bed.bak")
-    bed_file.rename(backup)
-    with open(bed_file, "w") as out:
-        out.write("\n".join(fixed_lines) + "\n")
-    print(f"✅ Исправлен: {bed_file.name} (резерв: {backup.name})")
+            name = parts[3] if len(parts) > 3 else ""
+            strand = parts[5] if len(parts) > 5 else "."
+            regions.append((chrom, start, end, name, strand))
+    return regions
 
 def find_matching_file(folder: Path, genome: str, suffix: str):
     genome_lower = genome.lower()
@@ -52,79 +41,134 @@ def find_matching_file(folder: Path, genome: str, suffix: str):
             return file
     return None
 
-def clean_headers(input_fa: Path, output_fa: Path):
-    with open(output_fa, "w") as out:
-        for line in open(input_fa):
-            if line.startswith(">"):
-                clean = ''.join(c for c in line if c.isalnum() or c in ">\n_")
-                out.write(clean)
-            else:
-                out.write(line)
-
-def concatenate_fasta(fasta_list, output_path):
-    with open(output_path, "w") as out:
-        for fa in fasta_list:
-            if fa.exists():
-                out.write(open(fa).read())
+def region_lines(genome_fasta: Path, regions):
+    """Извлечённые участки строками FASTA, как в выводе bedtools getfasta -s -name."""
+    for header, seq in extract_regions(genome_fasta, regions):
+        yield f">{header}\n".encode()
+        yield seq + b"\n"
 
-def run_mafft(input_fa: Path, output_fa: Path):
+def file_lines(fasta: Path):
+    with open(fasta, "rb") as f:
+        for line in f:
+            yield line if line.endswith(b"\n") else line + b"\n"
+
+def assemble_fasta(sources, output_path: Path, cleaned_path: Path):
+    """
+    Один проход по всем источникам: пишет объединённый FASTA и его копию с
+    очищенными заголовками, где повторяющиеся имена получают суффикс _2, _3, ...
+    Возвращает число записей.
+    """
+    seen = set()
+    n_seqs = 0
+    with open(output_path, "wb") as out, open(cleaned_path, "wb") as clean_out:
+        for lines in sources:
+            for line in lines:
+                out.write(line)
+                if line.startswith(b">"):
+                    n_seqs += 1
+                    name = line.translate(None, HEADER_DELETE)[1:-1]
+                    unique, k = name, 1
+                    while unique in seen:
+                        k += 1
+                        unique = name + b"_%d" % k
+                    seen.add(unique)
+                    line = b">" + unique + b"\n"
+                clean_out.write(line)
+    return n_seqs
+
+def run_mafft(input_fa: Path, output_fa: Path, remote=None):
+    if remote is not None:
+        # На вычислительном узле (remote_jobs.RemoteJobs): вход выгружается, выравнивание забирается
+        print("🛰  MAFFT множественное выравнивание на узле...")
+        command = f"mafft --auto {shlex.quote(str(remote.remote_path(input_fa)))} > aligned.fa 2> /dev/null"
+        remote.run_job(f"mafft_{input_fa.stem}", command, inputs=[input_fa], outputs={"aligned.fa": output_fa})
+        print(f"✅ Выравнивание сохранено: {output_fa.name}")
+        return
     print("🔗 MAFFT множественное выравнивание...")
-    subprocess.run(["mafft", "--auto", str(input_fa)], stdout=open(output_fa, "w"), stderr=subprocess.STDOUT)
+    # Ход работы MAFFT пишет в stderr; в файл выравнивания он попадать не должен
+    with open(output_fa, "w") as out:
+        tracing.run(["mafft", "--auto", str(input_fa)], stdout=out, stderr=subprocess.DEVNULL, check=True)
     print(f"✅ Выравнивание сохранено: {output_fa.name}")
 
-def process_gene(gene_id, nhmmer_folder):
+def process_gene(gene_id, nhmmer_folder: Path, genomes, query_dir: Path, output_dir: Path, remote=None):
     print(f"\n🧬 Обработка гена: {gene_id}")
-    result_fasta = OUTPUT_DIR / f"{gene_id}_hits.fa"
-    result_cleaned = OUTPUT_DIR / f"{gene_id}_hits_cleaned.fa"
-    aligned = OUTPUT_DIR / f"{gene_id}_aligned.fa"
-    query_fa = QUERY_DIR / f"{gene_id}.fasta"
+    result_fasta = output_dir / f"{gene_id}_hits.fa"
+    result_cleaned = output_dir / f"{gene_id}_hits_cleaned.fa"
+    aligned = output_dir / f"{gene_id}_aligned.fa"
+    query_fa = query_dir / f"{gene_id}.fasta"
 
-    fasta_paths = []
+    sources = []
 
-    for genome in GENOMES:
+    for genome in genomes:
         print(f"📥 Обработка {genome}...")
-        bed = find_matching_file(PROJECT_DIR / nhmmer_folder, genome, ".bed")
-        fa = find_matching_file(PROJECT_DIR / nhmmer_folder, genome, ".fa")
+        bed = find_matching_file(nhmmer_folder, genome, ".bed")
+        # Геном может лежать и в BGZF (.fa.gz): извлечение читает его напрямую
+        fa = find_matching_file(nhmmer_folder, genome, ".fa") or \
+            find_matching_file(nhmmer_folder, genome, ".fa.gz")
 
         if bed and fa:
-            fix_bed_coordinates(bed)
-            extracted = bed.with_suffix(".extracted.fa")
-            subprocess.run([
-                "bedtools", "getfasta",
-                "-fi", str(fa),
-                "-bed", str(bed),
-                "-s", "-name",
-                "-fo", str(extracted)
-            ])
-            fasta_paths.append(extracted)
+            sources.append(region_lines(fa, read_bed_fixed(bed)))
         else:
             print(f"⚠️  Пропущено: {genome} — нет .bed или .fa")
 
     # Добавляем человека
     if query_fa.exists():
-        fasta_paths.append(query_fa)
+        sources.append(file_lines(query_fa))
     else:
         print(f"⚠️  Нет исходной последовательности: {query_fa.name}")
 
-    if not fasta_paths:
+    if not sources:
         print("❌ Нет доступных последовательностей")
         return
 
-    concatenate_fasta(fasta_paths, result_fasta)
-    clean_headers(result_fasta, result_cleaned)
-
-    # Подсчёт последовательностей
-    n_seqs = sum(1 for line in open(result_cleaned) if line.startswith(">"))
+    # Извлечение, объединение, очистка заголовков и подсчёт — за один проход
+    with tracing.span("assemble_fasta", gene=gene_id):
+        n_seqs = assemble_fasta(sources, result_fasta, result_cleaned)
     print(f"📊 Всего последовательностей: {n_seqs}")
 
     if n_seqs >= 2:
-        run_mafft(result_cleaned, aligned)
+        try:
+            run_mafft(result_cleaned, aligned, remote)
+        except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+            # RuntimeError — задача на узле завершилась с ошибкой (RemoteJobs.fetch)
+            print(f"❌ MAFFT для {gene_id} завершился с ошибкой, выравнивание пропущено: {e}")
+            return None
+        return aligned
     else:
         print("⚠️  Недостаточно последовательностей для выравнивания (нужно минимум 2)")
 
-def main():
-    for gene, nhmmer_folder in GENES.items():
-        process_gene(gene, nhmmer_folder)
+def main(genes=None, config=None, remote=None):
+    """
+    Выравнивания и MrBayes для genes (по умолчанию align_genes, а если их нет — все [genes] из bio_inf.toml).
+    remote (remote_jobs.RemoteJobs) переносит MAFFT на вычислительный узел.
+    """
+    config = config or load_config()
+    output_dir = config["align_dir"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    alignments = []
+    for gene in genes or config["align_genes"] or config["genes"]:
+        nhmmer_folder = config["genes"].get(gene, config["project_dir"] / f"nhmmer_results_{gene}")
+        aligned = process_gene(gene, nhmmer_folder, config["genomes"], config["query_dir"], output_dir, remote)
+        if aligned:
+            alignments.append(aligned)
+
+    # Байесовские деревья по всем генам сразу: анализы идут параллельно
+    if alignments:
+        run_mrbayes_all(alignments, output_dir / "mrbayes")
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Извлечение совпадений nhmmer, MAFFT и MrBayes по генам")
+    parser.add_argument("genes", nargs="*", help="гены (по умолчанию align_genes из bio_inf.toml)")
+    parser.add_argument("--remote", action="store_true",
+                        help="MAFFT на вычислительном узле за [[remote.hops]] из bio_inf.toml")
+    args = parser.parse_args(argv)
+    config = load_config()
+    remote = None
+    if args.remote:
+        from remote_jobs import RemoteJobs
+        remote = RemoteJobs(config)
+    main(args.genes, config, remote)
 
 if __name__ == "__main__":
-    main()
+    cli()
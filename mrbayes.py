@@ -0,0 +1,251 @@
+import os
+import re
+import time
+import shutil
+import argparse
+import subprocess
+import tracing
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MB = "mb"
+MPIRUN = "mpirun"
+# Независимые прогоны и цепи в каждом (MC3)
+NRUNS = 2
+NCHAINS = 4
+# Потолок поколений: обычно анализ останавливается раньше по сходимости
+MAX_GEN = 10_000_000
+SAMPLE_FREQ = 500
+DIAGN_FREQ = 5000
+BURNIN_FRAC = 0.25
+# Порог среднего стандартного отклонения частот расщеплений (ASDSF)
+STOP_VALUE = 0.01
+# Сколько диагностик подряд ASDSF должен держаться ниже порога
+STOP_SAMPLES = 3
+# Как часто перечитывать .mcmc, секунды
+POLL_INTERVAL = 10
+LSET = "lset nst=6 rates=invgamma;"
+CPU_BUDGET = os.cpu_count() or 1
+
+
+def read_fasta(fasta_path):
+    """Записи FASTA как [(имя, последовательность)]; имя — первое слово заголовка."""
+    records = []
+    with open(fasta_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                records.append([line[1:].split()[0] if line[1:].split() else "", []])
+            elif line and records:
+                records[-1][1].append(line)
+    return [(name, "".join(parts)) for name, parts in records]
+
+
+def nexus_name(name):
+    """Имя таксона без символов, которые NEXUS понимает как разделители."""
+    return re.sub(r"[^\w.]", "_", name) or "seq"
+
+
+def fasta_to_nexus(fasta_path, nexus_path):
+    """Пишет выравнивание MAFFT блоком DATA для MrBayes; возвращает (таксонов, столбцов)."""
+    records = read_fasta(fasta_path)
+    if len(records) < 4:
+        raise ValueError(f"{fasta_path}: для MrBayes нужно минимум 4 последовательности, есть {len(records)}")
+    lengths = {len(seq) for _, seq in records}
+    if len(lengths) != 1:
+        raise ValueError(f"{fasta_path}: последовательности разной длины, это не выравнивание")
+    nchar = lengths.pop()
+    width = max(len(nexus_name(name)) for name, _ in records) + 2
+
+    with open(nexus_path, "w") as out:
+        out.write("#NEXUS\n\nbegin data;\n")
+        out.write(f"  dimensions ntax={len(records)} nchar={nchar};\n")
+        out.write("  format datatype=dna missing=? gap=-;\n  matrix\n")
+        for name, seq in records:
+            out.write(f"  {nexus_name(name):<{width}}{seq.upper()}\n")
+        out.write("  ;\nend;\n")
+    return len(records), nchar
+
+
+def write_commands(path, data_nexus, commands):
+    """Командный файл MrBayes: загрузить данные и выполнить commands."""
+    with open(path, "w") as out:
+        out.write("#NEXUS\n\nbegin mrbayes;\n  set autoclose=yes nowarn=yes;\n")
+        out.write(f"  execute {data_nexus.name};\n  {LSET}\n")
+        for command in commands:
+            out.write(f"  {command}\n")
+        out.write("end;\n")
+    return path
+
+
+def read_asdsf(mcmc_path):
+    """Столбец AvgStdDev(s) из .mcmc как [(поколение, ASDSF)]; пропуски (NA) опускаются."""
+    if not mcmc_path.exists():
+        return []
+    values = []
+    column = None
+    with open(mcmc_path) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "Gen":
+                column = next((i for i, name in enumerate(fields) if name.startswith("AvgStdDev")), None)
+                continue
+            if column is None or len(fields) <= column or not line.endswith("\n"):
+                continue
+            try:
+                values.append((int(fields[0]), float(fields[column])))
+            except ValueError:
+                continue
+    return values
+
+
+def converged(values, stop_value=STOP_VALUE, stop_samples=STOP_SAMPLES):
+    recent = values[-stop_samples:]
+    return len(recent) == stop_samples and all(asdsf < stop_value for _, asdsf in recent)
+
+
+def mpi_available(mb=MB):
+    """mpirun есть в PATH, и mb собран с MPI (это видно в его версии)."""
+    if shutil.which(MPIRUN) is None or shutil.which(mb) is None:
+        return False
+    try:
+        result = subprocess.run([mb, "-v"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    version = result.stdout + result.stderr
+    return "MPI" in version or "Parallel version" in version
+
+
+def close_partial_samples(work_dir, name, nruns=NRUNS):
+    """
+    После остановки прогона в .p/.t может остаться недописанная строка, а в .t нет
+    завершающего end; — приводим файлы к виду, который читают sump и sumt.
+    """
+    for run in range(1, nruns + 1):
+        for suffix in (".p", ".t"):
+            path = work_dir / f"{name}.run{run}{suffix}"
+            if not path.exists():
+                continue
+            with open(path, "rb+") as f:
+                data = f.read()
+                data = data[:data.rfind(b"\n") + 1]
+                f.truncate(len(data))
+            if suffix == ".t" and not data.rstrip().endswith(b"end;"):
+                with open(path, "a") as f:
+                    f.write("end;\n")
+
+
+def run_mcmc(work_dir, name, mpi=False, nruns=NRUNS, nchains=NCHAINS, max_gen=MAX_GEN,
+             stop_value=STOP_VALUE, stop_samples=STOP_SAMPLES, poll_interval=POLL_INTERVAL):
+    """
+    Запускает mcmc и следит за .mcmc: как только ASDSF держится ниже stop_value
+    stop_samples диагностик подряд, MrBayes останавливается.
+    Возвращает [(поколение, ASDSF)] на момент остановки.
+    """
+    mcmc = (f"mcmc ngen={max_gen} nruns={nruns} nchains={nchains} samplefreq={SAMPLE_FREQ} "
+            f"printfreq={DIAGN_FREQ} diagnfreq={DIAGN_FREQ} mcmcdiagn=yes "
+            f"relburnin=yes burninfrac={BURNIN_FRAC} filename={name};")
+    script = write_commands(work_dir / f"{name}.run.nex", work_dir / f"{name}.nex", [mcmc])
+    cmd = [MB, script.name]
+    if mpi:
+        cmd = [MPIRUN, "-np", str(nruns * nchains)] + cmd
+
+    mcmc_path = work_dir / f"{name}.mcmc"
+    if mcmc_path.exists():
+        mcmc_path.unlink()
+    with open(work_dir / f"{name}.mb.log", "w") as log:
+        with tracing.popen(cmd, "mb.mcmc", cwd=work_dir, stdout=log, stderr=subprocess.STDOUT) as proc:
+            try:
+                while proc.poll() is None:
+                    time.sleep(poll_interval)
+                    values = read_asdsf(mcmc_path)
+                    if converged(values, stop_value, stop_samples):
+                        gen, asdsf = values[-1]
+                        print(f"🛑 {name}: ASDSF={asdsf:.4f} < {stop_value} на поколении {gen}, остановка")
+                        proc.terminate()
+                        proc.wait()
+                        close_partial_samples(work_dir, name, nruns)
+                        return values
+            except BaseException:
+                proc.kill()
+                raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    values = read_asdsf(mcmc_path)
+    print(f"⚠️  {name}: достигнут предел ngen={max_gen} без сходимости")
+    return values
+
+
+def summarize(work_dir, name, nruns=NRUNS):
+    """Вторым запуском MrBayes строит сводку параметров (sump) и консенсусное дерево (sumt)."""
+    burnin = f"relburnin=yes burninfrac={BURNIN_FRAC}"
+    script = write_commands(work_dir / f"{name}.sum.nex", work_dir / f"{name}.nex", [
+        f"sump filename={name} nruns={nruns} {burnin};",
+        f"sumt filename={name} nruns={nruns} {burnin} conformat=simple;",
+    ])
+    with open(work_dir / f"{name}.sum.log", "w") as log:
+        tracing.run([MB, script.name], "mb.sum", cwd=work_dir, stdout=log, stderr=subprocess.STDOUT, check=True)
+    return work_dir / f"{name}.con.tre"
+
+
+def run_mrbayes(aligned_fasta, work_dir, mpi=False, **options):
+    """Выравнивание -> NEXUS -> mcmc до сходимости -> sump/sumt. Возвращает путь к .con.tre."""
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    name = Path(aligned_fasta).name.split(".")[0]
+    with tracing.span("mrbayes", alignment=name, mpi=mpi):
+        ntax, nchar = fasta_to_nexus(aligned_fasta, work_dir / f"{name}.nex")
+        print(f"🌳 MrBayes для {name}: {ntax} таксонов, {nchar} столбцов{' (MPI)' if mpi else ''}")
+
+        values = run_mcmc(work_dir, name, mpi=mpi, **options)
+        tree = summarize(work_dir, name, options.get("nruns", NRUNS))
+    gen = values[-1][0] if values else 0
+    print(f"✅ {name}: {gen} поколений, консенсус: {tree}")
+    return tree
+
+
+def run_all(alignments, work_dir, cpu_budget=CPU_BUDGET, mpi=None, **options):
+    """
+    Запускает MrBayes для нескольких выравниваний параллельно. С MPI каждый анализ
+    занимает nruns*nchains процессов, без MPI — один процесс mb на ген.
+    Возвращает {выравнивание: консенсусное дерево или None при ошибке}.
+    """
+    if mpi is None:
+        mpi = mpi_available()
+    cores = options.get("nruns", NRUNS) * options.get("nchains", NCHAINS) if mpi else 1
+    jobs = max(1, min(len(alignments), cpu_budget // cores))
+    print(f"🧮 MrBayes: выравниваний {len(alignments)}, параллельно {jobs}, "
+          f"{'MPI x ' + str(cores) if mpi else 'без MPI'}")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_mrbayes, aligned, work_dir, mpi, **options): aligned
+                   for aligned in alignments}
+        for future in as_completed(futures):
+            aligned = futures[future]
+            try:
+                results[aligned] = future.result()
+            except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                print(f"❌ MrBayes для {Path(aligned).name}: {e}")
+                results[aligned] = None
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MrBayes по выравниваниям MAFFT с остановкой по сходимости")
+    parser.add_argument("alignments", nargs="+", type=Path, help="выравнивания FASTA (вывод MAFFT)")
+    parser.add_argument("--work-dir", type=Path, default=Path("mrbayes_runs"))
+    parser.add_argument("--cpu", type=int, default=CPU_BUDGET, help="общий бюджет ядер")
+    parser.add_argument("--mpi", action=argparse.BooleanOptionalAction, default=None,
+                        help="запускать через mpirun (по умолчанию — если доступно)")
+    parser.add_argument("--nruns", type=int, default=NRUNS)
+    parser.add_argument("--nchains", type=int, default=NCHAINS)
+    parser.add_argument("--max-gen", type=int, default=MAX_GEN)
+    parser.add_argument("--stop-value", type=float, default=STOP_VALUE, help="порог ASDSF")
+    parser.add_argument("--stop-samples", type=int, default=STOP_SAMPLES,
+                        help="диагностик подряд ниже порога")
+    args = parser.parse_args()
+
+    run_all(args.alignments, args.work_dir, args.cpu, args.mpi, nruns=args.nruns,
+            nchains=args.nchains, max_gen=args.max_gen, stop_value=args.stop_value,
+            stop_samples=args.stop_samples)
@@ -0,0 +1,229 @@
+import time
+import argparse
+import numpy as np
+
+# Пока узлов больше, пара ищется с отсечением строк по нижней границе и
+# инкрементными суммами строк. С этого размера суммы считаются заново на каждом
+# шаге, как в Biopython: деревья до EXACT_LIMIT листьев совпадают с
+# DistanceTreeConstructor.nj вплоть до выбора среди равных пар.
+EXACT_LIMIT = 300
+# Запас на ошибку округления при сравнении нижней границы строки с найденным минимумом
+BOUND_SLACK = 1e-9
+# Строк в первой пачке поиска; каждая следующая вдвое больше, но не больше MAX_CHUNK
+FIRST_CHUNK = 16
+MAX_CHUNK = 256
+
+
+def _clade(name=None, clades=None):
+    from Bio.Phylo.BaseTree import Clade
+
+    return Clade(None, name, clades=clades)
+
+
+def _tree(root):
+    from Bio.Phylo.BaseTree import Tree
+
+    return Tree(root, rooted=False)
+
+
+def _pick_pair(a, b, first_two):
+    """
+    Порядок пары как в Biopython: (удаляемый слот, слот нового узла). Обычно новый
+    узел встаёт на меньший слот; исключение — пара из двух первых строк, с которой
+    Biopython начинает поиск.
+    """
+    lo, hi = min(a, b), max(a, b)
+    if (lo, hi) == first_two:
+        return lo, hi
+    return hi, lo
+
+
+def _exact_pair(dist, active):
+    """Пара с минимальным Q и суммы строк, посчитанные как в Biopython."""
+    slots = np.flatnonzero(active)
+    sub = dist[np.ix_(slots, slots)]
+    sub = np.where(np.isinf(sub), 0.0, sub)
+    # cumsum складывает строго по порядку, как цикл в Biopython
+    node_dist = np.cumsum(sub, axis=1)[:, -1] / (len(slots) - 2)
+    q = sub - node_dist[:, None] - node_dist[None, :]
+    q[np.triu_indices(len(slots))] = np.inf
+    # argmin по строкам подряд даёт первую пару в порядке обхода Biopython
+    i, j = np.unravel_index(np.argmin(q), q.shape)
+    node = np.zeros(len(dist))
+    node[slots] = node_dist
+    return _pick_pair(slots[i], slots[j], tuple(slots[:2])), node
+
+
+class _PrunedSearch:
+    """
+    Поиск пары с минимальным Q = d(i,j) - r(i) - r(j) без полного перебора, с отсечением
+    строк по нижней границе, как в RapidNJ. Для строки i хранится нижняя граница
+    min_j (d(i,j) - r(j)): точная на шаге, когда строка последний раз просматривалась,
+    и дальше уменьшаемая на накопленный максимальный рост r (drift). Столбец нового
+    узла учитывается в границах всех строк сразу. Строки просматриваются по
+    возрастанию границы пачками растущего размера, пока граница не превысит лучший
+    найденный Q. Суммы строк обновляются после каждого слияния за O(n).
+    """
+
+    def __init__(self, dist):
+        self.dist = dist
+        self.row_sum = np.where(np.isinf(dist), 0.0, dist).sum(axis=1)
+        # Граница строки + drift на момент её подсчёта; -inf — строку нужно просмотреть
+        self.key = np.full(len(dist), -np.inf)
+        self.drift = 0.0
+        self.node = None
+        self.new_slot = None
+
+    def _update_bounds(self, slots, node):
+        """Учитывает рост r с прошлого шага и столбец нового узла."""
+        kept = self.new_slot
+        old = slots[slots != kept]
+        self.drift += max((node[old] - self.node[old]).max(initial=0.0), 0.0)
+        column = self.dist[old, kept] - node[kept] + self.drift
+        self.key[old] = np.minimum(self.key[old], column)
+        self.key[kept] = -np.inf
+
+    def find(self, active, m):
+        slots = np.flatnonzero(active)
+        node = np.zeros(len(self.dist))
+        node[slots] = self.row_sum[slots] / (m - 2)
+        if self.node is not None:
+            self._update_bounds(slots, node)
+        self.node = node
+
+        bounds = self.key[slots] - self.drift - node[slots]
+        order = np.argsort(bounds, kind="stable")
+        slots, bounds = slots[order], bounds[order]
+
+        best, pairs = np.inf, []
+        start, chunk = 0, FIRST_CHUNK
+        while start < len(slots) and bounds[start] <= best + BOUND_SLACK * (abs(best) + 1):
+            stop = start + chunk
+            keep = bounds[start:stop] <= best + BOUND_SLACK * (abs(best) + 1)
+            rows = slots[start:stop][keep]
+            # Выбывшие столбцы и диагональ — inf, так что q по ним тоже inf
+            q = self.dist[rows] - node[rows, None] - node[None, :]
+            row_min = q.min(axis=1)
+            self.key[rows] = row_min + node[rows] + self.drift
+            q_min = row_min.min()
+            if q_min <= best:
+                if q_min < best:
+                    best, pairs = q_min, []
+                ii, jj = np.nonzero(q == q_min)
+                a, b = rows[ii], jj
+                pairs.extend(zip(np.maximum(a, b).tolist(), np.minimum(a, b).tolist()))
+            start, chunk = stop, min(chunk * 2, MAX_CHUNK)
+        hi, lo = min(pairs)
+        return _pick_pair(lo, hi, tuple(np.flatnonzero(active)[:2])), node
+
+    def merge(self, removed, kept, new_row, active):
+        """Суммы строк после слияния; active уже без removed и kept."""
+        dist = self.dist
+        others = np.flatnonzero(active)
+        self.row_sum[others] += new_row[others] - dist[others, removed] - dist[others, kept]
+        self.row_sum[kept] = new_row[others].sum()
+        self.new_slot = kept
+
+
+def nj_array(names, dist, exact_limit=EXACT_LIMIT, overwrite=False):
+    """
+    Neighbor joining по квадратной матрице расстояний (NumPy); возвращает Bio.Phylo Tree
+    той же формы, что DistanceTreeConstructor().nj: внутренние узлы Inner1, Inner2, ...
+    С overwrite=True матрица float64 обновляется на месте без копии (на 10k листьев
+    это 800 МБ), и после вызова её содержимое не определено.
+    """
+    n = len(names)
+    clades = [_clade(name) for name in names]
+    if n == 1:
+        return _tree(clades[0])
+    dist = np.asarray(dist, dtype=np.float64) if overwrite else np.array(dist, dtype=np.float64)
+    if n == 2:
+        clades[1].branch_length = dist[1, 0] / 2.0
+        clades[0].branch_length = dist[1, 0] - clades[1].branch_length
+        return _tree(_clade("Inner", [clades[1], clades[0]]))
+
+    # При четырёх узлах Q дополняющих пар равны, при трёх — всех пар: выбор
+    # среди них зависит от округления, поэтому хвост всегда считается точно
+    exact_limit = max(exact_limit, 4)
+    # Выбывшие узлы и диагональ — бесконечность: не мешают минимумам строк
+    np.fill_diagonal(dist, np.inf)
+    active = np.ones(n, dtype=bool)
+    search = _PrunedSearch(dist) if n > exact_limit else None
+
+    inner = None
+    for inner_count in range(1, n - 1):
+        m = n - inner_count + 1
+        if m <= exact_limit:
+            search = None
+            (removed, kept), node = _exact_pair(dist, active)
+        else:
+            (removed, kept), node = search.find(active, m)
+
+        d = dist[removed, kept]
+        inner = _clade(f"Inner{inner_count}", [clades[removed], clades[kept]])
+        clades[removed].branch_length = (d + node[removed] - node[kept]) / 2.0
+        clades[kept].branch_length = d - clades[removed].branch_length
+        clades[kept] = inner
+        clades[removed] = None
+
+        new_row = (dist[removed] + dist[kept] - d) / 2.0
+        active[removed] = False
+        active[kept] = False
+        if search:
+            search.merge(removed, kept, new_row, active)
+        active[kept] = True
+
+        new_row[kept] = np.inf
+        new_row[removed] = np.inf
+        dist[kept] = new_row
+        dist[:, kept] = new_row
+        dist[removed] = np.inf
+        dist[:, removed] = np.inf
+
+    first, second = np.flatnonzero(active)
+    last = dist[second, first]
+    if clades[first] is inner:
+        clades[first].branch_length = 0
+        clades[second].branch_length = last
+        clades[first].clades.append(clades[second])
+        root = clades[first]
+    else:
+        clades[first].branch_length = last
+        clades[second].branch_length = 0
+        clades[second].clades.append(clades[first])
+        root = clades[second]
+    return _tree(root)
+
+
+def nj(distance_matrix, exact_limit=EXACT_LIMIT):
+    """Замена DistanceTreeConstructor().nj(distance_matrix) для Bio DistanceMatrix."""
+    names = list(distance_matrix.names)
+    n = len(names)
+    dist = np.zeros((n, n))
+    for i, row in enumerate(distance_matrix.matrix):
+        dist[i, :i + 1] = row
+    dist = np.tril(dist) + np.tril(dist, -1).T
+    return nj_array(names, dist, exact_limit, overwrite=True)
+
+
+def benchmark(sizes=(1000, 2000, 5000, 10000), length=1000):
+    """Время nj_array на синтетических выравниваниях (расстояния — distances.py)."""
+    from distances import random_alignment, encode, distance_array
+
+    for n in sizes:
+        names, matrix = encode(random_alignment(n, length))
+        dist = distance_array(matrix, "identity")
+        t = time.perf_counter()
+        nj_array(names, dist, overwrite=True)
+        print(f"n={n:>6}: NJ {time.perf_counter() - t:8.2f} с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Neighbor joining на NumPy")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.sizes)
+    else:
+        parser.error("модуль используется из tree.py; для замера времени укажите --benchmark")
@@ -0,0 +1,267 @@
+import numpy as np
+
+# Столбцы --tblout nhmmer по порядку; описание цели — остаток строки
+TBLOUT_COLUMNS = [
+    ("target", str), ("target_accession", str), ("query", str), ("query_accession", str),
+    ("hmm_from", np.int64), ("hmm_to", np.int64), ("ali_from", np.int64), ("ali_to", np.int64),
+    ("env_from", np.int64), ("env_to", np.int64), ("seq_len", np.int64), ("strand", str),
+    ("evalue", np.float64), ("score", np.float64), ("bias", np.float64), ("description", str),
+]
+
+
+# Сколько байт tblout разбирать за раз: память разбора не зависит от размера файла
+CHUNK_BYTES = 1 << 20
+# Самое длинное целое поле, которое переводится без переполнения int64
+MAX_INT_DIGITS = 18
+
+
+def _read_chunks(path, size=CHUNK_BYTES):
+    """Файл кусками около size байт, разрезанными по концам строк."""
+    tail = b""
+    with open(path, "rb") as f:
+        while block := f.read(size):
+            block = tail + block
+            cut = block.rfind(b"\n") + 1
+            if cut:
+                yield block[:cut]
+            tail = block[cut:]
+    if tail:
+        yield tail + b"\n"
+
+
+def _gather(windows, starts, lengths):
+    """
+    Участки длиной lengths с позиций starts в матрицу байт (n, ширина), хвосты — нули.
+    windows — скользящие окна по байтам куска: строки матрицы копируются из них
+    одной выборкой, без матрицы индексов.
+    """
+    width = max(int(lengths.max()), 1) if len(lengths) else 1
+    matrix = windows[starts, :width]
+    matrix *= np.arange(width) < lengths[:, None]
+    return matrix
+
+
+def _to_str(matrix):
+    """Матрица байт (см. _gather) в строки: ASCII — расширением до UCS4, иначе UTF-8 с заменой."""
+    width = matrix.shape[1]
+    if (matrix < 0x80).all():
+        return matrix.astype(np.uint32).view(f"U{width}").ravel()
+    return np.char.decode(matrix.view(f"S{width}").ravel(), "utf-8", "replace")
+
+
+def _to_int(matrix, lengths):
+    """Целые из матрицы цифр по схеме Горнера; (значения, маска строк, где поле — целое)."""
+    digits = matrix - np.uint8(0x30)  # не цифры переполняются за 9
+    inside = np.arange(matrix.shape[1]) < lengths[:, None]
+    ok = (lengths > 0) & (lengths <= MAX_INT_DIGITS) & ~(inside & (digits > 9)).any(axis=1)
+    values = np.zeros(len(matrix), dtype=np.int64)
+    for j in range(matrix.shape[1]):
+        values = np.where(inside[:, j], values * 10 + digits[:, j], values)
+    return values, ok
+
+
+def _to_float(matrix):
+    """
+    Дробные числа: float() по разным значениям столбца (E-value, score и bias nhmmer
+    печатает с 1–2 знаками, их немного). (значения, маска разобранных).
+    """
+    width = matrix.shape[1]
+    if width <= 8:
+        # До 8 байт поле — одно число uint64: такие сортируются много быстрее строк
+        keys = np.zeros((len(matrix), 8), dtype=np.uint8)
+        keys[:, :width] = matrix
+        unique, inverse = np.unique(keys.view(np.uint64).ravel(), return_inverse=True)
+        texts = unique.view("S8").tolist()
+    else:
+        unique, inverse = np.unique(matrix.view(f"S{width}").ravel(), return_inverse=True)
+        texts = unique.tolist()
+    values = np.zeros(len(texts))
+    ok = np.ones(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        try:
+            values[i] = float(text)
+        except ValueError:
+            ok[i] = False
+    return values[inverse], ok[inverse]
+
+
+def _parse_chunk(chunk):
+    """
+    Кусок tblout (целые строки) в столбцы: границы строк и полей ищутся векторно,
+    числа и строки переводятся целыми столбцами. (столбцы, строк данных в куске).
+    """
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    # Пробел, табуляция, \r и \n — все разделители не больше 0x20
+    is_space = data <= 0x20
+    is_token = ~is_space
+    token_start = np.flatnonzero(is_token & np.r_[True, is_space[:-1]])
+    token_end = np.flatnonzero(is_token & np.r_[is_space[1:], True]) + 1
+
+    line_end = np.flatnonzero(data == 0x0A)
+    line_start = np.r_[0, line_end[:-1] + 1]
+    first = np.searchsorted(token_start, line_start)
+    n_tokens = np.searchsorted(token_start, line_end) - first
+
+    has_tokens = n_tokens > 0
+    comment = np.zeros(len(line_start), dtype=bool)
+    comment[has_tokens] = data[token_start[first[has_tokens]]] == 0x23  # '#'
+    data_lines = has_tokens & ~comment
+    valid = data_lines & (n_tokens >= 15)
+    first, n_tokens = first[valid], n_tokens[valid]
+
+    # Ни одно поле не длиннее строки: окна такой ширины покрывают любое
+    longest = int((line_end - line_start).max()) if len(line_end) else 1
+    windows = np.lib.stride_tricks.sliding_window_view(np.r_[data, np.zeros(longest, np.uint8)], longest)
+
+    columns = {}
+    parsed = np.ones(len(first), dtype=bool)
+    for k, (name, kind) in enumerate(TBLOUT_COLUMNS[:15]):
+        starts = token_start[first + k]
+        lengths = token_end[first + k] - starts
+        matrix = _gather(windows, starts, lengths)
+        if kind is str:
+            columns[name] = _to_str(matrix)
+        else:
+            columns[name], ok = _to_int(matrix, lengths) if kind is np.int64 else _to_float(matrix)
+            parsed &= ok
+
+    # Описание — всё от 16-го поля до конца строки, или '-', если его нет
+    has_desc = n_tokens > 15
+    desc_start = np.where(has_desc, token_start[np.minimum(first + 15, len(token_start) - 1)], 0)
+    desc_end = np.where(has_desc, token_end[first + n_tokens - 1], 0)
+    columns["description"] = np.where(has_desc, _to_str(_gather(windows, desc_start, desc_end - desc_start)), "-")
+
+    if not parsed.all():
+        columns = {name: values[parsed] for name, values in columns.items()}
+    return columns, int(np.count_nonzero(data_lines))
+
+
+def read_tblout(tsv_path):
+    """
+    Читает tblout nhmmer в структурированный массив NumPy со всеми столбцами.
+    Файл читается кусками по CHUNK_BYTES (см. _parse_chunk), столбцы кусков
+    склеиваются в конце. Строки с ошибкой формата пропускаются.
+    """
+    parts, n_lines = [], 0
+    for chunk in _read_chunks(tsv_path):
+        columns, lines = _parse_chunk(chunk)
+        parts.append(columns)
+        n_lines += lines
+
+    names = [name for name, _ in TBLOUT_COLUMNS]
+    if parts:
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in names}
+    else:
+        columns = {name: np.empty(0, dtype="U1" if kind is str else kind) for name, kind in TBLOUT_COLUMNS}
+    del parts
+
+    n_hits = len(columns["target"])
+    if n_lines > n_hits:
+        print(f"⚠️ Пропущено строк с ошибкой формата: {n_lines - n_hits} ({tsv_path})")
+
+    table = np.empty(n_hits, dtype=[(name, columns[name].dtype) for name in names])
+    for name in names:
+        table[name] = columns.pop(name)
+    return table
+
+
+def bed_coordinates(hits):
+    """0-based полуоткрытые координаты выравнивания; на цепи '-' ali_from > ali_to."""
+    start = np.minimum(hits["ali_from"], hits["ali_to"]) - 1
+    end = np.maximum(hits["ali_from"], hits["ali_to"])
+    return start, end
+
+
+def filter_hits(hits, max_evalue=None, min_score=None, min_length=None):
+    mask = np.ones(len(hits), dtype=bool)
+    if max_evalue is not None:
+        mask &= hits["evalue"] <= max_evalue
+    if min_score is not None:
+        mask &= hits["score"] >= min_score
+    if min_length is not None:
+        start, end = bed_coordinates(hits)
+        mask &= (end - start) >= min_length
+    return hits[mask]
+
+
+def top_hits(hits, n):
+    """n лучших совпадений: по возрастанию E-value, при равенстве — по убыванию score."""
+    order = np.lexsort((-hits["score"], hits["evalue"]))
+    return hits[order[:n]]
+
+
+INTERVAL_DTYPE = [("chrom", "O"), ("start", np.int64), ("end", np.int64), ("strand", "U1"),
+                  ("query", "O"), ("evalue", np.float64), ("score", np.float64), ("n_hits", np.int64)]
+
+
+def merge_overlaps(hits):
+    """
+    Сливает перекрывающиеся (и смыкающиеся) совпадения на одной цепи одной
+    последовательности сортировкой с проходом. У слитого участка — лучший E-value,
+    лучший score и запрос лучшего совпадения.
+    """
+    if len(hits) == 0:
+        return np.empty(0, dtype=INTERVAL_DTYPE)
+
+    start, end = bed_coordinates(hits)
+    order = np.lexsort((start, hits["strand"], hits["target"]))
+    target, strand = hits["target"][order], hits["strand"][order]
+    start, end = start[order], end[order]
+    evalue, score, query = hits["evalue"][order], hits["score"][order], hits["query"][order]
+
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (target[1:] != target[:-1]) | (strand[1:] != strand[:-1])
+    group_id = np.cumsum(new_group) - 1
+
+    # Нарастающий максимум конца внутри группы: сдвиг по группам не даёт ему
+    # перетекать из одной последовательности в другую
+    shift = int(end.max()) + 1
+    running_end = np.maximum.accumulate(group_id * shift + end) - group_id * shift
+    new_interval = new_group.copy()
+    new_interval[1:] |= start[1:] > running_end[:-1]
+
+    bounds = np.flatnonzero(new_interval)
+    interval_id = np.cumsum(new_interval) - 1
+    # Лучшее совпадение в каждом участке: минимальный E-value
+    best = np.lexsort((-score, evalue, interval_id))
+    best = best[np.flatnonzero(np.r_[True, interval_id[best][1:] != interval_id[best][:-1]])]
+
+    merged = np.empty(len(bounds), dtype=INTERVAL_DTYPE)
+    merged["chrom"] = target[bounds]
+    merged["strand"] = strand[bounds]
+    merged["start"] = np.minimum.reduceat(start, bounds)
+    merged["end"] = np.maximum.reduceat(end, bounds)
+    merged["evalue"] = evalue[best]
+    merged["score"] = score[best]
+    merged["query"] = query[best]
+    merged["n_hits"] = np.diff(np.r_[bounds, len(order)])
+    return merged
+
+
+def as_intervals(hits):
+    """Совпадения без слияния в том же виде, что и merge_overlaps."""
+    start, end = bed_coordinates(hits)
+    intervals = np.empty(len(hits), dtype=INTERVAL_DTYPE)
+    intervals["chrom"] = hits["target"]
+    intervals["start"] = start
+    intervals["end"] = end
+    intervals["strand"] = hits["strand"]
+    intervals["query"] = hits["query"]
+    intervals["evalue"] = hits["evalue"]
+    intervals["score"] = hits["score"]
+    intervals["n_hits"] = 1
+    return intervals
+
+
+def write_bed(intervals, bed_path, name=None):
+    """
+    Пишет BED6 (chrom, start, end, name, score, strand).
+    name по умолчанию '.', как раньше; name="query" подставляет запрос.
+    """
+    names = intervals["query"] if name == "query" else ["."] * len(intervals)
+    with open(bed_path, "w") as f:
+        f.writelines(f"{chrom}\t{start}\t{end}\t{label}\t0\t{strand}\n"
+                     for chrom, start, end, label, strand in zip(
+                         intervals["chrom"], intervals["start"].tolist(),
+                         intervals["end"].tolist(), names, intervals["strand"]))
+    return len(intervals)
@@ -0,0 +1,322 @@
+import os
+import time
+import shlex
+import hashlib
+import argparse
+import threading
+import tracing
+from pathlib import Path, PurePosixPath
+from concurrent.futures import ThreadPoolExecutor
+from checksums import is_unchanged, fingerprint, load_json, write_json_atomic, atomic_output
+from config import load_config
+from connect_servers import get_tunnel
+
+# Задачи на вычислительном узле за цепочкой [[remote.hops]] из bio_inf.toml:
+# входы выгружаются по SFTP в <workdir>/inputs, каждая задача работает в
+# <workdir>/jobs/<имя> в фоне (nohup), результаты забираются оттуда же.
+
+# Рабочий каталог на узле (от домашнего), если в [remote] нет workdir
+REMOTE_DIR = "bio_inf_jobs"
+# Локальный журнал запущенных задач: опрос и забор результатов переживают перезапуск
+JOBS_FILE = Path("remote_jobs.json")
+# Отпечатки выгружаемых файлов, чтобы не пересчитывать sha256 геномов при каждой выгрузке
+STAGE_CACHE = Path("remote_stage.json")
+# Одновременных передач SFTP (каждая — отдельный канал)
+TRANSFERS = 4
+# Как часто опрашивать задачи, секунды
+POLL_INTERVAL = 30
+# Сколько путей передавать одной командой shell при проверке выгруженного
+BATCH = 200
+# Рядом с выгруженным файлом на узле лежит <файл>.sha256 — хэш на момент выгрузки
+SIDECAR = ".sha256"
+# Знаков sha256 полного локального пути каталога в имени каталога на узле
+DIR_HASH = 12
+
+
+def quote_paths(paths):
+    return " ".join(shlex.quote(str(path)) for path in paths)
+
+
+def batches(items, size=BATCH):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class RemoteJobs:
+    def __init__(self, config=None, compress=True, transfers=TRANSFERS, jobs_file=JOBS_FILE):
+        remote = (config or load_config())["remote"]
+        if not remote["hops"]:
+            raise ValueError("в bio_inf.toml нет [[remote.hops]]")
+        # zlib на последнем переходе: FASTA сжимается в 3-4 раза
+        self.tunnel = get_tunnel(remote["hops"], compress=compress)
+        self.transfers = transfers
+        self.jobs_file = jobs_file
+        self.jobs = load_json(jobs_file)
+        self._lock = threading.Lock()
+        # Пути на узле абсолютные: команды задач выполняются из каталога задачи
+        self.root = PurePosixPath(self.shell("pwd")) / remote.get("workdir", REMOTE_DIR)
+
+    def shell(self, cmd):
+        """Выполняет команду на узле и возвращает её stdout; при ненулевом коде — RuntimeError."""
+        res = self.tunnel.run(cmd)
+        if res['status'] != 0:
+            raise RuntimeError(f"{cmd}: код {res['status']}: {res['error']}")
+        return res['output']
+
+    def remote_path(self, local):
+        """
+        Куда на узле выгружается локальный файл: inputs/<каталог>-<хэш>/<имя>, где хэш —
+        от полного пути каталога: одноимённые каталоги (a/data, b/data) не совпадают.
+        """
+        local = Path(local).resolve()
+        digest = hashlib.sha256(str(local.parent).encode()).hexdigest()[:DIR_HASH]
+        return self.root / "inputs" / f"{local.parent.name}-{digest}" / local.name
+
+    def _local_stamps(self, paths):
+        """Размер, mtime и sha256 локальных файлов; sha256 пересчитывается только для изменённых."""
+        with self._lock:
+            cache = load_json(STAGE_CACHE)
+        stamps = {}
+        for path in paths:
+            entry = cache.get(str(Path(path).resolve()))
+            stamps[path] = entry if is_unchanged(entry, path) else fingerprint(path)
+        with self._lock:
+            # Перечитываем: кэш мог обновить параллельный поток
+            cache = load_json(STAGE_CACHE)
+            cache.update({str(Path(path).resolve()): stamp for path, stamp in stamps.items()})
+            write_json_atomic(STAGE_CACHE, cache)
+        return stamps
+
+    def _remote_state(self, remote_paths):
+        """
+        {путь на узле: (размер, sha256 из <файл>.sha256 или None)} для существующих файлов.
+        Одна команда на BATCH путей вместо stat по SFTP на каждый файл.
+        """
+        state = {}
+        for batch in batches(remote_paths):
+            script = ("for f in %s; do s=$(stat -c %%s -- \"$f\" 2>/dev/null) || continue; "
+                      "printf '%%s\\t%%s\\t%%s\\n' \"$s\" \"$(cat -- \"$f%s\" 2>/dev/null)\" \"$f\"; done"
+                      % (quote_paths(batch), SIDECAR))
+            for line in self.shell(script).splitlines():
+                size, digest, path = line.split("\t", 2)
+                state[path] = (int(size), digest or None)
+        return state
+
+    def _hash_remote(self, remote_paths):
+        """sha256 файлов на узле с записью <файл>.sha256, чтобы следующая проверка их не читала."""
+        digests = {}
+        for batch in batches(remote_paths):
+            for line in self.shell(f"sha256sum -- {quote_paths(batch)}").splitlines():
+                digest, path = line.split(None, 1)
+                digests[path.lstrip("*")] = digest
+        writes = "; ".join(f"printf %s {digest} > {shlex.quote(path + SIDECAR)}"
+                           for path, digest in digests.items())
+        if writes:
+            self.shell(writes)
+        return digests
+
+    def stage(self, paths):
+        """
+        Выгружает локальные файлы на узел (см. remote_path), пропуская те, что уже лежат
+        там с тем же размером и sha256. Передача — по TRANSFERS файлов одновременно,
+        через .part с переименованием, так что оборванная выгрузка не выглядит готовой.
+        Возвращает {локальный путь: путь на узле}.
+        """
+        targets = {Path(path): str(self.remote_path(path)) for path in paths}
+        if not targets:
+            return {}
+        stamps = self._local_stamps(list(targets))
+        state = self._remote_state(list(targets.values()))
+
+        # Файлы без .sha256 (положены не нами или выгрузка оборвалась на записи хэша)
+        unknown = [remote for local, remote in targets.items()
+                   if remote in state and state[remote][1] is None
+                   and state[remote][0] == stamps[local]["size"]]
+        for remote, digest in self._hash_remote(unknown).items():
+            state[remote] = (state[remote][0], digest)
+
+        pending = [local for local, remote in targets.items()
+                   if state.get(remote) != (stamps[local]["size"], stamps[local]["sha256"])]
+        skipped = len(targets) - len(pending)
+        if skipped:
+            print(f"⏭️  На узле уже есть {skipped} из {len(targets)} файлов с тем же sha256")
+        if pending:
+            dirs = {str(PurePosixPath(targets[local]).parent) for local in pending}
+            self.shell(f"mkdir -p -- {quote_paths(sorted(dirs))}")
+            with ThreadPoolExecutor(max_workers=max(1, min(self.transfers, len(pending)))) as pool:
+                for future in [pool.submit(self._upload, local, targets[local], stamps[local]["sha256"])
+                               for local in pending]:
+                    future.result()
+        return {local: PurePosixPath(remote) for local, remote in targets.items()}
+
+    def _upload(self, local, remote, digest):
+        size = os.path.getsize(local)
+        print(f"📤 {local.name} ({size / 1e6:.1f} МБ) -> {remote}")
+        t = time.perf_counter()
+        sftp = self.tunnel.open_sftp()
+        try:
+            sftp.put(str(local), remote + ".part")
+            try:
+                # Старый хэш не должен пережить подмену файла, если запись нового оборвётся
+                sftp.remove(remote + SIDECAR)
+            except IOError:
+                pass
+            sftp.posix_rename(remote + ".part", remote)
+            with sftp.open(remote + SIDECAR, "w") as f:
+                f.write(digest)
+        finally:
+            sftp.close()
+        elapsed = time.perf_counter() - t
+        print(f"✅ {local.name}: {size / 1e6 / max(elapsed, 1e-9):.1f} МБ/с")
+
+    def launch(self, name, command, inputs=(), outputs=None):
+        """
+        Выгружает inputs и запускает command в фоне в каталоге задачи jobs/<name> на узле.
+        Пути входов в command — через remote_path(). outputs — {файл в каталоге задачи:
+        локальный путь}, их заберёт fetch(). stdout и stderr команды остаются в
+        stdout.log/stderr.log, код возврата — в exit_status.
+        """
+        self.stage(inputs)
+        job_dir = self.root / "jobs" / name
+        # Подоболочка: exit внутри command не должен помешать записать код возврата
+        script = (f"( {command} ) > stdout.log 2> stderr.log; "
+                  "echo $? > exit_status.tmp && mv exit_status.tmp exit_status")
+        pid = self.shell(f"mkdir -p {shlex.quote(str(job_dir))} && cd {shlex.quote(str(job_dir))} && "
+                         f"rm -f exit_status && nohup sh -c {shlex.quote(script)} "
+                         "> /dev/null 2>&1 < /dev/null & echo $!")
+        job = {"dir": str(job_dir), "pid": int(pid), "command": command, "status": "running",
+               "outputs": {remote: str(local) for remote, local in (outputs or {}).items()},
+               "launched": time.time()}
+        with self._lock:
+            self.jobs[name] = job
+            write_json_atomic(self.jobs_file, self.jobs)
+        print(f"🚀 Задача {name} запущена на узле (pid {pid})")
+        return job
+
+    def poll(self, names=None):
+        """
+        Состояние задач одной командой: "running", "done", "failed" (ненулевой код)
+        или "lost" (процесса нет, а кода возврата нет — узел перезагружался).
+        """
+        with self._lock:
+            names = [name for name in (names or self.jobs) if self.jobs[name]["status"] == "running"]
+            jobs = {name: self.jobs[name] for name in names}
+        if not jobs:
+            return {}
+        checks = []
+        for name, job in jobs.items():
+            status = shlex.quote(job["dir"] + "/exit_status")
+            # Процесс-зомби (его некому дождаться) тоже не работает. exit_status проверяется
+            # и после ps: задача могла завершиться между проверками
+            checks.append(f"if [ -f {status} ]; then s=$(cat {status}); "
+                          f"else case \"$(ps -o stat= -p {job['pid']} 2>/dev/null)\" in "
+                          f"''|Z*) if [ -f {status} ]; then s=$(cat {status}); else s=lost; fi ;; "
+                          f"*) s=running ;; esac; fi; "
+                          f"printf '%s\\t%s\\n' {shlex.quote(name)} \"$s\"")
+        statuses, codes = {}, {}
+        for line in self.shell("; ".join(checks)).splitlines():
+            name, status = line.split("\t")
+            if status not in ("running", "lost"):
+                codes[name] = int(status)
+                status = "done" if codes[name] == 0 else "failed"
+            statuses[name] = status
+        with self._lock:
+            for name, status in statuses.items():
+                self.jobs[name]["status"] = status
+                if name in codes:
+                    self.jobs[name]["exit_status"] = codes[name]
+            write_json_atomic(self.jobs_file, self.jobs)
+        return statuses
+
+    def wait(self, names, interval=POLL_INTERVAL):
+        """Опрашивает задачи, пока ни одна из names не останется в состоянии running."""
+        while True:
+            self.poll(names)
+            with self._lock:
+                statuses = {name: self.jobs[name]["status"] for name in names}
+            if "running" not in statuses.values():
+                return statuses
+            time.sleep(interval)
+
+    def fetch(self, name):
+        """
+        Забирает выходы завершённой задачи по SFTP. Для упавшей — RuntimeError
+        с концом её stderr.log.
+        """
+        job = self.jobs[name]
+        job_dir = PurePosixPath(job["dir"])
+        if job["status"] != "done":
+            tail = self.shell(f"tail -n 20 {shlex.quote(str(job_dir / 'stderr.log'))} 2>/dev/null || true")
+            raise RuntimeError(f"задача {name}: {job['status']} (код {job.get('exit_status')})\n{tail}")
+        sftp = self.tunnel.open_sftp()
+        try:
+            for remote, local in job["outputs"].items():
+                local = Path(local)
+                local.parent.mkdir(parents=True, exist_ok=True)
+                with atomic_output(local) as tmp:
+                    sftp.get(str(job_dir / remote), str(tmp))
+                print(f"📥 {name}: {remote} -> {local}")
+        finally:
+            sftp.close()
+        return [Path(local) for local in job["outputs"].values()]
+
+    def remove(self, name):
+        """Удаляет каталог задачи на узле и запись в журнале."""
+        job = self.jobs[name]
+        self.shell(f"rm -rf -- {shlex.quote(job['dir'])}")
+        with self._lock:
+            del self.jobs[name]
+            write_json_atomic(self.jobs_file, self.jobs)
+
+    def run_job(self, name, command, inputs=(), outputs=None, interval=POLL_INTERVAL, keep=False):
+        """launch + wait + fetch; каталог задачи на узле удаляется, если не keep."""
+        with tracing.span("remote_job", job=name):
+            self.launch(name, command, inputs, outputs)
+            self.wait([name], interval)
+            paths = self.fetch(name)
+            if not keep:
+                self.remove(name)
+            return paths
+
+
+def project_inputs(config):
+    """Запросы, геномы и BED всех генов проекта — то, что нужно узлу для поиска и выравниваний."""
+    paths = sorted(config["query_dir"].glob("*.fasta"))
+    paths += sorted(config["genomes_dir"].glob("*.fa")) + sorted(config["genomes_dir"].glob("*.fa.gz"))
+    for folder in config["genes"].values():
+        paths += sorted(folder.glob("*.bed"))
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Задачи на вычислительном узле за цепочкой SSH из bio_inf.toml")
+    parser.add_argument("--no-compress", action="store_true", help="без zlib на последнем переходе")
+    parser.add_argument("--transfers", type=int, default=TRANSFERS, help="одновременных передач SFTP")
+    sub = parser.add_subparsers(dest="action", required=True)
+    stage = sub.add_parser("stage", help="выгрузить файлы (по умолчанию запросы, геномы и BED проекта)")
+    stage.add_argument("paths", nargs="*", type=Path)
+    sub.add_parser("status", help="опросить запущенные задачи")
+    wait = sub.add_parser("wait", help="дождаться задач и забрать результаты")
+    wait.add_argument("names", nargs="*", help="по умолчанию все запущенные")
+    wait.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    remote = RemoteJobs(config, compress=not args.no_compress, transfers=args.transfers)
+    if args.action == "stage":
+        remote.stage(args.paths or project_inputs(config))
+    elif args.action == "status":
+        remote.poll()
+        for name, job in remote.jobs.items():
+            print(f"{name}\t{job['status']}\t{job['command']}")
+    else:
+        names = args.names or [name for name, job in remote.jobs.items() if job["status"] == "running"]
+        for name, status in remote.wait(names, args.interval).items():
+            if status == "done":
+                remote.fetch(name)
+            else:
+                print(f"❌ {name}: {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import os
+import shlex
+import argparse
+import subprocess
+import tracing
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from checksums import (is_unchanged, fingerprint, file_sha256, load_json, write_json_atomic,
+                       atomic_output)
+from fasta_index import getfasta, fasta_stem, read_fasta_blocks
+from bgzf import is_bgzf
+from config import load_config
+from nhmmer_hits import read_tblout, filter_hits, top_hits, merge_overlaps, as_intervals, write_bed
+
+# Каталоги геномов, запросов и результатов по генам берутся из bio_inf.toml (config.py)
+# Общие результаты nhmmer по каждому геному (все запросы сразу)
+WORK_DIR = Path("./nhmmer_work")
+# Пары (геном, ген): входы и режим поиска с отпечатком tblout, параметры отбора с отпечатками BED/FA
+MANIFEST_NAME = "manifest.json"
+
+# Собранные makehmmerdb базы геномов и отпечатки исходных FASTA
+DB_DIR = Path("./genomes/hmmerdb")
+
+# E-value threshold
+E_THRESHOLD = 1e-5
+# Сколько ядер всего можно занять поисками
+CPU_BUDGET = os.cpu_count() or 1
+# Отбор совпадений для BED по умолчанию (см. select_hits)
+HIT_OPTIONS = {"min_score": None, "min_length": None, "top": None, "merge": True}
+
+
+def output_dir_for(gene, gene_dirs):
+    return Path(gene_dirs.get(gene, f"nhmmer_results_{gene}"))
+
+
+def write_multi_query(genes, query_dir, output_fasta):
+    """
+    Собирает запросы всех генов в один FASTA для nhmmer.
+    Записи переименовываются в <ген>__<исходное имя>, чтобы по столбцу query name
+    в tblout однозначно вернуться к гену. Возвращает {имя запроса: ген}.
+    """
+    query_to_gene = {}
+    with open(output_fasta, "w") as out:
+        for gene in genes:
+            query_fasta = query_dir / f"{gene}.fasta"
+            with open(query_fasta) as f:
+                for line in f:
+                    if line.startswith(">"):
+                        name = f"{gene}__{line[1:].split()[0]}"
+                        query_to_gene[name] = gene
+                        out.write(f">{name}\n")
+                    else:
+                        out.write(line)
+    return query_to_gene
+
+
+def plan_cpu(n_genomes, cpu_budget=CPU_BUDGET, max_jobs=None):
+    """Делит бюджет ядер между одновременными геномами и --cpu каждого nhmmer."""
+    jobs = max(1, min(n_genomes, cpu_budget, max_jobs or cpu_budget))
+    return jobs, max(1, cpu_budget // jobs)
+
+
+def ensure_target_db(genome_fasta, db_dir=DB_DIR):
+    """
+    Возвращает бинарную базу nhmmer (makehmmerdb) для генома и собирает её при необходимости.
+    Рядом с базой лежит <база>.json с размером, mtime и sha256 исходного FASTA и самой
+    базы; база пересобирается, если изменился FASTA или база (например, недокопирована).
+    """
+    db_dir.mkdir(parents=True, exist_ok=True)
+    db_path = db_dir / (fasta_stem(genome_fasta) + ".hmmerdb")
+    stamp_path = db_path.with_name(db_path.name + ".json")
+
+    stamp = load_json(stamp_path)
+    if is_unchanged(stamp.get("source"), genome_fasta) and is_unchanged(stamp.get("database"), db_path):
+        # is_unchanged мог обновить mtime в отпечатках после проверки хэша
+        write_json_atomic(stamp_path, stamp)
+        return db_path
+
+    print(f"🗂  Сборка базы nhmmer для {genome_fasta.name}")
+    tmp_path = db_path.with_name(db_path.name + ".tmp")
+    source = genome_fasta
+    if is_bgzf(genome_fasta):
+        # makehmmerdb читает только несжатый FASTA: временная копия на время сборки
+        source = db_dir / (fasta_stem(genome_fasta) + ".fa.tmp")
+        with open(source, "wb") as out:
+            for block in read_fasta_blocks(genome_fasta):
+                out.write(block)
+    try:
+        tracing.run(["makehmmerdb", str(source), str(tmp_path)],
+                    check=True, stdout=subprocess.DEVNULL)
+    finally:
+        if source != genome_fasta:
+            source.unlink()
+    os.replace(tmp_path, db_path)
+    write_json_atomic(stamp_path, {"source": fingerprint(genome_fasta), "database": fingerprint(db_path)})
+    return db_path
+
+
+def run_piped(cmd, genome_fasta):
+    """Запускает cmd, подавая распакованный FASTA генома в stdin."""
+    # tracing.popen дожидается процесса при выходе из with
+    with tracing.popen(cmd, stdin=subprocess.PIPE) as proc:
+        try:
+            for block in read_fasta_blocks(genome_fasta):
+                proc.stdin.write(block)
+            proc.stdin.close()
+        except BrokenPipeError:
+            # nhmmer завершился раньше времени; причина будет в коде возврата
+            pass
+        except BaseException:
+            proc.kill()
+            raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def run_nhmmer(genome_fasta, query_fasta, output_tsv, cpu=1, target_db=None):
+    cmd = [
+        "nhmmer",
+        "--cpu", str(cpu),
+        "--tblout", str(output_tsv),
+        "-o", str(output_tsv.with_suffix(".log")),
+        str(query_fasta),
+        str(genome_fasta)
+    ]
+    if target_db is not None:
+        # Готовая база вместо разбора и кодирования FASTA при каждом запуске
+        cmd[-1:] = [str(target_db)]
+        cmd[1:1] = ["--tformat", "hmmerdb"]
+    elif is_bgzf(genome_fasta):
+        # BGZF распаковывается на лету и идёт в nhmmer через stdin ("-")
+        cmd[-1:] = ["-"]
+        cmd[1:1] = ["--tformat", "fasta"]
+    print(f"🚀 Запуск nhmmer для {genome_fasta.name} (--cpu {cpu})")
+    with atomic_output(output_tsv) as tmp_tsv:
+        cmd[cmd.index("--tblout") + 1] = str(tmp_tsv)
+        if cmd[-1] == "-":
+            run_piped(cmd, genome_fasta)
+        else:
+            tracing.run(cmd, check=True)
+    return output_tsv
+
+
+def run_nhmmer_remote(remote, genome_fasta, query_fasta, output_tsv, cpu=1):
+    """
+    Тот же поиск на вычислительном узле (remote — remote_jobs.RemoteJobs): геном и
+    запросы выгружаются по SFTP, уже лежащие там с тем же sha256 не передаются,
+    tblout и лог забираются обратно. База makehmmerdb на узле не собирается:
+    nhmmer читает FASTA, а BGZF (.fa.gz) — как обычный gzip.
+    """
+    cmd = [
+        "nhmmer",
+        "--cpu", str(cpu),
+        "--tblout", "hits.tsv",
+        "-o", "hits.log",
+        str(remote.remote_path(query_fasta)),
+        str(remote.remote_path(genome_fasta))
+    ]
+    if is_bgzf(genome_fasta):
+        cmd[1:1] = ["--tformat", "fasta"]
+    print(f"🛰  Запуск nhmmer для {genome_fasta.name} на узле (--cpu {cpu})")
+    remote.run_job(f"nhmmer_{fasta_stem(genome_fasta)}", shlex.join(cmd),
+                   inputs=[query_fasta, genome_fasta],
+                   outputs={"hits.tsv": output_tsv, "hits.log": output_tsv.with_suffix(".log")})
+    return output_tsv
+
+
+def split_tblout(combined_tsv, query_to_gene, gene_tsvs):
+    """
+    Раскладывает общий tblout по файлам генов; строки комментариев идут в каждый.
+    Файлы генов пишутся во временные и подменяются только после полного прохода.
+    """
+    tmp_paths = {gene: path.with_name(path.name + ".tmp") for gene, path in gene_tsvs.items()}
+    outputs = {gene: open(path, "w") for gene, path in tmp_paths.items()}
+    try:
+        with open(combined_tsv) as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    for out in outputs.values():
+                        out.write(line)
+                    continue
+                gene = query_to_gene.get(line.split(None, 3)[2])
+                if gene in outputs:
+                    # Возвращаем исходное имя запроса, как в отдельном запуске
+                    outputs[gene].write(line.replace(f"{gene}__", "", 1))
+    except BaseException:
+        for gene, out in outputs.items():
+            out.close()
+            os.remove(tmp_paths[gene])
+        raise
+    for gene, out in outputs.items():
+        out.close()
+        os.replace(tmp_paths[gene], gene_tsvs[gene])
+
+
+def parse_and_filter_tsv(tsv_path, e_threshold=1e-10):
+    """Совпадения с E-value не выше порога в виде (target, alifrom, alito, strand)."""
+    hits = filter_hits(read_tblout(tsv_path), max_evalue=e_threshold)
+    return list(zip(hits["target"].tolist(), hits["ali_from"].tolist(),
+                    hits["ali_to"].tolist(), hits["strand"].tolist()))
+
+
+def select_hits(tsv_path, e_threshold, min_score=None, min_length=None, top=None, merge=True):
+    """
+    Совпадения гена для BED: фильтр по E-value/score/длине, при top — только
+    лучшие, затем слияние перекрытий на одной цепи (merge=False оставляет все).
+    """
+    with tracing.span("select_hits", tsv=str(tsv_path)):
+        hits = filter_hits(read_tblout(tsv_path), e_threshold, min_score, min_length)
+        if top is not None:
+            hits = top_hits(hits, top)
+        return merge_overlaps(hits) if merge else as_intervals(hits)
+
+
+def extract_sequences(genome_fasta, bed_path, fasta_out):
+    """
+    Извлекает последовательности по .fai генома (вывод как у bedtools getfasta -s -name).
+    """
+    print(f"🔍 Извлечение последовательностей из {genome_fasta.name}")
+    with tracing.span("getfasta", genome=genome_fasta.name, bed=str(bed_path)), \
+            atomic_output(fasta_out) as tmp_out:
+        return getfasta(genome_fasta, bed_path, tmp_out)
+
+
+def unit_key(genome_fasta, gene):
+    return f"{genome_fasta.name}:{gene}"
+
+
+def outputs_match(stamps, verify=False):
+    """Все файлы {путь: отпечаток} на месте; verify=True пересчитывает sha256 даже при совпадении размера и mtime."""
+    for path, stamp in stamps.items():
+        if verify:
+            if not os.path.exists(path) or file_sha256(path) != stamp["sha256"]:
+                return False
+        elif not is_unchanged(stamp, path):
+            return False
+    return True
+
+
+def is_searched(entry, genome_fasta, query_sha, search, verify=False):
+    """
+    Можно ли не запускать nhmmer для пары (геном, ген): тот же запрос, тот же режим
+    поиска (search), неизменный геном и tblout гена на месте.
+    """
+    if not entry or entry.get("query") != query_sha or entry.get("search") != search:
+        return False
+    if not is_unchanged(entry.get("genome"), genome_fasta):
+        return False
+    return outputs_match(entry["tsv"], verify)
+
+
+def is_selected(entry, select, verify=False):
+    """BED и FA пары собраны с теми же параметрами отбора (select) и на месте."""
+    return entry.get("select") == select and outputs_match(entry["outputs"], verify)
+
+
+def process_genome(genome_fasta, query_dir, query_shas, entries, cpu, e_threshold, use_db=False,
+                   hit_options=None, verify=False, gene_dirs=None, remote=None):
+    """
+    Один проход nhmmer по геному для генов без готового tblout, затем BED/FA по
+    каждому гену, у которого поменялся tblout или параметры отбора (hit_options,
+    e_threshold — nhmmer их не получает, перезапускать его ради них не нужно).
+    entries — записи манифеста этого генома по генам; gene_dirs — каталоги
+    результатов {ген: путь}; remote — RemoteJobs, если nhmmer запускать на
+    вычислительном узле. Возвращает найденные участки и новые записи для
+    обработанных генов.
+    """
+    gene_dirs = gene_dirs or {}
+    hit_options = dict(HIT_OPTIONS, **(hit_options or {}))
+    select = dict(hit_options, e_threshold=e_threshold)
+    # Поиск по FASTA и по базе makehmmerdb (FM-индекс) не обязаны давать одинаковые совпадения
+    search = {"target": "hmmerdb" if use_db and remote is None else "fasta", "remote": remote is not None}
+    stem = fasta_stem(genome_fasta)
+    gene_tsvs = {gene: output_dir_for(gene, gene_dirs) / (stem + ".tsv") for gene in query_shas}
+    to_search = [gene for gene, query_sha in query_shas.items()
+                 if not is_searched(entries.get(gene), genome_fasta, query_sha, search, verify)]
+    pending = [gene for gene in query_shas
+               if gene in to_search or not is_selected(entries[gene], select, verify)]
+
+    found, done = {}, {}
+    for gene in query_shas:
+        if gene not in pending:
+            found[gene] = select_hits(gene_tsvs[gene], e_threshold, **hit_options).tolist()
+    if not pending:
+        print(f"⏭️  {genome_fasta.name}: все гены уже обработаны, пропуск")
+        return found, done
+
+    if to_search:
+        query_fasta = WORK_DIR / (stem + ".queries.fasta")
+        query_to_gene = write_multi_query(to_search, query_dir, query_fasta)
+        combined_tsv = WORK_DIR / (stem + ".tsv")
+        if remote is not None:
+            run_nhmmer_remote(remote, genome_fasta, query_fasta, combined_tsv, cpu)
+        else:
+            target_db = ensure_target_db(genome_fasta) if use_db else None
+            run_nhmmer(genome_fasta, query_fasta, combined_tsv, cpu, target_db)
+        with tracing.span("split_tblout", genome=genome_fasta.name):
+            split_tblout(combined_tsv, query_to_gene, {gene: gene_tsvs[gene] for gene in to_search})
+    else:
+        print(f"♻️  {genome_fasta.name}: tblout готовы, только отбор совпадений")
+
+    # Отпечаток генома: из прежней записи, если файл не менялся, иначе заново
+    previous = next((entry["genome"] for entry in entries.values()
+                     if entry and is_unchanged(entry.get("genome"), genome_fasta)), None)
+    genome_stamp = previous or fingerprint(genome_fasta)
+
+    for gene in pending:
+        output_dir = output_dir_for(gene, gene_dirs)
+        bed_path = output_dir / f"{stem}.bed"
+        fasta_out = output_dir / f"{stem}_extracted.fa"
+        matches = select_hits(gene_tsvs[gene], e_threshold, **hit_options)
+        print(f"✅ {gene}: найдено {len(matches)} участков в {genome_fasta.name}")
+
+        outputs = []
+        if len(matches):
+            with atomic_output(bed_path) as tmp_bed:
+                write_bed(matches, tmp_bed)
+            extract_sequences(genome_fasta, bed_path, fasta_out)
+            outputs += [bed_path, fasta_out]
+
+            print(f"💾 BED файл сохранён: {bed_path}")
+            print(f"💾 Последовательности для MAFFT сохранены: {fasta_out}")
+        else:
+            # Не оставляем BED/FA от прошлого запуска с другими параметрами
+            for stale in (bed_path, fasta_out):
+                if stale.exists():
+                    stale.unlink()
+
+        found[gene] = matches.tolist()
+        if gene in to_search:
+            tsv = {str(gene_tsvs[gene]): fingerprint(gene_tsvs[gene])}
+        else:
+            tsv = entries[gene]["tsv"]
+        done[gene] = {"query": query_shas[gene], "genome": genome_stamp, "search": search, "tsv": tsv,
+                      "select": select, "outputs": {str(path): fingerprint(path) for path in outputs}}
+    return found, done
+
+
+def main(genes=None, genomes_dir=None, query_dir=None,
+         cpu_budget=CPU_BUDGET, max_jobs=None, e_threshold=E_THRESHOLD, use_db=False,
+         hit_options=None, verify=False, gene_dirs=None, remote=None):
+    """
+    Пропущенные genes, genomes_dir, query_dir и gene_dirs берутся из bio_inf.toml.
+    use_db=True ищет по базам makehmmerdb (FM-индекс) вместо FASTA: быстрее на повторных
+    поисках, но совпадения не обязаны быть теми же, что при поиске по FASTA.
+    remote (remote_jobs.RemoteJobs) переносит сами поиски nhmmer на вычислительный узел.
+    """
+    config = load_config()
+    gene_dirs = gene_dirs or config["genes"]
+    genes = list(genes or gene_dirs)
+    genomes_dir = genomes_dir or config["genomes_dir"]
+    query_dir = query_dir or config["query_dir"]
+    WORK_DIR.mkdir(exist_ok=True)
+    for gene in genes:
+        output_dir_for(gene, gene_dirs).mkdir(parents=True, exist_ok=True)
+
+    manifest_path = WORK_DIR / MANIFEST_NAME
+    manifest = load_json(manifest_path)
+    query_shas = {gene: file_sha256(query_dir / f"{gene}.fasta") for gene in genes}
+
+    # Несжатые .fa и BGZF .fa.gz (обычный gzip nhmmer и извлечение не читают)
+    genomes = sorted(genomes_dir.glob("*.fa")) + sorted(
+        path for path in genomes_dir.glob("*.fa.gz") if is_bgzf(path))
+    jobs, cpu = plan_cpu(len(genomes), cpu_budget, max_jobs)
+    print(f"🧮 Геномов: {len(genomes)}, генов: {len(genes)}, параллельно: {jobs} x --cpu {cpu}")
+
+    all_results = {gene: [] for gene in genes}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for genome_fasta in genomes:
+            entries = {gene: manifest.get(unit_key(genome_fasta, gene)) for gene in genes}
+            future = pool.submit(process_genome, genome_fasta, query_dir, query_shas, entries,
+                                 cpu, e_threshold, use_db, hit_options, verify, gene_dirs, remote)
+            futures[future] = genome_fasta
+        for done, future in enumerate(as_completed(futures), start=1):
+            genome_fasta = futures[future]
+            try:
+                found, completed = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка с файлом {genome_fasta.name}: {e}")
+                continue
+            for gene, matches in found.items():
+                all_results[gene].extend(matches)
+            # Манифест обновляется после каждого генома: упавший запуск не теряет готовое
+            for gene, entry in completed.items():
+                manifest[unit_key(genome_fasta, gene)] = entry
+            write_json_atomic(manifest_path, manifest)
+            print(f"📦 [{done}/{len(genomes)}] Готов: {genome_fasta.name}")
+
+    for gene, matches in all_results.items():
+        if not matches:
+            print(f"⚠️  {gene}: ничего не найдено по заданному e-value.")
+        else:
+            print(f"\n🎯 {gene}: всего подходящих совпадений: {len(matches)}")
+    return all_results
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="nhmmer по всем геномам сразу для нескольких генов")
+    parser.add_argument("genes", nargs="*", help="гены (по умолчанию все из [genes] в bio_inf.toml)")
+    parser.add_argument("--genomes-dir", type=Path, help="по умолчанию genomes_dir из bio_inf.toml")
+    parser.add_argument("--query-dir", type=Path, help="по умолчанию query_dir из bio_inf.toml")
+    parser.add_argument("--cpu", type=int, default=CPU_BUDGET, help="общий бюджет ядер")
+    parser.add_argument("--jobs", type=int, help="не больше стольких геномов одновременно")
+    parser.add_argument("--evalue", type=float, default=E_THRESHOLD)
+    parser.add_argument("--db", action="store_true",
+                        help="искать по базам makehmmerdb (FM-индекс), собирая их при необходимости")
+    parser.add_argument("--min-score", type=float, help="минимальный bit score")
+    parser.add_argument("--min-length", type=int, help="минимальная длина выравнивания")
+    parser.add_argument("--top", type=int, help="только N лучших совпадений на геном")
+    parser.add_argument("--no-merge", action="store_true",
+                        help="не сливать перекрывающиеся совпадения")
+    parser.add_argument("--verify", action="store_true",
+                        help="перепроверять sha256 готовых результатов, а не только размер и mtime")
+    parser.add_argument("--remote", action="store_true",
+                        help="искать на вычислительном узле за [[remote.hops]] (--cpu — ядра узла)")
+    args = parser.parse_args(argv)
+
+    remote = None
+    if args.remote:
+        from remote_jobs import RemoteJobs
+        remote = RemoteJobs()
+
+    hit_options = {"min_score": args.min_score, "min_length": args.min_length,
+                   "top": args.top, "merge": not args.no_merge}
+    main(args.genes, args.genomes_dir, args.query_dir, args.cpu, args.jobs, args.evalue,
+         use_db=args.db, hit_options=hit_options, verify=args.verify, remote=remote)
+
+
+if __name__ == "__main__":
+    cli()
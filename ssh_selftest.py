@@ -0,0 +1,507 @@
+import os
+import sys
+import time
+import socket
+import select
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+import paramiko
+import connect_servers
+import remote_jobs
+
+# Проверка connect_servers (пул цепочек, каналы, переподключение), remote_jobs (SFTP,
+# задачи nohup) и AsyncExecutor на локальных SSH-серверах paramiko: переходы цепочки —
+# серверы на 127.0.0.1, каждый пересылает direct-tcpip на следующий. Ни сети, ни
+# настоящих узлов не нужно:
+#
+#   python ssh_selftest.py            все проверки
+#   python ssh_selftest.py reconnect  только переподключение
+
+# Пароль локальных серверов (только для них)
+PASSWORD = "selftest"
+# Сколько переходов в цепочке проверок
+HOPS = 3
+READ_SIZE = 32768
+# Таймаут подключения и открытия канала на время проверок, секунды: зависший переход
+# должен обнаруживаться быстро, а не за connect_servers.CONNECT_TIMEOUT
+CONNECT_TIMEOUT = 2
+
+
+class SelftestSFTP(paramiko.SFTPServerInterface):
+    """SFTP поверх локальной файловой системы (пути remote_jobs абсолютные)."""
+
+    def list_folder(self, path):
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)), name)
+                    for name in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        else:
+            mode = "r+b" if flags & os.O_RDWR else "rb"
+        handle = SelftestHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, old, new):
+        os.rename(old, new)
+        return paramiko.SFTP_OK
+
+    def posix_rename(self, old, new):
+        os.replace(old, new)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        os.mkdir(path)
+        return paramiko.SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.abspath(path)
+
+
+class SelftestHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class SelftestServer(paramiko.ServerInterface):
+    def __init__(self, hosts):
+        self.hosts = hosts
+        # Канал direct-tcpip -> (хост, порт), куда его пересылать
+        self.forwards = {}
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == PASSWORD else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.forwards[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.hosts.exec_command, args=(channel, command), daemon=True).start()
+        return True
+
+
+class LocalHosts:
+    """
+    Цепочка SSH-серверов paramiko на 127.0.0.1 со свободных портов: exec в каталоге
+    home (команды — через sh), direct-tcpip и SFTP. kill() обрывает переход, freeze()
+    делает его полуоткрытым: транспорт жив, но данные через него не идут.
+    """
+
+    def __init__(self, count=HOPS, home=None, delay=0.0):
+        self.key = paramiko.RSAKey.generate(2048)
+        self.home = home or tempfile.mkdtemp(prefix="bio_inf_ssh_")
+        # Задержка перед каждой командой: имитация RTT до узла
+        self.delay = delay
+        # Код возврата раньше последних данных и EOF: OpenSSH так может, когда вывод ещё в пути
+        self.status_first = False
+        self.listeners = []
+        self.transports = {}
+        # Пересылки через каждый переход и замороженные freeze()
+        self.forwards = {}
+        self.frozen = set()
+        self._lock = threading.Lock()
+        for _ in range(count):
+            listener = socket.socket()
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(50)
+            self.listeners.append(listener)
+            self.transports[listener.getsockname()[1]] = []
+            self.forwards[listener.getsockname()[1]] = set()
+            threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+
+    @property
+    def ports(self):
+        return list(self.transports)
+
+    def hops(self):
+        """[[remote.hops]] для get_tunnel и RemoteJobs."""
+        return [{"host": "127.0.0.1", "port": port, "user": "selftest", "password": PASSWORD}
+                for port in self.ports]
+
+    def config(self):
+        return {"remote": {"hops": self.hops(), "workdir": "jobs", "commands": []}}
+
+    def _accept(self, listener):
+        port = listener.getsockname()[1]
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn, port), daemon=True).start()
+
+    def _serve(self, conn, port):
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, SelftestSFTP)
+        server = SelftestServer(self)
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        with self._lock:
+            self.transports[port].append(transport)
+        # Принятые каналы держим здесь: без ссылки paramiko закрывает их при сборке мусора
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is None:
+                continue
+            channels.append(channel)
+            destination = server.forwards.pop(channel.get_id(), None)
+            if destination:
+                threading.Thread(target=self._forward, args=(channel, destination, port),
+                                 daemon=True).start()
+
+    def _forward(self, channel, destination, port):
+        try:
+            sock = socket.create_connection(destination)
+        except OSError:
+            channel.close()
+            return
+        token = object()
+        with self._lock:
+            self.forwards[port].add(token)
+        try:
+            while True:
+                if token in self.frozen:
+                    time.sleep(0.2)
+                    continue
+                readable, _, _ = select.select([channel, sock], [], [], 0.2)
+                if channel in readable:
+                    data = channel.recv(READ_SIZE)
+                    if not data:
+                        break
+                    sock.sendall(data)
+                if sock in readable:
+                    data = sock.recv(READ_SIZE)
+                    if not data:
+                        break
+                    channel.sendall(data)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.forwards[port].discard(token)
+            sock.close()
+            channel.close()
+
+    def exec_command(self, channel, command):
+        # exec_request подтверждается клиенту после возврата из check_channel_exec_request:
+        # вывод раньше подтверждения клиент может не принять
+        time.sleep(self.delay + 0.05)
+        proc = subprocess.Popen(command, shell=True, cwd=self.home, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, env=dict(os.environ, HOME=self.home))
+        if self.status_first:
+            output, error = proc.communicate()
+            channel.send_exit_status(proc.returncode)
+            # Клиент успевает увидеть код возврата при пустых буферах канала
+            time.sleep(0.3)
+            channel.sendall(output)
+            channel.sendall_stderr(error)
+            channel.close()
+            return
+
+        def pump(source, send):
+            while data := source.read1(READ_SIZE):
+                send(data)
+
+        errors = threading.Thread(target=pump, args=(proc.stderr, channel.sendall_stderr))
+        errors.start()
+        try:
+            pump(proc.stdout, channel.sendall)
+        except OSError:
+            proc.kill()
+        errors.join()
+        channel.send_exit_status(proc.wait())
+        channel.close()
+
+    def kill(self, port):
+        """Обрывает все соединения с переходом port (новые подключения к нему принимаются)."""
+        with self._lock:
+            transports, self.transports[port] = self.transports[port], []
+        for transport in transports:
+            transport.close()
+
+    def freeze(self, port):
+        """
+        Замораживает пересылки, которые уже идут через переход port к следующему:
+        соединения за ним полуоткрыты. Новые пересылки работают.
+        """
+        with self._lock:
+            self.frozen.update(self.forwards[port])
+
+    def close(self):
+        for listener in self.listeners:
+            listener.close()
+        for port in self.ports:
+            self.kill(port)
+        shutil.rmtree(self.home, ignore_errors=True)
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_pool(hosts):
+    """Пул отдаёт ту же цепочку; команды идут параллельными каналами, stdout/stderr/код не путаются."""
+    tunnel = connect_servers.get_tunnel(hosts.hops())
+    check(connect_servers.get_tunnel(hosts.hops()) is tunnel, "повторный get_tunnel открыл новую цепочку")
+    commands = [f"echo out{i}; echo err{i} >&2; exit {i % 3}" for i in range(16)]
+    results = tunnel.execute(commands, channels=8)
+    check([res["status"] for res in results] == [i % 3 for i in range(16)], "коды возврата перепутаны")
+    check(all(res["output"] == f"out{i}" and res["error"] == f"err{i}" for i, res in enumerate(results)),
+          "stdout/stderr перепутаны между каналами")
+    # Большой stderr раньше stdout: последовательное чтение зависло бы
+    res = tunnel.run("head -c 5000000 /dev/zero >&2; echo done")
+    check(len(res["error"]) == 5_000_000 and res["output"] == "done", "вывод при большом stderr потерян")
+    return f"{len(commands)} команд по 8 каналам"
+
+
+def check_reconnect(hosts):
+    """Оборванный средний переход переподключается; переходы до него не трогаются."""
+    tunnel = connect_servers.get_tunnel(hosts.hops())
+    first, generation = tunnel.clients[0], tunnel.generation
+    hosts.kill(hosts.ports[1])
+    deadline = time.time() + 5
+    while tunnel.broken_hop() is None and time.time() < deadline:
+        time.sleep(0.1)
+    check(tunnel.broken_hop() == 1, f"обрыв второго перехода не замечен: {tunnel.broken_hop()}")
+    check(tunnel.run("echo again")["output"] == "again", "команда после обрыва не выполнилась")
+    check(tunnel.broken_hop() is None, "цепочка не восстановлена")
+    check(tunnel.clients[0] is first, "первый переход переподключён без нужды")
+    check(tunnel.generation == generation + 1, "переподключение не засчитано в generation")
+    return "второй переход восстановлен, первый сохранён"
+
+
+def check_status_first(hosts):
+    """Код возврата пришёл раньше вывода: run и AsyncExecutor всё равно дочитывают его до EOF."""
+    hosts.status_first = True
+    tunnel = connect_servers.get_tunnel(hosts.hops())
+    command = "seq 1 100000; echo last >&2; exit 4"
+    res = tunnel.run(command)
+    check(res["status"] == 4, "код возврата потерян")
+    check(res["output"].endswith("\n100000") and res["error"] == "last",
+          f"вывод обрезан: {len(res['output'])} байт stdout, stderr {res['error']!r}")
+
+    lines = []
+    res = asyncio.run(connect_servers.AsyncExecutor(tunnel).run(command, stdout=connect_servers.LineSink(lines.append)))
+    check(res["status"] == 4 and res["stderr_bytes"] == 5, "AsyncExecutor: код возврата или stderr потерян")
+    check(len(lines) == 100000 and lines[-1] == b"100000", f"AsyncExecutor: вывод обрезан, {len(lines)} строк")
+    return "вывод после кода возврата дочитан"
+
+
+def check_half_open(hosts):
+    """
+    Полуоткрытый переход (транспорты живы, данные не идут): каналы не открываются по
+    таймауту, цепочка переподключается один раз на все потоки, отступая к живому переходу.
+    """
+    tunnel = connect_servers.get_tunnel(hosts.hops())
+    generation = tunnel.generation
+    hosts.freeze(hosts.ports[0])
+    results = tunnel.execute([f"echo {i}" for i in range(6)], channels=4)
+    check([res["output"] for res in results] == [str(i) for i in range(6)], "команды не выполнились")
+    check(tunnel.generation == generation + 1,
+          f"ожидалось одно переподключение на все потоки, было {tunnel.generation - generation}")
+    return "одно переподключение на 4 потока"
+
+
+def check_stage(hosts, work_dir):
+    """Выгрузка через .part, пропуск неизменных файлов, догрузка изменённых и без .sha256."""
+    jobs = remote_jobs.RemoteJobs(hosts.config(), jobs_file=work_dir / "jobs.json")
+    genome = work_dir / "data" / "genome.fa"
+    query = work_dir / "data" / "query.fasta"
+    genome.parent.mkdir(exist_ok=True)
+    genome.write_bytes(b">chr1\n" + b"ACGT" * 250_000 + b"\n")
+    query.write_text(">q\nACGTACGT\n")
+
+    targets = jobs.stage([genome, query])
+    remote_genome = Path(targets[genome])
+    check(remote_genome.read_bytes() == genome.read_bytes(), "геном выгружен с ошибкой")
+    mtime = remote_genome.stat().st_mtime_ns
+    jobs.stage([genome, query])
+    check(remote_genome.stat().st_mtime_ns == mtime, "неизменный файл выгружен повторно")
+
+    os.remove(str(targets[query]) + remote_jobs.SIDECAR)
+    query_mtime = Path(targets[query]).stat().st_mtime_ns
+    jobs.stage([query])
+    check(Path(targets[query]).stat().st_mtime_ns == query_mtime, "файл без .sha256 выгружен повторно")
+    check(Path(str(targets[query]) + remote_jobs.SIDECAR).exists(), ".sha256 не восстановлен")
+
+    query.write_text(">q\nACGTACGG\n")
+    jobs.stage([query])
+    check(Path(targets[query]).read_text() == query.read_text(), "изменённый файл не выгружен")
+
+    # Одноимённые файлы в одноимённых каталогах разных проектов не затирают друг друга
+    twins = [work_dir / project / "data" / "query.fasta" for project in ("a", "b")]
+    for i, twin in enumerate(twins):
+        twin.parent.mkdir(parents=True)
+        twin.write_text(f">twin{i}\nACGT\n")
+    twin_targets = jobs.stage(twins)
+    check(len({twin_targets[twin] for twin in twins}) == 2, "одноимённые файлы выгружены в один путь")
+    check(all(Path(twin_targets[twin]).read_text() == twin.read_text() for twin in twins),
+          "одноимённый файл затёр другой")
+    check(not list(remote_genome.parent.glob("*.part")), "остались .part")
+    return "выгрузка, пропуск, догрузка"
+
+
+def check_jobs(hosts, work_dir):
+    """Задача в фоне: результат забирается; ошибка и пропавший процесс видны в статусе."""
+    jobs = remote_jobs.RemoteJobs(hosts.config(), jobs_file=work_dir / "jobs.json")
+    data = work_dir / "data" / "lines.txt"
+    data.parent.mkdir(exist_ok=True)
+    data.write_text("a\nb\nc\n")
+    out = work_dir / "out" / "count.txt"
+    jobs.run_job("count", f"wc -l < {jobs.remote_path(data)} > count.txt",
+                 inputs=[data], outputs={"count.txt": out}, interval=0.2)
+    check(out.read_text().strip() == "3", "выход задачи не забран")
+
+    jobs.launch("bad", "echo oops >&2; exit 3")
+    check(jobs.wait(["bad"], 0.2) == {"bad": "failed"}, "упавшая задача не в статусе failed")
+    try:
+        jobs.fetch("bad")
+    except RuntimeError as e:
+        check("oops" in str(e), "в ошибке нет конца stderr.log")
+    else:
+        raise AssertionError("fetch упавшей задачи не вызвал ошибку")
+
+    jobs.launch("long", "sleep 30")
+    check(jobs.poll(["long"]) == {"long": "running"}, "запущенная задача не в статусе running")
+    jobs.shell(f"kill {jobs.jobs['long']['pid']}")
+    time.sleep(0.3)
+    check(jobs.poll(["long"]) == {"long": "lost"}, "убитая задача не в статусе lost")
+    return "done, failed, lost"
+
+
+def check_async(hosts, work_dir):
+    """Потоковый вывод без накопления в памяти, построчный приёмник, таймаут, run_all."""
+    tunnel = connect_servers.get_tunnel(hosts.hops())
+    executor = connect_servers.AsyncExecutor(tunnel, 4)
+
+    async def scenario():
+        received = [0]
+
+        async def slow(chunk):
+            received[0] += len(chunk)
+            await asyncio.sleep(0)
+
+        res = await executor.run("for i in 1 2 3 4 5; do head -c 2000000 /dev/zero; "
+                                 "head -c 500000 /dev/zero >&2; done", stdout=slow,
+                                 stderr=str(work_dir / "err.bin"))
+        check(res["status"] == 0 and received[0] == 10_000_000, "stdout потерян при потоковом чтении")
+        check(os.path.getsize(work_dir / "err.bin") == 2_500_000, "stderr не записан в файл")
+
+        lines = []
+        await executor.run("seq 1 1000; printf tail", stdout=connect_servers.LineSink(lines.append))
+        check(len(lines) == 1001 and lines[0] == b"1" and lines[-1] == b"tail", "строки разобраны неверно")
+
+        started = time.perf_counter()
+        try:
+            await executor.run("sleep 5", timeout=0.5)
+        except TimeoutError:
+            check(time.perf_counter() - started < 3, "таймаут сработал поздно")
+        else:
+            raise AssertionError("таймаут не сработал")
+
+        results = await executor.run_all(["echo a", "echo b >&2; exit 2"], str(work_dir / "outs"))
+        check([res["status"] for res in results] == [0, 2], "коды run_all неверны")
+
+    asyncio.run(scenario())
+    return "поток, строки, таймаут, run_all"
+
+
+# Имя -> (проверка, нужен ли ей рабочий каталог). Каждая получает свою цепочку серверов
+CHECKS = {
+    "pool": (check_pool, False),
+    "reconnect": (check_reconnect, False),
+    "status-first": (check_status_first, False),
+    "half-open": (check_half_open, False),
+    "stage": (check_stage, True),
+    "jobs": (check_jobs, True),
+    "async": (check_async, True),
+}
+
+
+def run_check(name, delay=0.0):
+    function, needs_dir = CHECKS[name]
+    hosts = LocalHosts(delay=delay)
+    work_dir = Path(tempfile.mkdtemp(prefix="bio_inf_selftest_"))
+    cwd = os.getcwd()
+    try:
+        # Кэш выгрузки remote_jobs (STAGE_CACHE) пишется в текущий каталог
+        os.chdir(work_dir)
+        return function(hosts, work_dir) if needs_dir else function(hosts)
+    finally:
+        os.chdir(cwd)
+        connect_servers.close_pool()
+        hosts.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка цепочки SSH, выгрузки и задач на локальных серверах paramiko")
+    parser.add_argument("names", nargs="*", metavar="проверка", help=f"по умолчанию все: {', '.join(CHECKS)}")
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка перед каждой командой на узле, секунды")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in CHECKS]
+    if unknown:
+        parser.error(f"неизвестные проверки: {', '.join(unknown)}")
+
+    connect_servers.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+    failed = []
+    for name in args.names or CHECKS:
+        started = time.perf_counter()
+        try:
+            detail = run_check(name, args.delay)
+        except Exception as e:
+            failed.append(name)
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+            continue
+        print(f"✅ {name}: {detail} ({time.perf_counter() - started:.1f} с)")
+    if failed:
+        print(f"⚠️  Не прошли: {', '.join(failed)}")
+        return 1
+    print("🏁 Все проверки прошли")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import os
+import sys
+import time
+import atexit
+import platform
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+from checksums import write_json_atomic
+
+# Спаны этапов конвейера и внешних программ (nhmmer, makehmmerdb, mafft, mb) для отчёта
+# о том, куда ушло время прогона. Включается bio_inf.py --trace FILE или переменной
+# окружения; выключенный span() ничего не замеряет.
+
+# Путь к отчёту JSON для запуска отдельных скриптов (python run_nhmmer.py ...)
+TRACE_ENV = "BIO_INF_TRACE"
+# Каталог для .prof cProfile внешних по потоку этапов (необязательно)
+PROFILE_ENV = "BIO_INF_PROFILE"
+# Поля /proc/<pid>/io: байты с диска/на диск и все прочитанные/записанные (с каналами и сокетами)
+IO_FIELDS = ("read_bytes", "write_bytes", "rchar", "wchar")
+# ru_maxrss: в Linux килобайты, в macOS байты
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_state = {"report": None, "profile_dir": None, "pid": None, "started": None, "wall": None, "main_stack": []}
+_spans = []
+_spans_lock = threading.Lock()
+_local = threading.local()
+
+
+def read_io(pid="self"):
+    """Счётчики ввода-вывода из /proc/<pid>/io или None, если их нет (не Linux, нет прав)."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None
+    return {name: int(fields[name]) for name in IO_FIELDS if name in fields}
+
+
+def io_delta(before, after):
+    if before is None or after is None:
+        return None
+    return {name: after[name] - before[name] for name in after}
+
+
+def max_rss(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss * MAXRSS_UNIT
+
+
+def enabled():
+    return _state["report"] is not None
+
+
+def enable(report_path, profile_dir=None):
+    """Включает спаны; отчёт запишется в report_path при выходе из процесса."""
+    _state.update(report=os.fspath(report_path), profile_dir=profile_dir and os.fspath(profile_dir),
+                  pid=os.getpid(), started=time.time(), wall=time.perf_counter())
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    atexit.register(_write_at_exit)
+
+
+class TracedPopen(subprocess.Popen):
+    """
+    Popen, который собирает завершившийся процесс через wait4 и сохраняет его rusage
+    (CPU, пиковый RSS). Перед сбором зомби читается /proc/<pid>/io — потом его нет.
+    Подменяется только ожидание: wait(), poll(), communicate() и with работают как обычно.
+    Пиковый RSS в Linux не меньше RSS родителя в момент fork.
+
+    Переопределяются закрытые члены subprocess.Popen (POSIX): _try_wait(wait_flags),
+    _internal_poll, а также используются _waitpid_lock и _handle_exitstatus(status).
+    Проверено на CPython 3.11 (3.11.7); при переходе на другую версию сверить их с
+    Lib/subprocess.py — если они изменятся, wait()/poll() перестанут собирать rusage.
+    """
+    rusage = None
+    io = None
+
+    def _waitpid(self, pid, flags):
+        if hasattr(os, "waitid"):
+            # WNOWAIT: процесс остаётся зомби, и его /proc ещё можно прочитать
+            if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT | (flags & os.WNOHANG)) is None:
+                return 0, 0
+            self.io = read_io(pid)
+        reaped, status, usage = os.wait4(pid, flags)
+        if reaped:
+            self.rusage = usage
+        return reaped, status
+
+    def _try_wait(self, wait_flags):
+        # То же, что subprocess.Popen._try_wait, но через wait4
+        try:
+            return self._waitpid(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+
+    def _internal_poll(self, _deadstate=None, *args, **kwargs):
+        # poll() и __del__: неблокирующий _try_wait вместо os.waitpid (аргументы
+        # родительского метода различаются между версиями Python)
+        if self.returncode is None and self._waitpid_lock.acquire(False):
+            try:
+                if self.returncode is None:
+                    pid, status = self._try_wait(os.WNOHANG)
+                    if pid == self.pid:
+                        self._handle_exitstatus(status)
+            finally:
+                self._waitpid_lock.release()
+        return self.returncode
+
+
+class Span(dict):
+    def set(self, **attrs):
+        self.setdefault("attrs", {}).update(attrs)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        is_main = threading.current_thread() is threading.main_thread()
+        _local.stack = _state["main_stack"] if is_main else []
+    return _local.stack
+
+
+def _parent(stack):
+    # Потоки пулов запускаются изнутри этапа главного потока: он и родитель их спанов
+    if not stack and threading.current_thread() is not threading.main_thread():
+        stack = _state["main_stack"]
+    return stack[-1]["id"] if stack else None
+
+
+def _start_profile(record):
+    """cProfile для внешнего в своём потоке этапа: вложенные профили в одном потоке не работают."""
+    if not _state["profile_dir"] or getattr(_local, "profiler", None) is not None:
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: один профилировщик на процесс, этап в другом потоке уже профилируется
+        return None
+    _local.profiler = profiler
+    return profiler
+
+
+def _stop_profile(profiler, record):
+    profiler.disable()
+    _local.profiler = None
+    path = os.path.join(_state["profile_dir"], f"{record['id']:04d}-{record['name']}.prof")
+    profiler.dump_stats(path)
+    record["profile"] = path
+
+
+@contextmanager
+def span(name, kind="stage", **attrs):
+    """
+    Замер этапа: wall, CPU процесса и потока, CPU дочерних процессов, собранных за
+    это время, прирост /proc/self/io (в Linux вместе с собранными дочерними) и пиковый
+    RSS процесса на выходе. Ввод-вывод и CPU процесса общие для всех потоков, при
+    параллельных этапах они пересекаются.
+    """
+    if not enabled():
+        yield Span()
+        return
+
+    stack = _stack()
+    with _spans_lock:
+        record = Span(id=len(_spans), parent=_parent(stack), name=name, kind=kind,
+                      thread=threading.current_thread().name,
+                      start=round(time.perf_counter() - _state["wall"], 6))
+        _spans.append(record)
+    if attrs:
+        record["attrs"] = dict(attrs)
+    stack.append(record)
+    io_before = read_io()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall, cpu, thread_cpu = time.perf_counter(), time.process_time(), time.thread_time()
+    profiler = _start_profile(record) if kind == "stage" else None
+    try:
+        yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler is not None:
+            _stop_profile(profiler, record)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        record.update(
+            wall=time.perf_counter() - wall,
+            cpu=time.process_time() - cpu,
+            thread_cpu=time.thread_time() - thread_cpu,
+            children_cpu=(children.ru_utime + children.ru_stime
+                          - children_before.ru_utime - children_before.ru_stime),
+            io=io_delta(io_before, read_io()),
+            max_rss=max_rss(),
+        )
+        stack.pop()
+
+
+def _record_process(record, proc):
+    usage = proc.rusage
+    record.update(pid=proc.pid, returncode=proc.returncode)
+    if usage is not None:
+        record.update(user=usage.ru_utime, system=usage.ru_stime,
+                      child_max_rss=usage.ru_maxrss * MAXRSS_UNIT,
+                      inblock=usage.ru_inblock, oublock=usage.ru_oublock)
+    record["child_io"] = proc.io
+
+
+@contextmanager
+def popen(cmd, name=None, **kwargs):
+    """
+    TracedPopen в спане kind="process": после выхода из with процесс дожидается
+    (если вызывающий этого не сделал), его CPU, пиковый RSS и ввод-вывод — в спане.
+    """
+    with span(name or os.path.basename(str(cmd[0])), kind="process",
+              cmd=[str(arg) for arg in cmd]) as record:
+        proc = TracedPopen(cmd, **kwargs)
+        try:
+            yield proc
+        finally:
+            proc.wait()
+            if enabled():
+                _record_process(record, proc)
+
+
+def run(cmd, name=None, check=False, input=None, timeout=None, capture_output=False, **kwargs):
+    """subprocess.run в спане kind="process" (см. popen)."""
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    with popen(cmd, name, stdin=subprocess.PIPE if input is not None else kwargs.pop("stdin", None),
+               **kwargs) as proc:
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except BaseException:
+            proc.kill()
+            raise
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def summary(spans):
+    """Итоги по имени спана: число, сумма wall/CPU, CPU и максимум RSS дочерних процессов, ввод-вывод."""
+    totals = {}
+    for record in spans:
+        if "wall" not in record:
+            continue
+        total = totals.setdefault(record["name"], {"kind": record["kind"], "count": 0, "wall": 0.0, "cpu": 0.0,
+                                                   "read_bytes": 0, "write_bytes": 0, "max_rss": 0})
+        total["count"] += 1
+        total["wall"] += record["wall"]
+        if record["kind"] == "process":
+            total["cpu"] += record.get("user", 0) + record.get("system", 0)
+            total["max_rss"] = max(total["max_rss"], record.get("child_max_rss", 0))
+            io = record.get("child_io")
+        else:
+            total["cpu"] += record["cpu"]
+            total["max_rss"] = max(total["max_rss"], record["max_rss"])
+            io = record["io"]
+        if io:
+            total["read_bytes"] += io.get("rchar", 0)
+            total["write_bytes"] += io.get("wchar", 0)
+    return totals
+
+
+def report():
+    with _spans_lock:
+        spans = [dict(record) for record in _spans]
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "meta": {
+            "argv": sys.argv, "pid": os.getpid(), "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_state["started"])),
+            "wall": time.perf_counter() - _state["wall"],
+            "cpu": own.ru_utime + own.ru_stime, "children_cpu": children.ru_utime + children.ru_stime,
+            "max_rss": own.ru_maxrss * MAXRSS_UNIT, "children_max_rss": children.ru_maxrss * MAXRSS_UNIT,
+            "io": read_io(),
+        },
+        "summary": summary(spans),
+        "spans": spans,
+    }
+
+
+def print_summary(data):
+    print(f"\n⏱  Трассировка: {data['meta']['wall']:.1f} с всего")
+    rows = sorted(data["summary"].items(), key=lambda item: -item[1]["wall"])
+    for name, total in rows:
+        print(f"   {name:<20} x{total['count']:<4} {total['wall']:9.2f} с  CPU {total['cpu']:9.2f} с  "
+              f"RSS {total['max_rss'] / 1e6:8.1f} МБ  "
+              f"чтение {total['read_bytes'] / 1e6:9.1f} МБ  запись {total['write_bytes'] / 1e6:9.1f} МБ")
+
+
+def _write_at_exit():
+    # Процессы пула, унаследовавшие состояние через fork, отчёт не пишут
+    if not enabled() or os.getpid() != _state["pid"]:
+        return
+    data = report()
+    write_json_atomic(_state["report"], data)
+    print_summary(data)
+    print(f"💾 Отчёт трассировки: {_state['report']}")
+
+
+# Переменные убираются из окружения: процессы пулов (spawn) не должны писать свой отчёт поверх
+if os.environ.get(TRACE_ENV):
+    enable(os.environ.pop(TRACE_ENV), os.environ.pop(PROFILE_ENV, None))
@@ -1,44 +1,34 @@
-import json
+import argparse
+import tracing
 from pathlib import Path
-from Bio import AlignIO, SeqIO, Phylo
-from Bio.Align.Applications import MafftCommandline
-from Bio.Phylo.TreeConstruction import DistanceCalculator, DistanceTreeConstructor
-from io import StringIO
+from distances import encode, distance_array
+from neighbor_joining import nj_array
+from tree_io import write_jvp, write_newick
+from bootstrap import bootstrap_consensus
 
 def run_mafft(input_fasta: str, output_fasta: str):
     """Run MAFFT alignment and save result"""
     print(f"🔗 MAFFT выравнивание: {input_fasta}")
-    mafft_cline = MafftCommandline(input=input_fasta)
-    stdout, _ = mafft_cline()
+    # Как MafftCommandline(input=...)(), но с замером процесса
+    result = tracing.run(["mafft", input_fasta], capture_output=True, text=True, check=True)
     with open(output_fasta, "w") as f:
-        f.write(stdout)
+        f.write(result.stdout)
     print(f"✅ Сохранено выравнивание: {output_fasta}")
 
-def tree_to_jvp(tree, output_path):
-    """Convert Biopython tree to Jawline .jvp format"""
-    def traverse(clade):
-        node = {
-            "name": str(clade.name) if clade.name else "",
-            "length": clade.branch_length if clade.branch_length else 0,
-            "children": []
-        }
-        for sub in clade.clades:
-            node["children"].append(traverse(sub))
-        return node
-
-    data = {
-        "format": "jvp",
-        "tree": traverse(tree.root)
-    }
-
-    with open(output_path, "w") as f:
-        json.dump(data, f, indent=2)
+def tree_to_jvp(tree, output_path, compact=False):
+    """Convert Biopython tree to Jawline .jvp format (streamed, no recursion)"""
+    write_jvp(tree, output_path, compact)
     print(f"📁 Дерево сохранено как .jvp: {output_path}")
 
-def build_jvp_tree(input_fasta: str):
+def tree_to_newick(tree, output_path):
+    write_newick(tree, output_path)
+    print(f"📁 Дерево сохранено как Newick: {output_path}")
+
+def build_jvp_tree(input_fasta: str, compact: bool = False, bootstrap: int = 0):
     input_path = Path(input_fasta)
     aligned_path = input_path.with_name(input_path.stem + "_aligned_tmp.fa")
     jvp_path = input_path.with_suffix(".jvp")
+    newick_path = input_path.with_suffix(".nwk")
 
     if not input_path.exists():
         print(f"❌ Файл не найден: {input_path}")
@@ -48,14 +38,38 @@ def build_jvp_tree(input_fasta: str):
     run_mafft(str(input_path), str(aligned_path))
 
     # Step 2: Build tree
+    from Bio import AlignIO
+
     alignment = AlignIO.read(str(aligned_path), "fasta")
-    calculator = DistanceCalculator("identity")
-    dm = calculator.get_distance(alignment)
-    constructor = DistanceTreeConstructor()
-    tree = constructor.nj(dm)
+    # То же, что DistanceCalculator("identity") и DistanceTreeConstructor().nj, но на матрицах NumPy
+    with tracing.span("distances", taxa=len(alignment), columns=alignment.get_alignment_length()):
+        names, matrix = encode(alignment)
+        dist = distance_array(matrix, "identity")
+    with tracing.span("nj", taxa=len(names)):
+        tree = nj_array(names, dist, overwrite=True)
+
+    # Step 3: Save in JVP and Newick formats
+    with tracing.span("write_tree"):
+        tree_to_jvp(tree, jvp_path, compact)
+        tree_to_newick(tree, newick_path)
+
+    # Step 4: Bootstrap consensus with support values
+    if bootstrap:
+        with tracing.span("bootstrap", replicates=bootstrap):
+            consensus = bootstrap_consensus(alignment, bootstrap)
+            tree_to_jvp(consensus, input_path.with_suffix(".consensus.jvp"), compact)
+            tree_to_newick(consensus, input_path.with_suffix(".consensus.nwk"))
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="MAFFT и NJ-дерево в форматах .jvp и Newick")
+    parser.add_argument("input_fasta", nargs="?", default="ENSG00000225940_hits.fa")
+    parser.add_argument("--compact", action="store_true", help=".jvp одной строкой без отступов")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="N реплик bootstrap и консенсусное дерево с поддержками")
+    args = parser.parse_args(argv)
 
-    # Step 3: Save in JVP format
-    tree_to_jvp(tree, jvp_path)
+    # 🚀 Построение дерева
+    build_jvp_tree(args.input_fasta, args.compact, args.bootstrap)
 
-# 🚀 Построение дерева
-build_jvp_tree("ENSG00000225940_hits.fa")
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,153 @@
+import re
+import json
+import argparse
+
+# Как в Bio.Phylo.NewickIO: метки с пробелами, скобками, кавычками и т.п. берутся в кавычки
+UNQUOTED_LABEL = re.compile(r"[^\s\(\)\[\]\'\:\;\,]+")
+# Форматы по умолчанию у Phylo.write(..., "newick")
+BRANCH_LENGTH_FORMAT = "%1.8g"
+CONFIDENCE_FORMAT = "%1.2f"
+# Кусков текста в буфере перед записью в файл
+WRITE_BATCH = 4096
+
+ENTER, EXIT = 0, 1
+
+
+def walk(root):
+    """Обход дерева без рекурсии: (ENTER, clade) перед потомками и (EXIT, clade) после них."""
+    stack = [(EXIT, root), (ENTER, root)]
+    while stack:
+        event, clade = stack.pop()
+        yield event, clade
+        if event == ENTER:
+            for child in reversed(clade.clades):
+                stack.append((EXIT, child))
+                stack.append((ENTER, child))
+
+
+class _Output:
+    """Копит куски текста и пишет их в файл пачками — память не растёт с размером дерева."""
+
+    def __init__(self, f):
+        self.f = f
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        if len(self.parts) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.f.write("".join(self.parts))
+        self.parts = []
+
+
+def write_jvp(tree, output_path, compact=False):
+    """
+    Пишет дерево в .jvp потоком, без промежуточного словаря и рекурсии. Без compact
+    вывод совпадает с прежним json.dump(data, f, indent=2); с compact — одна строка
+    без отступов и пробелов. У узлов с confidence добавляется поле "support".
+    """
+    if compact:
+        newline, step, colon = "", "", ":"
+    else:
+        newline, step, colon = "\n", "  ", ": "
+
+    def indent(level):
+        return newline + step * level
+
+    # Сколько потомков уже записано у каждого открытого внутреннего узла
+    written = []
+    with open(output_path, "w") as f:
+        out = _Output(f)
+        out.write(f'{{{indent(1)}"format"{colon}"jvp",{indent(1)}"tree"{colon}')
+        for event, clade in walk(tree.root):
+            if event == ENTER:
+                level = 2 + 2 * len(written)
+                if written:
+                    if written[-1]:
+                        out.write(",")
+                    written[-1] += 1
+                    out.write(indent(level - 1))
+                name = json.dumps(str(clade.name) if clade.name else "")
+                length = json.dumps(clade.branch_length if clade.branch_length else 0)
+                out.write(f'{{{indent(level)}"name"{colon}{name},'
+                          f'{indent(level)}"length"{colon}{length},')
+                # Поддержка (bootstrap) — только у узлов, где она есть
+                if getattr(clade, "confidence", None) is not None:
+                    out.write(f'{indent(level)}"support"{colon}{json.dumps(clade.confidence)},')
+                out.write(f'{indent(level)}"children"{colon}')
+                if clade.clades:
+                    out.write("[")
+                    written.append(0)
+                else:
+                    out.write("[]")
+            else:
+                if clade.clades:
+                    written.pop()
+                    out.write(indent(2 + 2 * len(written)) + "]")
+                out.write(indent(1 + 2 * len(written)) + "}")
+        out.write(indent(0) + "}")
+        out.flush()
+    return output_path
+
+
+def newick_label(clade):
+    label = clade.name or ""
+    if label:
+        match = UNQUOTED_LABEL.match(label)
+        if not match or match.end() < len(label):
+            label = "'%s'" % label.replace("'", "''")
+    return label
+
+
+def write_newick(tree, output_path, branch_length_format=BRANCH_LENGTH_FORMAT,
+                 confidence_format=CONFIDENCE_FORMAT):
+    """
+    Пишет дерево в Newick тем же обходом, что и write_jvp. Для деревьев без комментариев
+    вывод совпадает с Phylo.write(tree, path, "newick"): поддержка (confidence)
+    внутреннего узла пишется после его имени.
+    """
+    written = []
+    with open(output_path, "w") as f:
+        out = _Output(f)
+        for event, clade in walk(tree.root):
+            if event == ENTER:
+                if written:
+                    if written[-1]:
+                        out.write(",")
+                    written[-1] += 1
+                if clade.clades:
+                    out.write("(")
+                    written.append(0)
+                continue
+
+            length = clade.branch_length or 0.0
+            if clade.clades:
+                written.pop()
+                out.write(")")
+            if clade.clades and getattr(clade, "confidence", None) is not None:
+                info = (confidence_format + ":" + branch_length_format) % (clade.confidence, length)
+            else:
+                info = (":" + branch_length_format) % length
+            out.write(newick_label(clade) + info)
+        out.write(";\n")
+        out.flush()
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перевод дерева в .jvp или Newick без рекурсии")
+    parser.add_argument("tree", help="входное дерево (любой формат Bio.Phylo)")
+    parser.add_argument("output", help="выход: .jvp или .nwk/.newick/.tre")
+    parser.add_argument("--format", default="newick", help="формат входного дерева для Phylo.read")
+    parser.add_argument("--compact", action="store_true", help=".jvp одной строкой без отступов")
+    args = parser.parse_args()
+
+    from Bio import Phylo
+    tree = Phylo.read(args.tree, args.format)
+    if args.output.endswith(".jvp"):
+        write_jvp(tree, args.output, args.compact)
+    else:
+        write_newick(tree, args.output)
+    print(f"📁 Дерево сохранено: {args.output}")